@@ -0,0 +1,105 @@
+from collections import deque
+from time import strftime
+from typing import Optional
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, QVariant, QTimer
+from PyQt5.QtGui import QFont
+
+from Constants import Constants
+
+
+#
+#   Model behind the session console's message list.  Only the most recent lines are kept, in a
+#   fixed-size ring buffer, so a session running all night uses the same memory and repaints the
+#   same few visible rows as a short one.  Lines arriving from the session thread are collected
+#   and added to the list together on a short timer, so a burst of messages is one update to the
+#   view instead of one per line.
+#
+#   The list can be limited to messages at or above a given level of detail (indentation level
+#   1 is the session and work items, 2 the frames, 3 and up the details of each frame).
+#
+
+class ConsoleLogModel(QAbstractListModel):
+    LEVEL_ROLE = Qt.UserRole  # The indentation level of a line
+
+    def __init__(self, font_size: int, capacity: int = Constants.CONSOLE_MAX_LINES):
+        QAbstractListModel.__init__(self)
+        self._capacity: int = capacity
+        # All recent lines, and those shown given the level limit, as (text, level)
+        self._lines: deque = deque(maxlen=capacity)
+        self._visible: deque = deque(maxlen=capacity)
+        self._maximum_level: Optional[int] = None
+        self._pending: [(str, int)] = []
+        self._font = QFont()
+        self._font.setPointSize(font_size)
+        self._batch_timer = QTimer(self)
+        self._batch_timer.setSingleShot(True)
+        self._batch_timer.setInterval(Constants.CONSOLE_BATCH_INTERVAL_MS)
+        self._batch_timer.timeout.connect(self.add_pending_lines)
+
+    # Methods required by the parent abstract data model
+
+    # noinspection PyMethodOverriding
+    def rowCount(self, parent_model_index: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent_model_index.isValid() else len(self._visible)
+
+    # noinspection PyMethodOverriding
+    def data(self, index: QModelIndex, role: Qt.DisplayRole):
+        row_index: int = index.row()
+        if not index.isValid() or row_index >= len(self._visible):
+            return QVariant()
+        (text, level) = self._visible[row_index]
+        if role == Qt.DisplayRole:
+            result = text
+        elif role == Qt.FontRole:
+            result = self._font
+        elif role == ConsoleLogModel.LEVEL_ROLE:
+            result = level
+        else:
+            result = QVariant()
+        return result
+
+    # Add a line.  It is time-stamped and indented now, and shown with the next batch.
+
+    def append(self, message: str, level: int):
+        """Queue a line to be added to the console"""
+        indent_string = ""
+        if level > 1:
+            indentation_block = " " * Constants.SESSION_CONSOLE_INDENTATION_DEPTH
+            indent_string = indentation_block * (level - 1)
+        self._pending.append((strftime("%H:%M:%S ") + " " + indent_string + message, level))
+        if not self._batch_timer.isActive():
+            self._batch_timer.start()
+
+    # Add the waiting lines to the list, dropping the oldest lines if the buffer is full
+
+    def add_pending_lines(self):
+        """Add the lines received since the last batch to the console"""
+        (pending, self._pending) = (self._pending, [])
+        self._lines.extend(pending)
+        new_visible = [line for line in pending if self.is_shown(line[1])][-self._capacity:]
+        if not new_visible:
+            return
+        overflow = len(self._visible) + len(new_visible) - self._capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self._visible.popleft()
+            self.endRemoveRows()
+        first_row = len(self._visible)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(new_visible) - 1)
+        self._visible.extend(new_visible)
+        self.endInsertRows()
+
+    # Limit the lines shown to those at or above the given level of detail (None for all)
+
+    def set_maximum_level(self, maximum_level: Optional[int]):
+        """Show only lines with at most the given indentation level"""
+        self.add_pending_lines()
+        self.beginResetModel()
+        self._maximum_level = maximum_level
+        self._visible = deque((line for line in self._lines if self.is_shown(line[1])), maxlen=self._capacity)
+        self.endResetModel()
+
+    def is_shown(self, level: int) -> bool:
+        return self._maximum_level is None or level <= self._maximum_level
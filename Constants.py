@@ -2,11 +2,12 @@ class Constants:
     UNSAVED_WINDOW_TITLE = "(Unsaved Document)"
     SAVED_FILE_EXTENSION = ".ewho3"
     RESET_FONT_SIZE = 12
-    MAIN_TITLE_LABEL_PREFIX = "MainTitle_"
-    SUBTITLE_LABEL_PREFIX = "Subtitle_"
     MAIN_TITLE_FONT_SIZE_INCREMENT = 6
     SUBTITLE_FONT_SIZE_INCREMENT = 3
     SESSION_CONSOLE_INDENTATION_DEPTH = 3
+    CONSOLE_MAX_LINES = 5000            # Session console keeps only this many most recent lines
+    CONSOLE_BATCH_INTERVAL_MS = 100     # Lines arriving within this time are added to the console together
+    CONSOLE_DETAIL_LEVELS = (None, 2, 1)    # Deepest level shown for each console detail choice; None for all
     DELAY_AT_FINISH = 2  # Wait these seconds at end for output to appear on UI
     CANCELLABLE_WAIT_INCREMENTS = 0.5  # Wait in this many-second increments
     CAMERA_RESYNCH_TIMEOUT = 120  # Two minutes wait for camera to catch up should be plenty
@@ -15,3 +16,62 @@ class Constants:
     LOCAL_PATH_NOT_SET = "(not set)"
     SLEW_DONE_POLLING_INTERVAL = 0.5    # Check if slew done at this frequency (seconds)
     SLEW_MAXIMUM_WAIT = 3 * 60      # Don't wait any longer than this for a slew
+    DITHER_SLEW_SETTLE_SECONDS = 2.0    # Estimated fixed cost (acceleration, settling) of a dither move
+    DITHER_SLEW_DEGREES_PER_SECOND = 2.0    # Estimated mount speed for small dither moves
+    DITHER_PLAN_MAX_IMPROVEMENT_PASSES = 50     # Limit on route-improvement passes when planning dithers
+    DITHER_PLAN_IMPROVEMENT_EPSILON = 1e-12     # Ignore route improvements smaller than this (radians)
+    DEFAULT_DITHER_PATTERN = "Rings"    # DitherPlanner's default pattern, here so preferences needn't load it
+    SLEW_MODEL_MAX_SAMPLES = 200     # Keep this many recent slew observations for the slew-time model
+    SLEW_MODEL_MIN_SAMPLES = 3      # Need at least this many observations before fitting the model
+    SLEW_MODEL_EARLIEST_POLL_FRACTION = 0.8     # Start polling for slew completion at this part of predicted time
+    FRAME_STATISTICS_SAMPLE_STRIDE = 4     # Frame statistics sample every n'th pixel of every n'th row
+    SATURATED_ADU_LEVEL = 65000     # Pixels at or above this ADU value are considered saturated
+    MAX_SATURATED_FRACTION = 0.001      # Reject flats with more than this fraction of saturated pixels
+    MAX_MEDIAN_MEAN_DIFFERENCE = 0.10   # Reject flats whose median and mean differ by more than this fraction
+    LOCAL_ANALYSIS_BAND_ROWS = 256      # Locally-saved frames are analyzed this many rows at a time
+    CLIPPED_MEAN_SIGMA = 3.0            # Clipped mean ignores pixels more than this many sd's from the mean
+    CLIPPED_MEAN_ITERATIONS = 5         # Maximum clipping passes for the clipped mean
+    CANDIDATE_FRAME_PREFIX = "candidate-"   # Local frames are saved with this prefix until accepted
+    MASTER_FLAT_DIRECTORY = "masters"   # Master flats go in this subdirectory of the local save directory
+    MASTER_FLAT_MAX_WORKERS = 2         # Processes combining master flat tiles in the background
+    MASTER_FLAT_TILE_BYTES = 64 * 1024 * 1024   # Memory for combining one tile of a master, per worker process
+    MASTER_FLAT_CLIP_SIGMA = 3.0        # Master flat ignores pixel values this many sd's from the median
+    RUNNING_STATISTICS_CHECKPOINT_INTERVAL = 8  # Checkpoint per-pixel running statistics every n frames
+    RUNNING_STATISTICS_CHECKPOINT_SUFFIX = "-running-statistics.npz"
+    UNIFORMITY_SAMPLE_STRIDE = 4        # Illumination check samples every n'th pixel of every n'th row
+    UNIFORMITY_GRID_SIZE = 8            # Illumination check compares medians of an n x n grid of tiles
+    UNIFORMITY_RADIAL_RINGS = 8         # Illumination check compares mean levels in this many rings
+    UNIFORMITY_REFERENCE_FRAMES = 3     # Illumination check starts once this many frames have been accepted
+    UNIFORMITY_REFERENCE_WINDOW = 5     # Illumination reference is the median of this many latest accepted frames
+    UNIFORMITY_MAX_TILE_DIFFERENCE = 0.03       # Reject if a tile's relative level differs by this much
+    UNIFORMITY_MAX_RADIAL_DIFFERENCE = 0.02     # Reject if a ring's relative level differs by this much
+    UNIFORMITY_MAX_GRADIENT_DIFFERENCE = 0.01   # Reject if a side-to-side gradient differs by this much
+    COMPRESSION_MAX_WORKERS = 2         # Processes compressing saved frames in the background
+    SAVE_WATCHER_QUEUE_SIZE = 64        # Newly saved frames waiting for the processing stages
+    SAVE_WATCHER_POLL_INTERVAL = 0.5    # Seconds between looks at the save folder (or stop checks)
+    THUMBNAIL_DIRECTORY = "thumbnails"  # Preview thumbnail cache, in the program's data directory
+    THUMBNAIL_SIZE = 256                # Preview thumbnails are at most this many pixels across
+    THUMBNAIL_CACHE_ENTRIES = 500       # Keep this many recently-used thumbnails on disk
+    THUMBNAIL_STRETCH_PERCENTILE = 0.5  # Preview brightness spans these percentiles of the frame
+    SIMULATED_SENSOR_WIDTH = 4096       # Size, unbinned, of the frames made when simulating the camera
+    SIMULATED_SENSOR_HEIGHT = 3072
+    SIMULATED_FRAME_SEED = 2020         # Random seed fixing the simulated dust and column pattern
+    SIMULATED_VIGNETTING = 0.12         # Strength of the simulated fall-off toward the corners
+    SIMULATED_DUST_MOTES = 6            # Number of dust shadows in simulated frames
+    SIMULATED_BIAS_LEVEL = 1000         # Simulated bias offset, ADUs
+    SIMULATED_COLUMN_NOISE = 2.0        # Standard deviation of the simulated fixed column pattern, ADUs
+    SIMULATED_GAIN = 1.5                # Simulated camera gain, electrons per ADU
+    SIMULATED_READ_NOISE = 8.0          # Simulated read noise, electrons
+    SIMULATED_FRAMES_DIRECTORY = "simulated-frames"     # Simulated "autosave" folder, in program's data folder
+    FRAME_CATALOG_FILE = "FrameCatalog.sqlite"  # Catalog of captured frames, in program's data folder
+    EXPOSURE_HISTORY_FILE = "ExposureHistory.dat"   # History of exposures measured, in program's data folder
+    EXPOSURE_HISTORY_SESSIONS = 10      # Starting exposure is estimated from this many most recent sessions
+    EXPOSURE_HISTORY_HALF_LIFE = 2.0    # Sessions this many sessions old count half as much as the latest
+    EXPOSURE_HISTORY_FIT_FRAMES = 3     # Fit a session's bias and brightness only from at least this many frames
+    EXPOSURE_HISTORY_FIT_SPREAD = 1.5   # ... whose longest exposure is at least this times the shortest
+    SESSION_LOG_DIRECTORY = "session-logs"  # Structured session logs, in program's data folder
+    TELEMETRY_SAMPLE_INTERVAL = 30.0    # Seconds between samples of camera and mount telemetry
+    TELEMETRY_BUFFER_SIZE = 1024        # Most recent telemetry samples kept
+    SPAN_TRACING = False                # Time the phases of sessions, saved as Chrome trace files
+    SPAN_TRACE_BUFFER_SIZE = 65536      # Most recent spans kept when tracing
+    EXPOSURE_TABLE_FLUSH_DELAY = 30.0   # Seconds after the first unsaved exposure table change before it is saved
@@ -0,0 +1,99 @@
+#
+#   Compare the dither patterns available in DitherPlanner, for a given number of frames,
+#   on how evenly they cover the dither area and how much slewing they cost.
+#
+#   Coverage is measured against a fine grid of sample points over the dither disc:
+#       Coverage gap    The largest distance from any sample point to its nearest dither
+#                       position (the "covering radius"), as a fraction of the maximum radius.
+#                       Smaller means no part of the disc is left far from a frame.
+#       Uniformity CV   Each dither position "owns" the sample points closest to it.  This is the
+#                       coefficient of variation of those owned areas.  Zero would be perfectly
+#                       even spacing; larger means some frames are crowded and others isolated.
+#   Slew cost is reported for the path as generated and after DitherPlanner's ordering,
+#   both as total distance moved and as estimated slewing time.
+#
+#   Run from the command line, e.g.
+#       python DitherPatternBenchmark.py --frames 32 --radius 1 --max-radius 10
+#
+import argparse
+import math
+
+import numpy
+
+from DitherPlanner import DitherPlanner
+
+
+class DitherPatternBenchmark:
+    SAMPLES_ACROSS = 201  # Resolution of the coverage sample grid
+
+    def __init__(self, frame_count: int, dither_radius_as: float, max_radius_as: float):
+        self._frame_count = frame_count
+        self._dither_radius_as = dither_radius_as
+        self._max_radius_as = max_radius_as
+        self._max_radius_rad = math.radians(max_radius_as / (60.0 * 60.0))
+        self._samples = self.disc_samples()
+
+    # Grid of sample points covering the disc of the maximum radius
+    def disc_samples(self) -> numpy.ndarray:
+        """Generate a grid of sample points inside the dither disc"""
+        across = numpy.linspace(-self._max_radius_rad, self._max_radius_rad, self.SAMPLES_ACROSS)
+        grid_x, grid_y = numpy.meshgrid(across, across)
+        inside = numpy.hypot(grid_x, grid_y) <= self._max_radius_rad
+        return numpy.column_stack((grid_x[inside], grid_y[inside]))
+
+    def coverage(self, points: numpy.ndarray) -> (float, float):
+        """Return coverage gap (fraction of max radius) and uniformity CV for the given points"""
+        differences = self._samples[:, numpy.newaxis, :] - points[numpy.newaxis, :, :]
+        distances = numpy.hypot(differences[..., 0], differences[..., 1])
+        nearest = numpy.argmin(distances, axis=1)
+        gap = float(distances[numpy.arange(len(nearest)), nearest].max()) / self._max_radius_rad
+        owned_areas = numpy.bincount(nearest, minlength=len(points)).astype(float)
+        uniformity_cv = float(owned_areas.std() / owned_areas.mean())
+        return gap, uniformity_cv
+
+    @staticmethod
+    def path_distance(points: numpy.ndarray) -> float:
+        """Total distance, in radians, moving through the points in the given order"""
+        if len(points) < 2:
+            return 0.0
+        steps = numpy.diff(points, axis=0)
+        return float(numpy.hypot(steps[:, 0], steps[:, 1]).sum())
+
+    def measure(self, pattern: str) -> {str: float}:
+        """Measure coverage and slewing cost of one pattern"""
+        planner = DitherPlanner(self._dither_radius_as, self._max_radius_as, pattern)
+        generated = planner.pattern_offsets(self._frame_count)
+        planner.plan(self._frame_count)
+        (gap, uniformity_cv) = self.coverage(generated)
+        arc_seconds_per_radian = math.degrees(1.0) * 60.0 * 60.0
+        return {"pattern": pattern,
+                "gap": gap,
+                "uniformity_cv": uniformity_cv,
+                "generated_distance_as": self.path_distance(generated) * arc_seconds_per_radian,
+                "planned_distance_as": planner.total_slew_distance() * arc_seconds_per_radian,
+                "planned_slew_seconds": planner.expected_slew_seconds()}
+
+    def run(self) -> [{str: float}]:
+        """Measure every available pattern"""
+        return [self.measure(pattern) for pattern in DitherPlanner.PATTERN_NAMES]
+
+    def report(self, results: [{str: float}]) -> str:
+        """Format the measurements as a text table"""
+        lines = [f"{self._frame_count} frames, radius {self._dither_radius_as}'', "
+                 + f"max radius {self._max_radius_as}''",
+                 f"{'Pattern':<15}{'Gap':>8}{'Unif CV':>9}{'Generated':>12}{'Planned':>11}{'Slew s':>9}"]
+        for result in results:
+            lines.append(f"{result['pattern']:<15}{result['gap']:>8.3f}{result['uniformity_cv']:>9.3f}"
+                         + f"{result['generated_distance_as']:>11.1f}''{result['planned_distance_as']:>10.1f}''"
+                         + f"{result['planned_slew_seconds']:>9.1f}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dither patterns on coverage and slewing cost")
+    parser.add_argument("--frames", type=int, default=32, help="Number of frames in the set")
+    parser.add_argument("--radius", type=float, default=1.0, help="Dither radius, arc seconds")
+    parser.add_argument("--max-radius", type=float, default=10.0, help="Maximum dither radius, arc seconds")
+    arguments = parser.parse_args()
+    benchmark = DitherPatternBenchmark(arguments.frames, arguments.radius, arguments.max_radius)
+    print(benchmark.report(benchmark.run()))
@@ -0,0 +1,304 @@
+#
+#   Plan the complete set of dither positions for a work item in advance, and order
+#   them so the mount does as little slewing as possible.
+#
+#   The Ditherer calculates one offset per frame from its running ring state, visiting each
+#   ring in angular order and then jumping outward to the next ring.  Since we know in advance
+#   how many frames a work item will take, we can instead generate all of the offsets at once
+#   and re-order them so each move is to a nearby point:
+#       - A nearest-neighbour tour, starting from the on-target first frame, gives a good route
+#       - "2-opt" improvement then reverses sections of the route as long as that shortens it
+#   The first point is always the target centre (the un-dithered first frame) and stays first.
+#
+#   Several point patterns are available.  All put the first frame on the target centre:
+#       Rings           The original Ditherer concentric rings (8, 16, 32... points per ring)
+#       Golden Spiral   Sunflower (Vogel) spiral, each point rotated by the golden angle
+#       Halton          Halton low-discrepancy sequence (bases 2 and 3) mapped into the disc
+#       Sobol           Two-dimensional Sobol low-discrepancy sequence mapped into the disc
+#       Jittered Grid   A square grid clipped to the disc, with each point randomly nudged
+#   The non-ring patterns spread the frames over the full disc of the maximum radius, so a set
+#   of any size covers the area evenly instead of stopping part way through a ring.
+#
+#   As in the Ditherer, offsets are (x, y) pairs in radians around a zero reference.
+#   Offsets are on-sky distances, so the path is ordered directly on them.  If the planner
+#   knows the alt-az centre, slew distances are measured as great circles between the actual
+#   alt-az targets the offsets produce (see SkyGeometry).
+#
+import math
+
+from typing import Optional, TYPE_CHECKING
+
+import numpy
+
+from Constants import Constants
+from SkyGeometry import SkyGeometry
+
+if TYPE_CHECKING:
+    # Only for annotations: SlewTimeModel depends on Preferences, which depends on us
+    from SlewTimeModel import SlewTimeModel
+
+
+class DitherPlanner:
+    PATTERN_RINGS = Constants.DEFAULT_DITHER_PATTERN
+    PATTERN_GOLDEN_SPIRAL = "Golden Spiral"
+    PATTERN_HALTON = "Halton"
+    PATTERN_SOBOL = "Sobol"
+    PATTERN_JITTERED_GRID = "Jittered Grid"
+    PATTERN_NAMES: [str] = (PATTERN_RINGS, PATTERN_GOLDEN_SPIRAL, PATTERN_HALTON,
+                            PATTERN_SOBOL, PATTERN_JITTERED_GRID)
+
+    GOLDEN_ANGLE = math.pi * (3.0 - math.sqrt(5.0))
+    JITTER_SEED = 1     # Fixed so a given plan is repeatable
+
+    # Create with the dither spacing and maximum radius (both arc seconds) and the pattern to use,
+    # optionally with the alt-az location (degrees) that is the centre of the dithering, and a
+    # learned slew-time model to estimate slewing time (otherwise Constants' defaults are used)
+    def __init__(self, dither_radius_as: float, max_radius_as: float, pattern: str = PATTERN_RINGS,
+                 centre_alt_deg: Optional[float] = None, centre_az_deg: Optional[float] = None,
+                 slew_time_model: Optional["SlewTimeModel"] = None):
+        self._dither_radius_rad: float = math.radians(dither_radius_as / (60.0 * 60.0))
+        self._max_radius_rad: float = math.radians(max_radius_as / (60.0 * 60.0))
+        self._pattern: str = pattern if pattern in self.PATTERN_NAMES else self.PATTERN_RINGS
+        self._centre_alt_deg: Optional[float] = centre_alt_deg
+        self._centre_az_deg: Optional[float] = centre_az_deg
+        self._slew_time_model: Optional["SlewTimeModel"] = slew_time_model
+        self._path: numpy.ndarray = numpy.zeros((0, 2))
+
+    def get_pattern(self) -> str:
+        return self._pattern
+
+    # Compute the offsets for the given number of frames, then order them into a short path.
+    # Return the ordered path as an array of (x, y) radian offsets, one row per frame
+
+    def plan(self, frame_count: int) -> numpy.ndarray:
+        """Precompute and order the dither offsets for a set of the given number of frames"""
+        offsets = self.pattern_offsets(frame_count)
+        order = self.nearest_neighbour_order(offsets)
+        order = self.two_opt_improve(offsets, order)
+        self._path = offsets[order]
+        return self._path
+
+    def get_path(self) -> numpy.ndarray:
+        return self._path
+
+    # Generate the unordered offsets for our pattern
+
+    def pattern_offsets(self, frame_count: int) -> numpy.ndarray:
+        """Generate the dither offsets, in radians, of the selected pattern for the given number of frames"""
+        if self._pattern == self.PATTERN_GOLDEN_SPIRAL:
+            return self.golden_spiral_offsets(frame_count)
+        elif self._pattern == self.PATTERN_HALTON:
+            return self.halton_offsets(frame_count)
+        elif self._pattern == self.PATTERN_SOBOL:
+            return self.sobol_offsets(frame_count)
+        elif self._pattern == self.PATTERN_JITTERED_GRID:
+            return self.jittered_grid_offsets(frame_count)
+        else:
+            return self.ring_offsets(frame_count)
+
+    # Generate the same concentric-ring pattern the Ditherer uses: centre first, then 8 points
+    # at one radius, 16 at two radii, 32 at three, and so on, restarting at the first ring if
+    # the maximum radius would be exceeded.  Each ring is generated as a single vector operation.
+
+    def ring_offsets(self, frame_count: int) -> numpy.ndarray:
+        """Generate the ring-pattern dither offsets, in radians, for the given number of frames"""
+        rings = [numpy.zeros((1, 2))]
+        generated = 1
+        ring_number = 1
+        steps = 8
+        while generated < frame_count:
+            radius = ring_number * self._dither_radius_rad
+            if ring_number > 1 and radius > self._max_radius_rad:
+                # Circle would exceed the maximum.  Start again from the first ring
+                ring_number = 1
+                steps = 8
+                radius = self._dither_radius_rad
+            angles = numpy.arange(steps) * (2.0 * math.pi / steps)
+            rings.append(numpy.column_stack((numpy.cos(angles) * radius, numpy.sin(angles) * radius)))
+            generated += steps
+            ring_number += 1
+            steps *= 2
+        return numpy.concatenate(rings)[:max(frame_count, 0)]
+
+    # Sunflower spiral: point k at radius proportional to sqrt(k), rotated by the golden angle.
+    # This gives equal area per point, so the points are evenly spread over the disc.
+
+    def golden_spiral_offsets(self, frame_count: int) -> numpy.ndarray:
+        """Generate golden-angle spiral dither offsets filling the maximum-radius disc"""
+        if frame_count <= 1:
+            return numpy.zeros((max(frame_count, 0), 2))
+        k = numpy.arange(frame_count)
+        radii = self._max_radius_rad * numpy.sqrt(k / (frame_count - 1))
+        angles = k * self.GOLDEN_ANGLE
+        return numpy.column_stack((numpy.cos(angles) * radii, numpy.sin(angles) * radii))
+
+    # Map points in the unit square onto the disc with an area-preserving transform,
+    # and put the target centre in front of them
+
+    def square_to_disc(self, unit_points: numpy.ndarray) -> numpy.ndarray:
+        """Map (u, v) points in the unit square to offsets in the maximum-radius disc, centre first"""
+        radii = self._max_radius_rad * numpy.sqrt(unit_points[:, 0])
+        angles = 2.0 * math.pi * unit_points[:, 1]
+        disc = numpy.column_stack((numpy.cos(angles) * radii, numpy.sin(angles) * radii))
+        return numpy.concatenate((numpy.zeros((1, 2)), disc))
+
+    @staticmethod
+    def radical_inverse(indices: numpy.ndarray, base: int) -> numpy.ndarray:
+        """Van der Corput radical inverse of each index in the given base"""
+        result = numpy.zeros(len(indices))
+        remaining = indices.astype(numpy.int64)
+        scale = 1.0 / base
+        while numpy.any(remaining > 0):
+            result += (remaining % base) * scale
+            remaining //= base
+            scale /= base
+        return result
+
+    def halton_offsets(self, frame_count: int) -> numpy.ndarray:
+        """Generate Halton-sequence dither offsets filling the maximum-radius disc"""
+        if frame_count <= 1:
+            return numpy.zeros((max(frame_count, 0), 2))
+        indices = numpy.arange(1, frame_count)
+        unit_points = numpy.column_stack((self.radical_inverse(indices, 2), self.radical_inverse(indices, 3)))
+        return self.square_to_disc(unit_points)
+
+    # Two-dimensional Sobol sequence.  The first dimension uses direction numbers 2^(32-j)
+    # (equivalent to the base-2 radical inverse); the second uses the primitive polynomial x + 1,
+    # whose direction numbers are v(j) = v(j-1) xor (v(j-1) >> 1).  Points are generated with
+    # the Gray-code ordering, each one a single xor from the previous.
+
+    SOBOL_BITS = 32
+
+    def sobol_offsets(self, frame_count: int) -> numpy.ndarray:
+        """Generate Sobol-sequence dither offsets filling the maximum-radius disc"""
+        if frame_count <= 1:
+            return numpy.zeros((max(frame_count, 0), 2))
+        bits = self.SOBOL_BITS
+        first_directions = [1 << (bits - 1 - j) for j in range(bits)]
+        second_directions = [1 << (bits - 1)]
+        for _ in range(1, bits):
+            previous = second_directions[-1]
+            second_directions.append(previous ^ (previous >> 1))
+        x = 0
+        y = 0
+        unit_points = numpy.empty((frame_count - 1, 2))
+        for index in range(1, frame_count):
+            # Lowest zero bit of index-1 selects the direction number to apply
+            changed_bit = ((index - 1) ^ index).bit_length() - 1
+            x ^= first_directions[changed_bit]
+            y ^= second_directions[changed_bit]
+            unit_points[index - 1] = (x / float(1 << bits), y / float(1 << bits))
+        return self.square_to_disc(unit_points)
+
+    # A square grid covering the disc with about the right number of points inside it,
+    # each point moved randomly within its own cell so the pattern doesn't repeat exactly
+
+    def jittered_grid_offsets(self, frame_count: int) -> numpy.ndarray:
+        """Generate jittered-grid dither offsets filling the maximum-radius disc"""
+        if frame_count <= 1:
+            return numpy.zeros((max(frame_count, 0), 2))
+        wanted = frame_count - 1
+        # Cell size so that the disc area holds about the wanted number of cells
+        cell = self._max_radius_rad * math.sqrt(math.pi / wanted)
+        cells_across = int(math.ceil(2.0 * self._max_radius_rad / cell)) + 1
+        centres = (numpy.arange(cells_across) - (cells_across - 1) / 2.0) * cell
+        grid_x, grid_y = numpy.meshgrid(centres, centres)
+        grid = numpy.column_stack((grid_x.ravel(), grid_y.ravel()))
+        # Keep the cells nearest the centre (excluding the centre point itself, already frame 1)
+        grid_radii = numpy.hypot(grid[:, 0], grid[:, 1])
+        keep = numpy.argsort(grid_radii, kind="stable")
+        keep = keep[grid_radii[keep] > cell * 0.25][:wanted]
+        generator = numpy.random.default_rng(self.JITTER_SEED)
+        jitter = generator.uniform(-0.5, 0.5, size=(len(keep), 2)) * cell
+        points = grid[keep] + jitter
+        return numpy.concatenate((numpy.zeros((1, 2)), points))
+
+    # Calculate the full matrix of distances between every pair of points
+
+    @staticmethod
+    def distance_matrix(points: numpy.ndarray) -> numpy.ndarray:
+        """Distance between every pair of the given points"""
+        differences = points[:, numpy.newaxis, :] - points[numpy.newaxis, :, :]
+        return numpy.hypot(differences[..., 0], differences[..., 1])
+
+    # Build a route starting at the first point, always moving next to the closest unvisited point
+
+    def nearest_neighbour_order(self, points: numpy.ndarray) -> numpy.ndarray:
+        """Order the points by a nearest-neighbour walk starting from the first"""
+        count = len(points)
+        if count < 3:
+            return numpy.arange(count)
+        distances = self.distance_matrix(points)
+        visited = numpy.zeros(count, dtype=bool)
+        order = numpy.empty(count, dtype=int)
+        current = 0
+        for position in range(count):
+            order[position] = current
+            visited[current] = True
+            if position < count - 1:
+                candidate_distances = numpy.where(visited, numpy.inf, distances[current])
+                current = int(numpy.argmin(candidate_distances))
+        return order
+
+    # Improve a route by repeatedly reversing any section whose reversal makes the route shorter.
+    # The route is open (we don't return to the start) and its first point is fixed.
+    # For each section start, all possible section ends are evaluated at once.
+
+    def two_opt_improve(self, points: numpy.ndarray, order: numpy.ndarray) -> numpy.ndarray:
+        """Shorten the given route through the points with 2-opt segment reversals"""
+        count = len(order)
+        if count < 4:
+            return order
+        distances = self.distance_matrix(points)
+        route = order.copy()
+        for _ in range(Constants.DITHER_PLAN_MAX_IMPROVEMENT_PASSES):
+            improved = False
+            for i in range(count - 2):
+                a = route[i]
+                b = route[i + 1]
+                # Candidate section ends j in i+1 .. count-1; reversing route[i+1..j]
+                c = route[i + 2:]
+                d = numpy.append(route[i + 3:], -1)
+                removed = distances[a, b] + numpy.where(d >= 0, distances[c, d], 0.0)
+                added = distances[a, c] + numpy.where(d >= 0, distances[b, d], 0.0)
+                gains = removed - added
+                best = int(numpy.argmax(gains))
+                if gains[best] > Constants.DITHER_PLAN_IMPROVEMENT_EPSILON:
+                    j = i + 2 + best
+                    route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+                    improved = True
+            if not improved:
+                break
+        return route
+
+    # Statistics about the planned path
+
+    def target_path(self) -> numpy.ndarray:
+        """The planned path as (alt, az) targets in degrees.  Requires a known centre"""
+        assert self._centre_alt_deg is not None and self._centre_az_deg is not None
+        (alts, azs) = SkyGeometry.offset_alt_az(self._centre_alt_deg, self._centre_az_deg,
+                                                self._path[:, 0], self._path[:, 1])
+        return numpy.column_stack((alts, azs))
+
+    def step_distances(self) -> numpy.ndarray:
+        """Angular distance, in radians, of each move along the planned path"""
+        if len(self._path) < 2:
+            return numpy.zeros(0)
+        if self._centre_alt_deg is None or self._centre_az_deg is None:
+            steps = numpy.diff(self._path, axis=0)
+            return numpy.hypot(steps[:, 0], steps[:, 1])
+        targets = self.target_path()
+        return SkyGeometry.angular_separation(targets[:-1, 0], targets[:-1, 1],
+                                              targets[1:, 0], targets[1:, 1])
+
+    def total_slew_distance(self) -> float:
+        """Total angular distance, in radians, moved along the planned path"""
+        return float(self.step_distances().sum())
+
+    def expected_slew_seconds(self) -> float:
+        """Estimated time the mount will spend on the dither moves along the planned path"""
+        step_degrees = numpy.degrees(self.step_distances())
+        if self._slew_time_model is not None:
+            return float(numpy.sum(self._slew_time_model.predict_seconds(step_degrees)))
+        return float(len(step_degrees) * Constants.DITHER_SLEW_SETTLE_SECONDS
+                     + step_degrees.sum() / Constants.DITHER_SLEW_DEGREES_PER_SECOND)
@@ -15,10 +15,21 @@
 # the "DitherProTrack" script written by Richard S. Wright Jr of Software Bisque
 #
 # All the dithering calculations are performed around a reference point of zero,
-# and calculated in radians. The radian value is converted to degrees and added to the
-# original target location to produce the usable outputs.
+# and calculated in radians. The radian offset is then applied to the original target
+# location as a great-circle move on the sky (see SkyGeometry) to produce the usable outputs.
+#
+# If the number of frames in the set is known in advance, plan() precomputes the whole
+# pattern and orders it into a short slewing path (see DitherPlanner).  next_frame() then
+# follows that path instead of calculating the rings one point at a time.
 #
 import math
+from typing import Optional
+
+import numpy
+
+from DitherPlanner import DitherPlanner
+from SkyGeometry import SkyGeometry
+from SlewTimeModel import SlewTimeModel
 
 
 class Ditherer:
@@ -27,7 +38,9 @@ class Ditherer:
     def __init__(self, start_alt_deg: float,  # Altitude, degrees
                  start_az_deg: float,  # Azimuth, degrees
                  dither_radius_as: float,  # Radius, arc seconds
-                 max_radius_as: float):  # Max radius, arc seconds
+                 max_radius_as: float,  # Max radius, arc seconds
+                 pattern: str = DitherPlanner.PATTERN_RINGS,  # Pattern used for planned paths
+                 slew_time_model: Optional[SlewTimeModel] = None):  # Learned slew times, if available
         # print(f"Dither from centre {start_alt_deg}, {start_az_deg}")
         self._start_alt_deg: float = start_alt_deg
         self._start_az_deg: float = start_az_deg
@@ -36,21 +49,44 @@ class Ditherer:
         self._max_radius_as: float = max_radius_as
         self._max_radius_rad: float = math.radians(self._max_radius_as / (60.0 * 60.0))
         self._count_in_set: int = 0
+        self._current_offset_rad: (float, float) = (0.0, 0.0)    # Offset of the current frame
         # The following are the running variables that change with each
         # call, tracking the spiraling offset out from zero.  These are
         # reset to start a new dither
         self._angle_rad = 3 * math.pi   # Radians. More than 2-pi triggers new cycle
         self._steps = 4   # New cycle will double this to start at 8 steps
         self._current_radius_rad = 0     # Current radius in radians
+        # Precomputed path of offsets for the set, if one has been planned
+        self._planner: DitherPlanner = DitherPlanner(dither_radius_as, max_radius_as, pattern,
+                                                     start_alt_deg, start_az_deg, slew_time_model)
+        self._planned_path: Optional[numpy.ndarray] = None
 
     def reset(self):
         """Reset dithering to original target centre"""
         self._count_in_set: int = 0
+        self._current_offset_rad = (0.0, 0.0)
         self._angle_rad = 3 * math.pi   # More than 2-pi to trigger new cycle
         self._steps = 4   # New cycle will double this to start at 8 steps
         self._current_radius_rad = 0     # Current radius in radians
+        self._planned_path = None
         # print(f"reset dither")
 
+    # Precompute the dither offsets for a set of the given number of frames, ordered
+    # to minimize slewing.  Frames beyond the planned count fall back to the running calculation.
+
+    def plan(self, frame_count: int):
+        """Plan a slew-optimized dither path for a set of the given number of frames"""
+        self._planned_path = self._planner.plan(frame_count)
+
+    def planned_slew_seconds(self) -> float:
+        """Estimated time spent slewing along the planned path (zero if none planned)"""
+        return self._planner.expected_slew_seconds() if self._planned_path is not None else 0.0
+
+    def get_current_offset_arcsec(self) -> (float, float):
+        """Offset of the current frame from the target, arc seconds toward zenith and along azimuth"""
+        (x_offset, y_offset) = self._current_offset_rad
+        return math.degrees(x_offset) * 60.0 * 60.0, math.degrees(y_offset) * 60.0 * 60.0
+
     def get_start_alt(self) -> float:
         return self._start_alt_deg
 
@@ -59,7 +95,8 @@ class Ditherer:
 
     def __str__(self):
         return f"from ({self._start_alt_deg:.4f}, {self._start_az_deg:.4f})" \
-               + f", radius {self._dither_radius_as}'' to {self._max_radius_as}''"
+               + f", radius {self._dither_radius_as}'' to {self._max_radius_as}''" \
+               + f", {self._planner.get_pattern()} pattern"
 
     # Actual computations for dithering
 
@@ -74,20 +111,34 @@ class Ditherer:
         if self._count_in_set == 1:
             # First frame since reset, we don't move the scope
             move_scope = False
+            self._current_offset_rad = (0.0, 0.0)
             to_alt = self._start_alt_deg
             to_az = self._start_az_deg
             # print("  Using start location")
         else:
             # We're beyond the first frame, so we are dithering
-            (x_offset, y_offset) = self.calc_next_dither_offset()
-            # Convert offset in radians to degrees then offset original location
-            to_alt = self._start_alt_deg + math.degrees(x_offset)
-            to_az = self._start_az_deg + math.degrees(y_offset)
+            (x_offset, y_offset) = self.next_dither_offset()
+            self._current_offset_rad = (x_offset, y_offset)
+            # Move the original location by the offset, on the sphere
+            (to_alt, to_az) = SkyGeometry.offset_alt_az(self._start_alt_deg, self._start_az_deg,
+                                                        x_offset, y_offset)
+            to_alt = float(to_alt)
+            to_az = float(to_az)
             move_scope = True
             # print(f"  Using ({to_alt}, {to_az})")
         # print(f"Dither {move_scope}, {to_alt}, {to_az}")
         return move_scope, to_alt, to_az
 
+    # Get the offset for the next dithered frame from the planned path, if there is one
+    # and it is not used up, otherwise calculate it from the running ring state
+
+    def next_dither_offset(self) -> (float, float):
+        """Get next dither offset from (0,0) in radians"""
+        path_index = self._count_in_set - 1
+        if self._planned_path is not None and path_index < len(self._planned_path):
+            return float(self._planned_path[path_index][0]), float(self._planned_path[path_index][1])
+        return self.calc_next_dither_offset()
+
     # Calculate the x and y offsets, in radians, for the next dithered frame.
     # We distribute positions around a ring a given radius from zero, a given number
     # of positions (we'll call steps) around the ring.  If we are beyond the desired number
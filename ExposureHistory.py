@@ -0,0 +1,139 @@
+#
+#   History of every flat frame measured: when, in which session, filter and binning, the exposure,
+#   the resulting ADU level, and the camera temperature.  It replaces remembering only the last
+#   exposure used for each filter and binning as the source of the next session's first exposure.
+#
+#   The history is an append-only file of fixed-size binary records in the program's data
+#   folder, so adding a frame is one small write and the whole file reads straight into a numpy
+#   array.  A record cut short by a crash is simply ignored.
+#
+#   The starting exposure is worked out from how the camera responds to the panel: the ADU level
+#   is a bias pedestal plus the panel's brightness times the exposure, so it is not proportional
+#   to the exposure.  Each recent session whose frames span a range of exposures (the search for
+#   the right exposure usually gives that) has a straight line fitted to its ADUs against
+#   exposure, and the exposure reaching the target is read from the line.  A session whose
+#   exposures were all about the same has the bias level fitted in the other sessions subtracted
+#   before dividing by the exposure.  The sessions' exposures are combined with a weighted
+#   median, the most recent counting most.  One odd frame or session (a panel left on a different
+#   setting, say) doesn't move the estimate much, but a lasting change is followed within a
+#   session or two.
+#
+import os
+import struct
+from time import time
+from typing import Optional
+
+import numpy
+
+from Constants import Constants
+
+
+class ExposureHistory:
+    # Time, session start time, filter slot, binning, exposure, ADUs, camera temperature (NaN if unknown)
+    RECORD = struct.Struct("<ddBBfff")
+    RECORD_DTYPE = numpy.dtype([("time", "<f8"), ("session", "<f8"), ("filter_slot", "u1"), ("binning", "u1"),
+                                ("exposure", "<f4"), ("adus", "<f4"), ("temperature", "<f4")])
+
+    # The history file is opened for adding to when the history is created, so a file that
+    # can't be used is found out then, not part way through a session
+
+    def __init__(self, history_path: str):
+        self._history_path: str = history_path
+        self._session: float = time()
+        self._file = open(self._history_path, "ab")
+        # Start on a record boundary, in case a crash left a partial record at the end
+        extra = self._file.tell() % self.RECORD.size
+        if extra != 0:
+            self._file.truncate(self._file.tell() - extra)
+            self._file.seek(0, os.SEEK_END)
+
+    def get_history_path(self) -> str:
+        return self._history_path
+
+    # Add a measured frame to the history
+
+    def append(self, filter_slot: int, binning: int, exposure: float, adus: float,
+               temperature: Optional[float]):
+        """Record the exposure and resulting ADU level of a frame"""
+        if self._file is None:
+            return
+        self._file.write(self.RECORD.pack(time(), self._session, filter_slot, binning, exposure, adus,
+                                          float("nan") if temperature is None else temperature))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Read the history of the given filter and binning, oldest first
+
+    def records(self, filter_slot: int, binning: int) -> numpy.ndarray:
+        """Get the recorded frames for the given filter and binning"""
+        try:
+            with open(self._history_path, "rb") as file:
+                data = file.read()
+        except OSError as exception:
+            print(f"Unable to read exposure history: {exception}")
+            return numpy.empty(0, dtype=self.RECORD_DTYPE)
+        count = len(data) // self.RECORD.size
+        all_records = numpy.frombuffer(data, dtype=self.RECORD_DTYPE, count=count)
+        return all_records[(all_records["filter_slot"] == filter_slot) & (all_records["binning"] == binning)]
+
+    # The exposure expected to give the target ADU level, from the camera's response measured in
+    # recent sessions.  None if there is no usable history for this filter and binning.
+
+    def best_starting_exposure(self, filter_slot: int, binning: int, target_adus: float) -> Optional[float]:
+        """Estimate the exposure that will reach the target ADUs, from the history"""
+        history = self.records(filter_slot, binning)
+        # Values that can't be real (e.g. from a damaged file) are left out
+        usable = history[(history["exposure"] > 0) & (history["adus"] > 0)
+                         & numpy.isfinite(history["exposure"]) & numpy.isfinite(history["adus"])]
+        if len(usable) == 0:
+            return None
+        sessions = numpy.unique(usable["session"])[-Constants.EXPOSURE_HISTORY_SESSIONS:]
+        lines = {session: self.fit_line(usable[usable["session"] == session]) for session in sessions}
+        fitted_biases = [bias for (bias, _) in filter(None, lines.values())]
+        bias_level = float(numpy.median(fitted_biases)) if fitted_biases else 0.0
+        session_exposures: [float] = []
+        session_ages: [int] = []
+        for (age, session) in enumerate(reversed(sessions)):
+            line = lines[session]
+            if line is None:
+                frames = usable[usable["session"] == session]
+                above_bias = frames[frames["adus"] > bias_level]
+                if len(above_bias) == 0:
+                    continue
+                line = (bias_level, float(numpy.median((above_bias["adus"] - bias_level) / above_bias["exposure"])))
+            (bias, brightness) = line
+            if target_adus > bias:
+                session_exposures.append((target_adus - bias) / brightness)
+                session_ages.append(age)
+        if len(session_exposures) == 0:
+            return None
+        # Most recent session has age 0
+        weights = numpy.power(0.5, numpy.array(session_ages) / Constants.EXPOSURE_HISTORY_HALF_LIFE)
+        return self.weighted_median(numpy.array(session_exposures), weights)
+
+    # Fit ADUs = bias + brightness * exposure to one session's frames.  Return (bias, brightness),
+    # or None if the exposures are too few or too alike for the fit to mean anything.
+
+    @staticmethod
+    def fit_line(frames: numpy.ndarray) -> Optional[tuple]:
+        """Fit the camera's response to exposure from a session's frames"""
+        exposures = frames["exposure"].astype(numpy.float64)
+        if len(frames) < Constants.EXPOSURE_HISTORY_FIT_FRAMES \
+                or exposures.max() < Constants.EXPOSURE_HISTORY_FIT_SPREAD * exposures.min():
+            return None
+        (brightness, bias) = numpy.polyfit(exposures, frames["adus"].astype(numpy.float64), 1)
+        if brightness <= 0 or bias < 0:
+            return None
+        return float(bias), float(brightness)
+
+    @staticmethod
+    def weighted_median(values: numpy.ndarray, weights: numpy.ndarray) -> float:
+        """The value below and above which half the total weight lies"""
+        order = numpy.argsort(values)
+        cumulative = numpy.cumsum(weights[order])
+        index = int(numpy.searchsorted(cumulative, cumulative[-1] / 2.0))
+        return float(values[order][index])
@@ -0,0 +1,153 @@
+#
+#   Background conversion of saved frames to tile-compressed FITS (Rice compression, which is
+#   lossless for integer data), so nightly sets are a fraction of the size to store and to
+#   copy across the network.
+#
+#   Files are queued with "submit", which never waits.  A small pool of worker processes
+#   compresses them, with only a few files handed to the pool at a time; the rest wait in
+#   the queue.  Each compressed file is read back and compared pixel for pixel with the
+#   original before the original is deleted.  The compressed file has ".fz" added to its name.
+#
+#   Compression needs astropy.  It is optional: without it, "available" is False and the
+#   option is disabled.
+#
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Callable, Optional
+
+import numpy
+
+from Constants import Constants
+
+try:
+    from astropy.io import fits
+except ImportError:
+    fits = None
+
+
+class FitsCompressor:
+
+    def __init__(self, compressed_callback: Optional[Callable[[str, str], None]] = None):
+        # Told (original path, compressed path) of each file compressed, e.g. to update a catalog
+        self._compressed_callback = compressed_callback
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._condition = threading.Condition(threading.RLock())
+        self._pending: deque = deque()
+        self._in_flight: int = 0
+        self._files_compressed: int = 0
+        self._bytes_before: int = 0
+        self._bytes_after: int = 0
+        self._failures: [str] = []
+
+    @staticmethod
+    def available() -> bool:
+        """Is the library needed for compression installed?"""
+        return fits is not None
+
+    # Queue a file to be compressed.  Returns immediately.
+
+    def submit(self, path: str):
+        """Queue a saved frame for compression"""
+        with self._condition:
+            self._pending.append(path)
+            self.start_more()
+
+    # Hand queued files to the worker processes, keeping only a few in the pool at once
+
+    def start_more(self):
+        with self._condition:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=Constants.COMPRESSION_MAX_WORKERS)
+            while self._pending and self._in_flight < Constants.COMPRESSION_MAX_WORKERS * 2:
+                path = self._pending.popleft()
+                self._in_flight += 1
+                future = self._executor.submit(FitsCompressor.compress_file, path)
+                future.add_done_callback(self.compression_finished)
+
+    def compression_finished(self, future: Future):
+        with self._condition:
+            self._in_flight -= 1
+            if future.cancelled():
+                pass
+            elif future.exception() is not None:
+                self._failures.append(str(future.exception()))
+            else:
+                (path, success, bytes_before, bytes_after, message) = future.result()
+                if success:
+                    self._files_compressed += 1
+                    self._bytes_before += bytes_before
+                    self._bytes_after += bytes_after
+                    if self._compressed_callback is not None:
+                        self._compressed_callback(path, path + ".fz")
+                else:
+                    self._failures.append(f"{os.path.basename(path)}: {message}")
+            if self._pending and self._executor is not None:
+                self.start_more()
+            self._condition.notify_all()
+
+    # Compress one file.  This runs in a worker process.
+    # Return path, success, size before, size after, and an error message
+
+    @staticmethod
+    def compress_file(path: str) -> (str, bool, int, int, str):
+        """Write a Rice tile-compressed copy of a FITS file, verify it, and delete the original"""
+        compressed_path = path + ".fz"
+        temporary_path = compressed_path + ".tmp"
+        try:
+            with fits.open(path, memmap=False) as original:
+                header = original[0].header
+                data = original[0].data
+                if data is None or data.dtype.kind not in "iu":
+                    return path, False, 0, 0, "only integer images are compressed"
+                compressed = fits.CompImageHDU(data=data, header=header, compression_type="RICE_1")
+                fits.HDUList([fits.PrimaryHDU(), compressed]).writeto(temporary_path, overwrite=True)
+                with fits.open(temporary_path) as check:
+                    if not numpy.array_equal(check[1].data, data):
+                        os.remove(temporary_path)
+                        return path, False, 0, 0, "compressed image does not match original"
+            bytes_before = os.path.getsize(path)
+            os.replace(temporary_path, compressed_path)
+            bytes_after = os.path.getsize(compressed_path)
+            os.remove(path)
+            return path, True, bytes_before, bytes_after, ""
+        except (OSError, ValueError, TypeError) as exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return path, False, 0, 0, str(exception)
+
+    # Wait for everything queued to be compressed, then stop the worker processes.
+    # If "abandon" is set, files not yet started are left uncompressed.
+
+    def wait_for_all(self, abandon: bool = False):
+        """Finish (or abandon) queued compressions and stop the workers"""
+        with self._condition:
+            if abandon:
+                self._pending.clear()
+            while self._pending or self._in_flight > 0:
+                self._condition.wait()
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    # Report of what was done
+
+    def get_files_compressed(self) -> int:
+        return self._files_compressed
+
+    def get_bytes_saved(self) -> int:
+        return self._bytes_before - self._bytes_after
+
+    def get_failures(self) -> [str]:
+        return self._failures
+
+    def report(self) -> str:
+        """Summary of the compression done"""
+        if self._files_compressed == 0:
+            return "No frames compressed"
+        megabyte = 1024 * 1024
+        return f"Compressed {self._files_compressed} frames from {self._bytes_before / megabyte:,.1f} MB " \
+               f"to {self._bytes_after / megabyte:,.1f} MB, saving {self.get_bytes_saved() / megabyte:,.1f} MB " \
+               f"({self.get_bytes_saved() / self._bytes_before:.0%}) of disk space and transfer"
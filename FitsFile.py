@@ -0,0 +1,178 @@
+#
+#   Minimal reader for the FITS image files TheSkyX saves, giving access to the pixel data
+#   through numpy.memmap so a frame is never read into memory all at once.
+#
+#   A FITS file starts with a header of 80-character "cards" (KEYWORD = value / comment)
+#   in 2880-byte blocks, ending with an END card.  The primary image data follows, starting
+#   at the next 2880-byte boundary, stored big-endian with the type given by BITPIX.
+#   Physical pixel values are  BZERO + BSCALE * stored value  (16-bit unsigned camera data is
+#   stored as signed 16-bit integers with BZERO = 32768).
+#
+#   New images (master flats and the like) are created with "create", which writes the header
+#   and sizes the file, then filled in a band at a time through a writable memmap.
+#
+import numpy
+
+
+class FitsFile:
+    BLOCK_SIZE = 2880
+    CARD_SIZE = 80
+    BITPIX_TYPES = {8: ">u1", 16: ">i2", 32: ">i4", 64: ">i8", -32: ">f4", -64: ">f8"}
+
+    def __init__(self, path: str, writable: bool = False):
+        self._path: str = path
+        (self._header, self._data_offset) = self.read_header(path)
+        bitpix = int(self._header.get("BITPIX", 16))
+        if bitpix not in self.BITPIX_TYPES or int(self._header.get("NAXIS", 0)) != 2:
+            raise ValueError(f"{path} is not a two-dimensional FITS image")
+        self._dtype = numpy.dtype(self.BITPIX_TYPES[bitpix])
+        self._width: int = int(self._header["NAXIS1"])
+        self._height: int = int(self._header["NAXIS2"])
+        self._bzero: float = float(self._header.get("BZERO", 0.0))
+        self._bscale: float = float(self._header.get("BSCALE", 1.0))
+        self._data: numpy.memmap = numpy.memmap(path, dtype=self._dtype, mode="r+" if writable else "r",
+                                                offset=self._data_offset,
+                                                shape=(self._height, self._width))
+
+    # Create a new image file of the given size, with zero pixels, and return it open for writing.
+    # 16-bit images hold unsigned values the usual way, with BZERO 32768.  Extra header
+    # cards can be given as a dict of keyword to value.
+
+    @classmethod
+    def create(cls, path: str, width: int, height: int, bitpix: int = -32,
+               extra_header: {str: object} = None):
+        """Create a FITS image file filled with zeros, and open it for writing"""
+        cards: [str] = [cls.format_card("SIMPLE", True),
+                        cls.format_card("BITPIX", bitpix),
+                        cls.format_card("NAXIS", 2),
+                        cls.format_card("NAXIS1", width),
+                        cls.format_card("NAXIS2", height)]
+        if bitpix == 16:
+            cards += [cls.format_card("BZERO", 32768), cls.format_card("BSCALE", 1)]
+        if extra_header is not None:
+            cards += [cls.format_card(keyword, value) for (keyword, value) in extra_header.items()]
+        cards.append("END".ljust(cls.CARD_SIZE))
+        header_bytes = cls.pad_to_block("".join(cards).encode("ascii"))
+        data_size = width * height * abs(bitpix) // 8
+        padded_data_size = -(-data_size // cls.BLOCK_SIZE) * cls.BLOCK_SIZE
+        with open(path, "wb") as file:
+            file.write(header_bytes)
+            file.truncate(len(header_bytes) + padded_data_size)
+        return FitsFile(path, writable=True)
+
+    @classmethod
+    def format_card(cls, keyword: str, value: object) -> str:
+        """Format one 80-character header card"""
+        if isinstance(value, bool):
+            value_text = ("T" if value else "F").rjust(20)
+        elif isinstance(value, (int, float)):
+            value_text = f"{value!r}".rjust(20)
+        else:
+            value_text = ("'" + str(value).replace("'", "''").ljust(8) + "'").ljust(20)
+        return f"{keyword.upper()[:8]:<8}= {value_text}"[:cls.CARD_SIZE].ljust(cls.CARD_SIZE)
+
+    @classmethod
+    def pad_to_block(cls, data: bytes) -> bytes:
+        """Pad header bytes with spaces to a whole number of blocks"""
+        return data + b" " * (-len(data) % cls.BLOCK_SIZE)
+
+    # Read the header cards into a dict of keyword to value.  Return the dict and the
+    # file offset at which the image data begins.
+
+    @classmethod
+    def read_header(cls, path: str) -> ({str: object}, int):
+        """Read the primary header of a FITS file"""
+        header: {str: object} = {}
+        offset = 0
+        with open(path, "rb") as file:
+            while True:
+                block = file.read(cls.BLOCK_SIZE)
+                if len(block) < cls.BLOCK_SIZE:
+                    raise ValueError(f"{path} has no complete FITS header")
+                offset += cls.BLOCK_SIZE
+                for card_start in range(0, cls.BLOCK_SIZE, cls.CARD_SIZE):
+                    card = block[card_start:card_start + cls.CARD_SIZE].decode("ascii", errors="replace")
+                    keyword = card[:8].strip()
+                    if keyword == "END":
+                        return header, offset
+                    if card[8:10] == "= ":
+                        header[keyword] = cls.parse_value(card[10:])
+
+    @staticmethod
+    def parse_value(value_text: str) -> object:
+        """Convert the value part of a header card to a str, bool, int, or float"""
+        text = value_text.strip()
+        if text.startswith("'"):
+            closing = text.find("'", 1)
+            return text[1:closing].rstrip() if closing > 0 else text[1:].rstrip()
+        text = text.split("/")[0].strip()
+        if text == "T":
+            return True
+        if text == "F":
+            return False
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    # Getters
+
+    def get_path(self) -> str:
+        return self._path
+
+    def get_header(self) -> {str: object}:
+        return self._header
+
+    def get_width(self) -> int:
+        return self._width
+
+    def get_height(self) -> int:
+        return self._height
+
+    def get_raw_data(self) -> numpy.memmap:
+        """The stored pixel values, memory-mapped, without BZERO/BSCALE applied"""
+        return self._data
+
+    def rows(self, start_row: int, end_row: int) -> numpy.ndarray:
+        """Physical pixel values for a band of rows, as float32"""
+        block = self._data[start_row:end_row].astype(numpy.float32)
+        if self._bscale != 1.0:
+            block *= self._bscale
+        if self._bzero != 0.0:
+            block += self._bzero
+        return block
+
+    def subsample(self, stride: int) -> numpy.ndarray:
+        """Physical values of every n'th pixel of every n'th row, as float32"""
+        block = self._data[::stride, ::stride].astype(numpy.float32)
+        if self._bscale != 1.0:
+            block *= self._bscale
+        if self._bzero != 0.0:
+            block += self._bzero
+        return block
+
+    def write_rows(self, start_row: int, values: numpy.ndarray, start_column: int = 0):
+        """Store physical pixel values into a block of the image, starting at the given row and column"""
+        stored = numpy.asarray(values, dtype=numpy.float64)
+        if self._bzero != 0.0:
+            stored = stored - self._bzero
+        if self._bscale != 1.0:
+            stored = stored / self._bscale
+        if self._dtype.kind in "iu":
+            info = numpy.iinfo(self._dtype)
+            stored = numpy.clip(numpy.rint(stored), info.min, info.max)
+        (rows, columns) = stored.shape
+        self._data[start_row:start_row + rows, start_column:start_column + columns] = stored
+
+    def flush(self):
+        """Make sure written pixel values are on disk"""
+        self._data.flush()
+
+    def row_bands(self, band_rows: int):
+        """Iterate over the image as (start row, physical values) bands of the given height"""
+        for start_row in range(0, self._height, band_rows):
+            yield start_row, self.rows(start_row, min(start_row + band_rows, self._height))
@@ -0,0 +1,105 @@
+#
+#   Check that the illumination pattern of each flat matches the rest of its set.  A frame
+#   can have the right average level yet be useless as a flat because the pattern of light on
+#   the sensor is different - the panel flickered during the exposure, a dome light was on,
+#   or light leaked in from one side.
+#
+#   Each frame is reduced to an illumination signature, normalized by the frame's median so
+#   the exposure level doesn't matter:
+#       a coarse grid of tile medians
+#       a radial profile (mean level in rings around the centre), which follows vignetting
+#       left/right and top/bottom gradients
+#   The signature is computed from a strided subsample of the memory-mapped file (every n'th
+#   pixel of every n'th row), which keeps up with large frames on a single core.
+#
+#   The reference is the element-wise median of the signatures of the latest few frames
+#   accepted in the set, so one odd frame can't become the standard the rest are held to, and
+#   the reference follows a pattern that drifts slowly (sky flats through twilight).  Until a
+#   few frames have been accepted there is nothing reliable to compare with, so those frames
+#   are not checked.
+#
+from collections import deque
+from typing import Optional
+
+import numpy
+
+from Constants import Constants
+from FitsFile import FitsFile
+
+
+class FlatUniformityChecker:
+
+    def __init__(self):
+        self._accepted_signatures: deque = deque(maxlen=Constants.UNIFORMITY_REFERENCE_WINDOW)
+        self._reference: Optional[numpy.ndarray] = None
+        self._last_signature: Optional[numpy.ndarray] = None
+
+    def reset(self):
+        """Forget the reference, at the start of a new set of flats"""
+        self._accepted_signatures.clear()
+        self._reference = None
+        self._last_signature = None
+
+    # Measure the frame in the given file and compare it to the reference.
+    # Return a description of the problem, or None if it matches.
+
+    def check(self, path: str) -> Optional[str]:
+        """Check the frame's illumination pattern against the set's reference"""
+        self._last_signature = self.signature(FitsFile(path))
+        if self._reference is None:
+            return None
+        grid_cells = Constants.UNIFORMITY_GRID_SIZE ** 2
+        difference = numpy.abs(self._last_signature - self._reference)
+        tile_difference = difference[:grid_cells].max()
+        radial_difference = difference[grid_cells:-2].max()
+        gradient_difference = difference[-2:].max()
+        if tile_difference > Constants.UNIFORMITY_MAX_TILE_DIFFERENCE:
+            return f"illumination pattern differs by {tile_difference:.1%} in part of the frame"
+        if radial_difference > Constants.UNIFORMITY_MAX_RADIAL_DIFFERENCE:
+            return f"vignetting profile differs by {radial_difference:.1%}"
+        if gradient_difference > Constants.UNIFORMITY_MAX_GRADIENT_DIFFERENCE:
+            return f"gradient across frame differs by {gradient_difference:.1%}"
+        return None
+
+    def accept_last(self):
+        """The frame last checked was accepted: include it in the reference"""
+        if self._last_signature is not None:
+            self._accepted_signatures.append(self._last_signature)
+            if len(self._accepted_signatures) >= Constants.UNIFORMITY_REFERENCE_FRAMES:
+                self._reference = numpy.median(numpy.stack(self._accepted_signatures), axis=0)
+            self._last_signature = None
+
+    # Reduce a frame to its illumination signature: tile medians, then radial profile,
+    # then the left-right and top-bottom gradients, all relative to the frame median.
+
+    @staticmethod
+    def signature(fits_file: FitsFile) -> numpy.ndarray:
+        """Compute the normalized illumination signature of a frame"""
+        sample = fits_file.subsample(Constants.UNIFORMITY_SAMPLE_STRIDE)
+        level = float(numpy.median(sample))
+        if level <= 0:
+            level = 1.0
+        sample /= numpy.float32(level)
+
+        grid = Constants.UNIFORMITY_GRID_SIZE
+        tile_height = sample.shape[0] // grid
+        tile_width = sample.shape[1] // grid
+        tiles = sample[:tile_height * grid, :tile_width * grid] \
+            .reshape(grid, tile_height, grid, tile_width) \
+            .transpose(0, 2, 1, 3) \
+            .reshape(grid, grid, tile_height * tile_width)
+        tile_medians = numpy.median(tiles, axis=2)
+
+        rows = numpy.linspace(-1.0, 1.0, sample.shape[0], dtype=numpy.float32)[:, numpy.newaxis]
+        columns = numpy.linspace(-1.0, 1.0, sample.shape[1], dtype=numpy.float32)[numpy.newaxis, :]
+        radius = numpy.sqrt(rows * rows + columns * columns) / numpy.float32(numpy.sqrt(2.0))
+        ring_count = Constants.UNIFORMITY_RADIAL_RINGS
+        rings = numpy.minimum((radius * ring_count).astype(numpy.int32), ring_count - 1).ravel()
+        ring_sums = numpy.bincount(rings, weights=sample.ravel(), minlength=ring_count)
+        ring_counts = numpy.bincount(rings, minlength=ring_count)
+        radial_profile = ring_sums / numpy.maximum(ring_counts, 1)
+
+        half = grid // 2
+        left_right = tile_medians[:, half:].mean() - tile_medians[:, :half].mean()
+        top_bottom = tile_medians[:half, :].mean() - tile_medians[half:, :].mean()
+        return numpy.concatenate((tile_medians.ravel(), radial_profile, [left_right, top_bottom]))
@@ -0,0 +1,127 @@
+#
+#   SQLite catalog of every flat frame captured: what it is (filter, binning, exposure), how it
+#   measured (ADU statistics), the conditions (camera temperature, dither offset), which
+#   session took it, and where it was saved.  Calibration tools can then find, say, the newest
+#   1x1 Ha flats taken within 2 degrees of a given temperature with one indexed query instead
+#   of scanning folders and decoding file names.
+#
+#   The catalog is a single database in the program's data folder, shared by all sessions.
+#   Frames are added by the session thread, and paths updated when a frame is compressed from
+#   the compression stage's thread, so the connection is shared behind a lock.  The session
+#   and the save-folder watcher spell the same path differently (separators, a trailing slash
+#   on the folder, letter case on Windows), so paths are stored and matched normalized.
+#
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from FrameStatistics import FrameStatistics
+
+
+class FrameCatalog:
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS sessions (
+               session_id TEXT PRIMARY KEY,
+               started_at TEXT NOT NULL,
+               server TEXT)""",
+        """CREATE TABLE IF NOT EXISTS frames (
+               frame_id INTEGER PRIMARY KEY,
+               session_id TEXT NOT NULL REFERENCES sessions(session_id),
+               captured_at TEXT NOT NULL,
+               path TEXT NOT NULL,
+               filter_name TEXT NOT NULL,
+               binning INTEGER NOT NULL,
+               exposure REAL NOT NULL,
+               mean_adus REAL,
+               median_adus REAL,
+               clipped_mean_adus REAL,
+               standard_deviation REAL,
+               minimum_adus REAL,
+               maximum_adus REAL,
+               saturated_fraction REAL,
+               camera_temperature REAL,
+               dither_x_arcsec REAL,
+               dither_y_arcsec REAL)""",
+        "CREATE INDEX IF NOT EXISTS frames_by_kind ON frames (filter_name, binning, captured_at)",
+        "CREATE INDEX IF NOT EXISTS frames_by_session ON frames (session_id)",
+        "CREATE INDEX IF NOT EXISTS frames_by_path ON frames (path)",
+    ]
+
+    def __init__(self, database_path: str):
+        self._database_path: str = database_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                self._connection.execute(statement)
+
+    def get_database_path(self) -> str:
+        return self._database_path
+
+    @staticmethod
+    def new_session_id() -> str:
+        """Make an id for a new session: its start time, which also sorts sessions in order"""
+        return datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+    @staticmethod
+    def timestamp() -> str:
+        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def add_session(self, session_id: str, server: str):
+        """Record the start of a session"""
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR IGNORE INTO sessions (session_id, started_at, server) "
+                                     "VALUES (?, ?, ?)", (session_id, self.timestamp(), server))
+
+    def add_frame(self, session_id: str, path: str, filter_name: str, binning: int, exposure: float,
+                  statistics: FrameStatistics, camera_temperature: Optional[float],
+                  dither_offset_arcsec: Optional[tuple]):
+        """Record a frame that has just been saved"""
+        (dither_x, dither_y) = dither_offset_arcsec if dither_offset_arcsec is not None else (None, None)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO frames (session_id, captured_at, path, filter_name, binning, exposure, "
+                "mean_adus, median_adus, clipped_mean_adus, standard_deviation, minimum_adus, maximum_adus, "
+                "saturated_fraction, camera_temperature, dither_x_arcsec, dither_y_arcsec) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, self.timestamp(), self.normalized_path(path), filter_name, binning, exposure,
+                 statistics.get_mean(), statistics.get_median(), statistics.get_clipped_mean(),
+                 statistics.get_standard_deviation(), statistics.get_minimum(), statistics.get_maximum(),
+                 statistics.get_saturated_fraction(), camera_temperature, dither_x, dither_y))
+
+    def update_path(self, old_path: str, new_path: str):
+        """A frame file has been renamed or replaced (e.g. by compression)"""
+        with self._lock, self._connection:
+            cursor = self._connection.execute("UPDATE frames SET path = ? WHERE path = ?",
+                                              (self.normalized_path(new_path), self.normalized_path(old_path)))
+        if cursor.rowcount == 0:
+            print(f"Frame catalog has no frame {old_path} to update to {new_path}")
+
+    @staticmethod
+    def normalized_path(path: str) -> str:
+        return os.path.normcase(os.path.normpath(path))
+
+    # The newest flats of a given filter and binning, optionally only those taken within a
+    # given number of degrees of a camera temperature.
+
+    def newest_flats(self, filter_name: str, binning: int,
+                     temperature: Optional[float] = None, temperature_tolerance: float = 2.0,
+                     limit: int = 100) -> [sqlite3.Row]:
+        """Find the most recently captured flats of the given kind"""
+        query = "SELECT * FROM frames WHERE filter_name = ? AND binning = ?"
+        parameters: [object] = [filter_name, binning]
+        if temperature is not None:
+            query += " AND camera_temperature BETWEEN ? AND ?"
+            parameters += [temperature - temperature_tolerance, temperature + temperature_tolerance]
+        query += " ORDER BY captured_at DESC LIMIT ?"
+        parameters.append(limit)
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,54 @@
+# Summary statistics of the pixel values in one acquired frame, used to decide whether
+# the frame is an acceptable flat.  A frame with the right mean can still be spoiled by a
+# hot column, a saturated corner, or a gradient across the panel; the median, spread, and
+# saturated fraction let us catch those.  The clipped mean (pixels far from the mean
+# discarded) is only available when the frame is analyzed locally; otherwise it is the mean.
+
+from typing import Optional
+
+
+class FrameStatistics:
+    def __init__(self, mean: float, median: float, standard_deviation: float,
+                 minimum: float, maximum: float, saturated_fraction: float,
+                 clipped_mean: Optional[float] = None):
+        self._mean: float = mean
+        self._median: float = median
+        self._standard_deviation: float = standard_deviation
+        self._minimum: float = minimum
+        self._maximum: float = maximum
+        self._saturated_fraction: float = saturated_fraction  # Fraction (0 to 1) of pixels at saturation
+        self._clipped_mean: float = mean if clipped_mean is None else clipped_mean
+
+    # Statistics for a frame where only the average is known, e.g. simulated frames
+    @classmethod
+    def from_mean(cls, mean: float):
+        """Create statistics for a frame known only by its average"""
+        return FrameStatistics(mean, mean, 0.0, mean, mean, 0.0)
+
+    # Getters
+
+    def get_mean(self) -> float:
+        return self._mean
+
+    def get_median(self) -> float:
+        return self._median
+
+    def get_standard_deviation(self) -> float:
+        return self._standard_deviation
+
+    def get_minimum(self) -> float:
+        return self._minimum
+
+    def get_maximum(self) -> float:
+        return self._maximum
+
+    def get_saturated_fraction(self) -> float:
+        return self._saturated_fraction
+
+    def get_clipped_mean(self) -> float:
+        return self._clipped_mean
+
+    def __str__(self) -> str:
+        return f"mean {self._mean:,.0f}, median {self._median:,.0f}, sd {self._standard_deviation:,.0f}, " \
+               + f"range {self._minimum:,.0f}-{self._maximum:,.0f}, saturated {self._saturated_fraction:.2%}" \
+               + (f", clipped mean {self._clipped_mean:,.0f}" if self._clipped_mean != self._mean else "")
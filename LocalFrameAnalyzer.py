@@ -0,0 +1,77 @@
+#
+#   Compute frame statistics from a FITS file saved on this computer, instead of asking
+#   TheSkyX to do it.  The file is memory-mapped (see FitsFile) and processed in bands of
+#   rows, so memory use stays small whatever the sensor size.
+#
+#   Each band contributes to running sums (for mean and standard deviation), extremes, and a
+#   one-ADU-per-bin histogram over the 16-bit range.  Everything except the sums comes from the
+#   histogram at the end, with no second pass over the pixels:
+#       median          the bin where the cumulative count passes half the pixels
+#       clipped mean    iterative sigma-clipped mean, clipping histogram bins rather than pixels,
+#                       which ignores hot pixels, cosmic rays and dead columns
+#       saturation      the fraction of pixels in bins at or above the saturation level
+#
+import numpy
+
+from Constants import Constants
+from FitsFile import FitsFile
+from FrameStatistics import FrameStatistics
+
+
+class LocalFrameAnalyzer:
+    HISTOGRAM_BINS = 65536
+
+    @classmethod
+    def analyze(cls, path: str) -> FrameStatistics:
+        """Compute statistics for the FITS image in the given file"""
+        fits_file = FitsFile(path)
+        pixel_count = 0
+        total = 0.0
+        total_squares = 0.0
+        minimum = numpy.inf
+        maximum = -numpy.inf
+        histogram = numpy.zeros(cls.HISTOGRAM_BINS, dtype=numpy.int64)
+        for (_, band) in fits_file.row_bands(Constants.LOCAL_ANALYSIS_BAND_ROWS):
+            band64 = band.astype(numpy.float64)
+            pixel_count += band.size
+            total += float(band64.sum())
+            total_squares += float(numpy.square(band64).sum())
+            minimum = min(minimum, float(band.min()))
+            maximum = max(maximum, float(band.max()))
+            bins = numpy.clip(band, 0, cls.HISTOGRAM_BINS - 1).astype(numpy.int32)
+            histogram += numpy.bincount(bins.ravel(), minlength=cls.HISTOGRAM_BINS)
+        if pixel_count == 0:
+            return FrameStatistics.from_mean(0)
+
+        mean = total / pixel_count
+        standard_deviation = float(numpy.sqrt(max(0.0, total_squares / pixel_count - mean * mean)))
+        cumulative = numpy.cumsum(histogram)
+        median = float(numpy.searchsorted(cumulative, pixel_count / 2.0))
+        saturated_fraction = float(histogram[Constants.SATURATED_ADU_LEVEL:].sum()) / pixel_count
+        clipped_mean = cls.clipped_mean_from_histogram(histogram, mean, standard_deviation)
+        return FrameStatistics(mean, median, standard_deviation, minimum, maximum, saturated_fraction,
+                               clipped_mean)
+
+    # Sigma-clipped mean computed on the histogram: repeatedly drop bins further than
+    # the clipping limit from the current mean, and recompute mean and deviation from the rest.
+
+    @classmethod
+    def clipped_mean_from_histogram(cls, histogram: numpy.ndarray,
+                                    mean: float, standard_deviation: float) -> float:
+        """Sigma-clipped mean of the pixel values summarized by the histogram"""
+        values = numpy.arange(cls.HISTOGRAM_BINS, dtype=numpy.float64)
+        counts = histogram.astype(numpy.float64)
+        for _ in range(Constants.CLIPPED_MEAN_ITERATIONS):
+            limit = Constants.CLIPPED_MEAN_SIGMA * standard_deviation
+            keep = numpy.abs(values - mean) <= limit
+            kept = counts[keep].sum()
+            if kept == 0:
+                break
+            new_mean = float((values[keep] * counts[keep]).sum() / kept)
+            standard_deviation = float(numpy.sqrt((numpy.square(values[keep] - new_mean) * counts[keep]).sum()
+                                                  / kept))
+            if abs(new_mean - mean) < 0.01:
+                mean = new_mean
+                break
+            mean = new_mean
+        return mean
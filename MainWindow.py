@@ -1,8 +1,8 @@
 import json
 import os
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
-from PyQt5 import uic, QtWidgets
+from PyQt5 import QtWidgets
 from PyQt5.QtCore import QModelIndex, Qt, QObject, QEvent, QTimer
 from PyQt5.QtWidgets import QMainWindow, QDialog, QWidget, QFileDialog, QMessageBox, QAbstractButton, QLineEdit
 
@@ -10,14 +10,17 @@ from Constants import Constants
 from DataModel import DataModel
 from DataModelDecoder import DataModelDecoder
 from Preferences import Preferences
-from PrefsWindow import PrefsWindow
 from RmNetUtils import RmNetUtils
-from SessionConsole import SessionConsole
 from SessionPlanTableModel import SessionPlanTableModel
 from SharedUtils import SharedUtils
-from TheSkyX import TheSkyX
 from Validators import Validators
 
+# The preferences and session windows, and the server and slew-time model (which bring in numpy),
+# are imported when first used rather than here, so the main window comes up sooner
+if TYPE_CHECKING:
+    from SlewTimeModel import SlewTimeModel
+    from TheSkyX import TheSkyX
+
 #
 #   User interface controller for main window
 #
@@ -34,10 +37,12 @@ class MainWindow(QMainWindow):
         self._slew_cancelled: bool = False
         self._slew_elapsed: float = 0
         self._slew_timer: Optional[QTimer] = None
-        self._slew_server: Optional[TheSkyX] = None
+        self._slew_server: Optional["TheSkyX"] = None
         self._slew_pulse_state: bool = True
+        self._slew_time_model: Optional["SlewTimeModel"] = None
+        self._slew_first_poll: float = 0
 
-        self.ui = uic.loadUi(SharedUtils.path_for_file_in_program_directory("MainWindow.ui"))
+        self.ui = SharedUtils.load_ui("MainWindow.ui")
 
         self._data_model: DataModel = data_model
         self._preferences: Preferences = preferences
@@ -59,15 +64,8 @@ class MainWindow(QMainWindow):
         if window_size is not None:
             self.ui.resize(window_size)
 
-        # Set font sizes of all elements with fonts to the saved font size
-        standard_font_size = self._preferences.get_standard_font_size()
-        SharedUtils.set_font_sizes(parent=self.ui,
-                                   standard_size=standard_font_size,
-                                   title_prefix=Constants.MAIN_TITLE_LABEL_PREFIX,
-                                   title_increment=Constants.MAIN_TITLE_FONT_SIZE_INCREMENT,
-                                   subtitle_prefix=Constants.SUBTITLE_LABEL_PREFIX,
-                                   subtitle_increment=Constants.SUBTITLE_FONT_SIZE_INCREMENT
-                                   )
+        # Set the font size of all the program's windows to the saved font size
+        SharedUtils.set_application_font_size(self._preferences.get_standard_font_size())
 
     def set_field_validity(self, field, validity: bool):
         self._field_validity[field] = validity
@@ -279,6 +277,7 @@ class MainWindow(QMainWindow):
     # Preferences menu has been selected.  Open the preferences dialog
     def preferences_menu_triggered(self):
         """Respond to preferences menu by opening preferences dialog"""
+        from PrefsWindow import PrefsWindow
         dialog: PrefsWindow = PrefsWindow()
         dialog.set_up_ui(self._preferences)
         QDialog.DialogCode = dialog.ui.exec_()
@@ -383,6 +382,7 @@ class MainWindow(QMainWindow):
         # we need to force that edit to take effect.  They will expect the change they've
         # typed to be in place when the Proceed happens.
         self.commit_edit_in_progress()
+        from SessionConsole import SessionConsole
         session_console = SessionConsole(self._data_model, self._preferences, self._table_model)
         QDialog.DialogCode = session_console.ui.exec_()
 
@@ -527,30 +527,24 @@ class MainWindow(QMainWindow):
     # Menus to change font size
 
     def font_larger_menu(self):
-        self.increment_font_size(self.ui, increment=+1)
+        self.increment_font_size(increment=+1)
 
     def font_smaller_menu(self):
-        self.increment_font_size(self.ui, increment=-1)
+        self.increment_font_size(increment=-1)
 
     def font_reset_menu(self):
         self._preferences.set_standard_font_size(Constants.RESET_FONT_SIZE)
-        SharedUtils.set_font_sizes(parent=self.ui,
-                                   standard_size=Constants.RESET_FONT_SIZE,
-                                   title_prefix=Constants.MAIN_TITLE_LABEL_PREFIX,
-                                   title_increment=Constants.MAIN_TITLE_FONT_SIZE_INCREMENT,
-                                   subtitle_prefix=Constants.SUBTITLE_LABEL_PREFIX,
-                                   subtitle_increment=Constants.SUBTITLE_FONT_SIZE_INCREMENT)
-
-    def increment_font_size(self, parent: QObject, increment: int):
+        if self._table_model is not None:
+            self._table_model.font_size_changed()
+        SharedUtils.set_application_font_size(Constants.RESET_FONT_SIZE)
+
+    def increment_font_size(self, increment: int):
         old_standard_font_size = self._preferences.get_standard_font_size()
         new_standard_font_size = old_standard_font_size + increment
         self._preferences.set_standard_font_size(new_standard_font_size)
-        SharedUtils.set_font_sizes(parent=parent,
-                                   standard_size=new_standard_font_size,
-                                   title_prefix=Constants.MAIN_TITLE_LABEL_PREFIX,
-                                   title_increment=Constants.MAIN_TITLE_FONT_SIZE_INCREMENT,
-                                   subtitle_prefix=Constants.SUBTITLE_LABEL_PREFIX,
-                                   subtitle_increment=Constants.SUBTITLE_FONT_SIZE_INCREMENT)
+        if self._table_model is not None:
+            self._table_model.font_size_changed()
+        SharedUtils.set_application_font_size(new_standard_font_size)
 
     # We have changed (or loaded) the server name.  Determine (best guess) if this is the
     # same computer we're running on, or a different one, and use that to enable parts of the
@@ -586,11 +580,17 @@ class MainWindow(QMainWindow):
         else:
             print("Cancelled")
 
+    # A client for the TheSkyX server named in the data model
+
+    def make_server(self) -> "TheSkyX":
+        from TheSkyX import TheSkyX
+        return TheSkyX(self._data_model.get_server_address(), self._data_model.get_port_number())
+
     # User has asked us to ask TheSkyX for the autosave path.
     # Try;  if we get a response, display it.
 
     def query_autosave_path_clicked(self):
-        server = TheSkyX(self._data_model.get_server_address(), self._data_model.get_port_number())
+        server = self.make_server()
         (success, path, message) = server.get_camera_autosave_path()
         if success:
             self.ui.pathName.setText(path)
@@ -668,8 +668,7 @@ class MainWindow(QMainWindow):
     def read_scope_clicked(self):
         """Read current alt/az from mount and store as slew target in data model"""
         # Get a server object
-        server = TheSkyX(self._data_model.get_server_address(),
-                         self._data_model.get_port_number())
+        server = self.make_server()
 
         # Ask for scope settings
         (success, scope_alt, scope_az, message) = server.get_scope_alt_az()
@@ -689,13 +688,18 @@ class MainWindow(QMainWindow):
     # Start the slew.  Slewing is asynchronous, so poll the scope to see when it is done.
     # While it's running, we'll pulse a "slewing" message with a timer, and have a "cancel"
     # button enabled to stop the slew.
+    # The slew is timed and recorded in the slew-time model, and the model's prediction of
+    # how long this slew will take lets us skip polling the mount until it's nearly done.
 
     def slew_button_clicked(self):
         """Ask the mount to slew the scope to the position of the light source"""
 
         # Start asynchronous slew
-        server = TheSkyX(self._data_model.get_server_address(),
-                         self._data_model.get_port_number())
+        server = self.make_server()
+        if self._slew_time_model is None:
+            from SlewTimeModel import SlewTimeModel
+            self._slew_time_model = SlewTimeModel(self._preferences)
+        server.set_slew_time_model(self._slew_time_model)
         (success, message) = server.start_slew_to(alt=self._data_model.get_source_alt(),
                                                   az=self._data_model.get_source_az(),
                                                   asynchronous=True)
@@ -704,6 +708,9 @@ class MainWindow(QMainWindow):
             self._slew_elapsed = 0
             self._slew_server = server
             self._slew_pulse_state = False
+            predicted_seconds = server.predicted_slew_seconds()
+            self._slew_first_poll = 0 if predicted_seconds is None \
+                else predicted_seconds * Constants.SLEW_MODEL_EARLIEST_POLL_FRACTION
             # Enable the Cancel button, disable the other UI buttons
             SharedUtils.set_enable_all_widgets(self.ui, QAbstractButton, False)
             SharedUtils.set_enable_all_widgets(self.ui, QLineEdit, False)
@@ -730,6 +737,9 @@ class MainWindow(QMainWindow):
             self.ui.slewMessage.setText("Slew Cancelled")
         elif self._slew_elapsed > Constants.SLEW_MAXIMUM_WAIT:
             self.ui.slewMessage.setText("Slew Timed Out")
+        elif self._slew_elapsed < self._slew_first_poll:
+            # The slew model says it can't be finished yet, don't bother the mount
+            slew_is_finished = False
         else:
             (success, complete) = self._slew_server.slew_is_complete()
             if success:
@@ -764,4 +774,5 @@ class MainWindow(QMainWindow):
         self.enable_proceed_button()
         self._slew_timer = None
         self._slew_server = None
+        self._slew_time_model.save()
         self.ui.slewMessage.setStyleSheet(f"color: black")
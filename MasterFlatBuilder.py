@@ -0,0 +1,190 @@
+#
+#   Combine the accepted flat frames of a (filter, binning) set into a master flat, in the
+#   background while the session goes on to acquire the next set.
+#
+#   The combination is a sigma-clipped median: each frame is first scaled to the set's average
+#   level (so a slowly dimming panel doesn't bias the result), then for every pixel the median
+#   and median absolute deviation are found across the frames, values too far from the median
+#   are discarded, and the median of the rest is the master pixel.
+#
+#   The image is divided into tiles, small enough that combining one tile fits in a fixed
+#   memory budget per worker, whatever the number of frames or the sensor size.  Each tile is
+#   read from the memory-mapped frame files, combined, and written into the memory-mapped master
+#   by a worker process, so several tiles are combined at once without holding up the
+#   acquisition thread.  The master is written under a candidate name and given its real name
+#   as soon as its last tile is done, and the caller is told, so each master is ready when its
+#   own work item's frames are combined rather than at the end of the session.
+#
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future, wait
+from datetime import datetime
+from functools import partial
+from typing import Optional, Callable
+
+import numpy
+
+from Constants import Constants
+from FitsFile import FitsFile
+
+# Bytes held per pixel of a tile while it is combined: for each frame, the float32 stack, the
+# deviations from the median, the outlier mask, and the float32 copy nanmedian makes of the
+# clipped stack, all alive at once at the peak; plus the per-pixel median, sigma and result
+BYTES_PER_PIXEL_PER_FRAME = 4 + 4 + 1 + 4
+BYTES_PER_PIXEL = 4 + 4 + 4
+
+
+class MasterFlatBuilder:
+
+    def __init__(self, output_directory: str,
+                 finished_callback: Optional[Callable[[str, bool, str], None]] = None):
+        self._output_directory: str = output_directory
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # For each master being built: its candidate path and the futures of its tiles.
+        # Tiles finish on the executor's thread, so the dict is shared with it.
+        self._pending: {str: (str, [Future])} = {}
+        self._lock = threading.Lock()
+        # Called with (master path, success, message) as each master is finished, on the
+        # executor's thread
+        self._finished_callback = finished_callback
+
+    # Start combining the given frames into a master flat.  Frame levels (e.g. their medians)
+    # are used to scale the frames to a common level.  Return the path the master will have.
+
+    def start_master(self, filter_name: str, binning: int,
+                     frame_paths: [str], frame_levels: [float]) -> str:
+        """Begin building a master flat from the given frames, in the background"""
+        os.makedirs(self._output_directory, exist_ok=True)
+        date_and_time_part = datetime.now().strftime("%Y%m%d-%H%M%S")
+        file_name = f"{date_and_time_part}-Master-Flat-{filter_name}-{binning}x{binning}.fit"
+        master_path = f"{self._output_directory}/{file_name}"
+        candidate_path = f"{self._output_directory}/{Constants.CANDIDATE_FRAME_PREFIX}{file_name}"
+
+        first_frame = FitsFile(frame_paths[0])
+        width = first_frame.get_width()
+        height = first_frame.get_height()
+        FitsFile.create(candidate_path, width, height, bitpix=-32,
+                        extra_header={"IMAGETYP": "Master Flat",
+                                      "FILTER": filter_name,
+                                      "XBINNING": binning,
+                                      "YBINNING": binning,
+                                      "NCOMBINE": len(frame_paths)})
+        levels = numpy.array(frame_levels, dtype=numpy.float64)
+        scales = [float(s) for s in levels.mean() / numpy.where(levels > 0, levels, levels.mean())]
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=Constants.MASTER_FLAT_MAX_WORKERS)
+        futures = [self._executor.submit(MasterFlatBuilder.combine_tile, frame_paths, scales, candidate_path,
+                                         top, bottom, left, right)
+                   for (top, bottom, left, right) in self.tiles(width, height, len(frame_paths))]
+        with self._lock:
+            self._pending[master_path] = (candidate_path, futures)
+        for future in futures:
+            future.add_done_callback(partial(self.tile_done, master_path))
+        return master_path
+
+    # Divide the image into tiles such that combining one tile fits in the memory budget.
+    # Tiles are full rows where possible, since rows are contiguous in the files.
+
+    @staticmethod
+    def tiles(width: int, height: int, frame_count: int) -> [(int, int, int, int)]:
+        """List the (top, bottom, left, right) bounds of the tiles to be combined"""
+        bytes_per_pixel = BYTES_PER_PIXEL_PER_FRAME * frame_count + BYTES_PER_PIXEL
+        tile_pixels = max(1, Constants.MASTER_FLAT_TILE_BYTES // bytes_per_pixel)
+        tile_width = min(width, tile_pixels)
+        tile_height = max(1, min(height, tile_pixels // tile_width))
+        return [(top, min(top + tile_height, height), left, min(left + tile_width, width))
+                for top in range(0, height, tile_height)
+                for left in range(0, width, tile_width)]
+
+    # Combine one tile across all the frames, and write it into the master file.
+    # This runs in a worker process.
+
+    @staticmethod
+    def combine_tile(frame_paths: [str], scales: [float], master_path: str,
+                     top: int, bottom: int, left: int, right: int) -> int:
+        """Sigma-clipped median of one tile of the frames, stored into the master"""
+        stack = numpy.empty((len(frame_paths), bottom - top, right - left), dtype=numpy.float32)
+        for (index, (path, scale)) in enumerate(zip(frame_paths, scales)):
+            stack[index] = FitsFile(path).rows(top, bottom)[:, left:right]
+            stack[index] *= scale
+        median = numpy.median(stack, axis=0)
+        deviation = stack - median
+        numpy.abs(deviation, out=deviation)
+        sigma = numpy.median(deviation, axis=0) * 1.4826  # MAD to standard deviation, for normal noise
+        outlier = deviation > Constants.MASTER_FLAT_CLIP_SIGMA * numpy.maximum(sigma, 1e-6)
+        stack[outlier] = numpy.nan
+        combined = numpy.nanmedian(stack, axis=0)
+        master = FitsFile(master_path, writable=True)
+        master.write_rows(top, combined, start_column=left)
+        master.flush()
+        return (bottom - top) * (right - left)
+
+    # A tile has been combined (or failed, or been cancelled).  When it is the last of its
+    # master's tiles, finish that master.  Called on the executor's thread.
+
+    def tile_done(self, master_path: str, _: Future):
+        with self._lock:
+            if master_path not in self._pending:
+                return
+            (candidate_path, futures) = self._pending[master_path]
+            if not all(future.done() for future in futures):
+                return
+            del self._pending[master_path]
+        self.finish_master(master_path, candidate_path, futures)
+
+    # Give a master whose tiles are all done its real name, and tell the caller.  A master
+    # with a failed tile is removed; one with cancelled tiles is abandoned quietly.
+
+    def finish_master(self, master_path: str, candidate_path: str, futures: [Future]):
+        """Finish a master flat whose tiles are all done"""
+        if any(future.cancelled() for future in futures):
+            self.remove_file(candidate_path)
+            return
+        try:
+            for future in futures:
+                future.result()
+            os.replace(candidate_path, master_path)
+            (success, message) = (True, "")
+        except Exception as exception:
+            self.remove_file(candidate_path)
+            (success, message) = (False, str(exception))
+        if self._finished_callback is not None:
+            self._finished_callback(master_path, success, message)
+
+    # Wait for all the masters being built to be finished
+
+    def wait_for_masters(self):
+        """Wait for masters in progress to be finished"""
+        with self._lock:
+            futures = [future for (_, tile_futures) in self._pending.values() for future in tile_futures]
+        wait(futures)
+        self.shut_down()
+
+    # Abandon masters in progress, e.g. because the session was cancelled
+
+    def cancel(self):
+        """Stop building masters and remove the partial files"""
+        with self._lock:
+            pending = list(self._pending.values())
+        for (_, futures) in pending:
+            for future in futures:
+                future.cancel()
+        self.shut_down()
+        for (candidate_path, _) in pending:
+            self.remove_file(candidate_path)
+        with self._lock:
+            self._pending = {}
+
+    def shut_down(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @staticmethod
+    def remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
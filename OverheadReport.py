@@ -0,0 +1,104 @@
+#
+#   Where a session's time went, per work item: how long the shutter was open on the frames
+#   we kept, against the wall time the work item took, with the difference split by cause.
+#   Shown in the console at the end of the session, so the setup can be tuned with real numbers.
+#
+#   The session thread reports how long each of its phases took (see SessionThread.phase).
+#   The phases of taking a frame are held until we know whether the frame was kept: for a
+#   kept frame, the time from the end of the exposure until the camera reports the frame
+#   complete (the wait for the estimated download, then polling) is download, and getting the
+#   frame's statistics is ADU query; for a rejected frame, all of it is the cost of the
+#   rejection.  Whatever isn't accounted for by a phase (connecting, starting exposures,
+#   console updates) is "other".
+#
+from typing import Optional
+
+from WorkItemOverhead import WorkItemOverhead, CATEGORIES, AVOIDABLE, DITHER, SAVE, FILTER_CHANGE
+
+# Phases of taking one frame, held until the frame is kept or rejected, and the other phases
+# with the category they count towards
+FRAME_PHASES = ("expose", "wait", "resync", "ADU query")
+PHASE_CATEGORIES = {"dither": DITHER, "save": SAVE, "filter change": FILTER_CHANGE}
+
+
+class OverheadReport:
+
+    def __init__(self):
+        self._work_items: [WorkItemOverhead] = []
+        self._current: Optional[WorkItemOverhead] = None
+        self._frame_phases: {str: float} = {}
+
+    def start_work_item(self, title: str):
+        """Start accounting for a work item"""
+        self._current = WorkItemOverhead(title)
+        self._work_items.append(self._current)
+        self._frame_phases = {}
+
+    def finish_work_item(self):
+        if self._current is not None:
+            self._current.finish()
+            self._current = None
+
+    # A phase of the session has taken the given time
+
+    def add_phase(self, name: str, seconds: float):
+        """Count the time taken by a phase of the session"""
+        if self._current is None:
+            return
+        if name in FRAME_PHASES:
+            self._frame_phases[name] = self._frame_phases.get(name, 0.0) + seconds
+        elif name in PHASE_CATEGORIES:
+            self._current.add(PHASE_CATEGORIES[name], seconds)
+
+    # The frame whose phases we have been holding was kept, or rejected.  (If it was neither,
+    # the session having been cancelled or failed, its time ends up in "other".)
+
+    def frame_kept(self, exposure: float):
+        if self._current is not None:
+            self._current.frame_kept(exposure, self._frame_phases)
+        self._frame_phases = {}
+
+    def frame_rejected(self):
+        if self._current is not None:
+            self._current.frame_rejected(self._frame_phases)
+        self._frame_phases = {}
+
+    def start_frame(self):
+        """Begin a new frame, dropping the phases of one that was neither kept nor rejected"""
+        self._frame_phases = {}
+
+    # The report, as console lines with their indentation levels
+
+    def report_lines(self) -> [(str, int)]:
+        """Describe where each work item's time went, and the biggest avoidable overhead"""
+        lines: [(str, int)] = []
+        totals: {str: float} = {category: 0.0 for category in CATEGORIES}
+        total_wall_time = 0.0
+        for work_item in self._work_items:
+            wall_time = work_item.get_wall_time()
+            if wall_time <= 0:
+                continue
+            total_wall_time += wall_time
+            lines.append((f"{work_item.get_title()}: shutter open {self.format_seconds(work_item.get_shutter())} "
+                          f"of {self.format_seconds(wall_time)} "
+                          f"({work_item.get_shutter() / wall_time:.0%}), "
+                          f"{work_item.get_frames_kept()} frames kept, "
+                          f"{work_item.get_frames_rejected()} rejected", 2))
+            for (category, seconds) in work_item.get_seconds().items():
+                totals[category] += seconds
+                if seconds >= 0.05:
+                    lines.append((f"{category}: {self.format_seconds(seconds)} ({seconds / wall_time:.0%})", 3))
+        if total_wall_time > 0:
+            (category, seconds) = max(((category, totals[category]) for category in AVOIDABLE),
+                                      key=lambda item: item[1])
+            lines.append((f"Biggest avoidable overhead: {category}, {self.format_seconds(seconds)} "
+                          f"({seconds / total_wall_time:.0%} of the time)", 2))
+        return lines
+
+    @staticmethod
+    def format_seconds(seconds: float) -> str:
+        if seconds < 60.0:
+            return f"{seconds:.1f} s"
+        (minutes, seconds) = divmod(int(round(seconds)), 60)
+        (hours, minutes) = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours > 0 else f"{minutes}:{seconds:02d}"
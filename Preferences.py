@@ -1,6 +1,11 @@
+import copy
+import threading
+from typing import Optional
+
 from PyQt5.QtCore import QSettings, QSize
 
 from BinningSpec import BinningSpec
+from Constants import Constants
 from FilterSpec import FilterSpec
 
 
@@ -26,9 +31,21 @@ class Preferences(QSettings):
     DITHER_FLATS = "dither_flats"
     DITHER_RADIUS = "dither_radius"
     DITHER_MAX_RADIUS = "dither_max_radius"
+    DITHER_PATTERN = "dither_pattern"
+    SLEW_TIME_SAMPLES = "slew_time_samples"
+    BUILD_MASTER_FLATS = "build_master_flats"
+    ACCUMULATE_STATISTICS = "accumulate_statistics"
+    CHECK_UNIFORMITY = "check_uniformity"
+    COMPRESS_SAVED_FRAMES = "compress_saved_frames"
 
     def __init__(self):
         QSettings.__init__(self, "EarwigHavenObservatory.com", "FlatCaptureNow1")
+        # During a session the exposure table is kept here and written back now and then,
+        # rather than read from and written to the settings file for every frame
+        self._exposure_table_cache: Optional[{int: [float]}] = None
+        self._exposure_table_dirty: bool = False
+        self._exposure_table_lock = threading.RLock()
+        self._exposure_table_timer: Optional[threading.Timer] = None
 
     # Getters and setters for the possible settings
 
@@ -149,46 +166,153 @@ class Preferences(QSettings):
     def set_dither_max_radius(self, max_radius: float):
         self.setValue(self.DITHER_MAX_RADIUS, max_radius)
 
+    def get_dither_pattern(self) -> str:
+        return str(self.value(self.DITHER_PATTERN))
+
+    def set_dither_pattern(self, pattern: str):
+        self.setValue(self.DITHER_PATTERN, pattern)
+
+    def get_slew_time_samples(self) -> [[float]]:
+        """Fetch the recorded (distance degrees, seconds) slew observations"""
+        samples = self.value(self.SLEW_TIME_SAMPLES)
+        if samples is None:
+            return []
+        return [[float(distance), float(seconds)] for (distance, seconds) in samples]
+
+    def set_slew_time_samples(self, samples: [[float]]):
+        self.setValue(self.SLEW_TIME_SAMPLES, samples)
+
+    def get_build_master_flats(self) -> bool:
+        return bool(self.value(self.BUILD_MASTER_FLATS))
+
+    def set_build_master_flats(self, build: bool):
+        self.setValue(self.BUILD_MASTER_FLATS, build)
+
+    def get_accumulate_statistics(self) -> bool:
+        return bool(self.value(self.ACCUMULATE_STATISTICS))
+
+    def set_accumulate_statistics(self, accumulate: bool):
+        self.setValue(self.ACCUMULATE_STATISTICS, accumulate)
+
+    def get_check_uniformity(self) -> bool:
+        return bool(self.value(self.CHECK_UNIFORMITY))
+
+    def set_check_uniformity(self, check: bool):
+        self.setValue(self.CHECK_UNIFORMITY, check)
+
+    def get_compress_saved_frames(self) -> bool:
+        return bool(self.value(self.COMPRESS_SAVED_FRAMES))
+
+    def set_compress_saved_frames(self, compress: bool):
+        self.setValue(self.COMPRESS_SAVED_FRAMES, compress)
+
     def get_initial_exposure(self, filter_slot: int, binning: int):
         """Fetch the last exposure used for given filter and binning as initial guess for new session"""
 
-        exposure_table = self.value(self.FILTER_BIN_EXPOSURE_TABLE)
-        binning_index = binning - 1
-        result = 10
-        if exposure_table is not None:
-            if filter_slot in exposure_table:
-                tuple_for_filter = exposure_table[filter_slot]
-                if (binning_index >= 0) and (binning_index < len(tuple_for_filter)):
-                    result = tuple_for_filter[binning_index]
+        with self._exposure_table_lock:
+            exposure_table = self.get_exposure_table()
+            binning_index = binning - 1
+            result = 10
+            if exposure_table is not None:
+                if filter_slot in exposure_table:
+                    tuple_for_filter = exposure_table[filter_slot]
+                    if (binning_index >= 0) and (binning_index < len(tuple_for_filter)):
+                        result = tuple_for_filter[binning_index]
+                    else:
+                        print(f"Preferences doesnt contain exposure entry for filter {filter_slot} "
+                              f"and binning {binning}")
                 else:
-                    print(f"Preferences doesnt contain exposure entry for filter {filter_slot} and binning {binning}")
+                    print(f"Preferences has no exposure length entry for filter {filter_slot}")
             else:
-                print(f"Preferences has no exposure length entry for filter {filter_slot}")
-        else:
-            print("No exposure estimate table in preferences")
-        return result
+                print("No exposure estimate table in preferences")
+            return result
 
     def update_initial_exposure(self, filter_slot: int, binning: int, new_exposure: float):
         """Save exposure used for filter and binning to use as initial exposure next time"""
 
-        exposure_table = self.value(self.FILTER_BIN_EXPOSURE_TABLE)
-        binning_index = binning - 1
-        result = 10
-        if exposure_table is not None:
-            if filter_slot in exposure_table:
-                tuple_for_filter = exposure_table[filter_slot]
-                if (binning_index >= 0) and (binning_index < len(tuple_for_filter)):
-                    tuple_for_filter[binning_index] = new_exposure
-                    exposure_table[filter_slot] = tuple_for_filter
-                    self.setValue(self.FILTER_BIN_EXPOSURE_TABLE, exposure_table)
+        with self._exposure_table_lock:
+            exposure_table = self.get_exposure_table()
+            binning_index = binning - 1
+            result = 10
+            if exposure_table is not None:
+                if filter_slot in exposure_table:
+                    tuple_for_filter = exposure_table[filter_slot]
+                    if (binning_index >= 0) and (binning_index < len(tuple_for_filter)):
+                        tuple_for_filter[binning_index] = new_exposure
+                        exposure_table[filter_slot] = tuple_for_filter
+                        self.store_exposure_table(exposure_table)
+                    else:
+                        print(
+                            f"Preferences doesnt contain exposure entry for filter {filter_slot} and binning {binning}")
                 else:
-                    print(
-                        f"Preferences doesnt contain exposure entry for filter {filter_slot} and binning {binning}")
+                    print(f"Preferences has no exposure length entry for filter {filter_slot}")
+            else:
+                print("No exposure estimate table in preferences")
+            return result
+
+    # The exposure table, from the session's cache if one is open, otherwise from the settings
+
+    def get_exposure_table(self) -> Optional[dict]:
+        with self._exposure_table_lock:
+            if self._exposure_table_cache is not None:
+                return self._exposure_table_cache
+            return self.value(self.FILTER_BIN_EXPOSURE_TABLE)
+
+    # Store a changed exposure table.  With a cache open, the change is only remembered.  The
+    # first unsaved change starts a timer, which later changes don't restart, and the table is
+    # written when it fires: a throttle, so a run of changes (one per frame) is written at most
+    # once every EXPOSURE_TABLE_FLUSH_DELAY seconds.
+
+    def store_exposure_table(self, exposure_table: {int: [float]}):
+        with self._exposure_table_lock:
+            if self._exposure_table_cache is None:
+                self.setValue(self.FILTER_BIN_EXPOSURE_TABLE, exposure_table)
             else:
-                print(f"Preferences has no exposure length entry for filter {filter_slot}")
-        else:
-            print("No exposure estimate table in preferences")
-        return result
+                self._exposure_table_cache = exposure_table
+                self._exposure_table_dirty = True
+                if self._exposure_table_timer is None:
+                    self._exposure_table_timer = threading.Timer(Constants.EXPOSURE_TABLE_FLUSH_DELAY,
+                                                                 self.flush_exposure_table)
+                    self._exposure_table_timer.daemon = True
+                    self._exposure_table_timer.start()
+
+    # Session start: load the exposure table once, to be used and updated in memory
+
+    def begin_exposure_table_cache(self):
+        """Keep the exposure table in memory until end_exposure_table_cache"""
+        with self._exposure_table_lock:
+            if self._exposure_table_cache is None:
+                table = self.value(self.FILTER_BIN_EXPOSURE_TABLE)
+                if table is not None:
+                    self._exposure_table_cache = copy.deepcopy(table)
+                    self._exposure_table_dirty = False
+
+    # Write the cached table to the settings if it has changed.  Called by the throttle timer,
+    # on its own thread, and at session end, so it writes through its own QSettings object,
+    # which Qt allows on any thread.  The write is already crash-safe on each platform, so we
+    # don't add a temporary file of our own: on Linux the settings file is written through
+    # QSaveFile (a new file renamed over the old one), on macOS CFPreferences replaces the plist
+    # atomically, and on Windows each registry value is set in one transactional step.
+
+    def flush_exposure_table(self):
+        """Write the cached exposure table to the settings file if it has changed"""
+        with self._exposure_table_lock:
+            self._exposure_table_timer = None
+            if self._exposure_table_cache is not None and self._exposure_table_dirty:
+                writer = QSettings(self.organizationName(), self.applicationName())
+                writer.setValue(self.FILTER_BIN_EXPOSURE_TABLE, copy.deepcopy(self._exposure_table_cache))
+                writer.sync()
+                self._exposure_table_dirty = False
+
+    # Session end: write back any changes and go back to using the settings directly
+
+    def end_exposure_table_cache(self):
+        """Write back the cached exposure table and stop caching it"""
+        with self._exposure_table_lock:
+            if self._exposure_table_timer is not None:
+                self._exposure_table_timer.cancel()
+            self.flush_exposure_table()
+            self._exposure_table_cache = None
 
     # Get initial exposure estimate for a given filter (slot number) and binning value
 
@@ -207,6 +331,11 @@ class Preferences(QSettings):
         self.set_default_value(self.DITHER_FLATS, False)
         self.set_default_value(self.DITHER_RADIUS, 1.0)
         self.set_default_value(self.DITHER_MAX_RADIUS, 10.0)
+        self.set_default_value(self.DITHER_PATTERN, Constants.DEFAULT_DITHER_PATTERN)
+        self.set_default_value(self.BUILD_MASTER_FLATS, False)
+        self.set_default_value(self.ACCUMULATE_STATISTICS, False)
+        self.set_default_value(self.CHECK_UNIFORMITY, False)
+        self.set_default_value(self.COMPRESS_SAVED_FRAMES, False)
         binning_list: [BinningSpec] = (BinningSpec(1, False, True),
                                        BinningSpec(2, False, True),
                                        BinningSpec(3, True, False),
@@ -239,7 +368,10 @@ class Preferences(QSettings):
     def reset_saved_exposure_estimates(self):
         """Clear saved exposure estimates so they are recalculated next time they are needed"""
         exposure_table = self.default_initial_exposure_estimates_table()
-        self.setValue(self.FILTER_BIN_EXPOSURE_TABLE, exposure_table)
+        with self._exposure_table_lock:
+            if self._exposure_table_cache is not None:
+                self._exposure_table_cache = copy.deepcopy(exposure_table)
+            self.setValue(self.FILTER_BIN_EXPOSURE_TABLE, exposure_table)
 
     # The values and comments below reflect my personal filter assignments.
     # It doesn't matter if the user has different ones, as it will only affect
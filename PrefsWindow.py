@@ -1,14 +1,14 @@
 from typing import Optional
 
-from PyQt5 import uic
 from PyQt5.QtCore import Qt, QObject, QEvent
 from PyQt5.QtWidgets import QDialog, QRadioButton, QCheckBox, QLineEdit, QMessageBox
 
 import SharedUtils
 from BinningSpec import BinningSpec
-from Constants import Constants
 from DataModel import DataModel
+from DitherPlanner import DitherPlanner
 from FilterSpec import FilterSpec
+from FitsCompressor import FitsCompressor
 from Preferences import Preferences
 from RmNetUtils import RmNetUtils
 from SharedUtils import SharedUtils
@@ -25,7 +25,7 @@ class PrefsWindow(QDialog):
 
     def __init__(self):
         QDialog.__init__(self, flags=Qt.Dialog)
-        self.ui = uic.loadUi(SharedUtils.path_for_file_in_program_directory("PrefsWindow.ui"))
+        self.ui = SharedUtils.load_ui("PrefsWindow.ui")
         self._preferences: Optional[Preferences] = None
         self._data_model: Optional[DataModel] = None
 
@@ -43,15 +43,6 @@ class PrefsWindow(QDialog):
         # Watch events go by so we can save resize information
         self.ui.installEventFilter(self)
 
-        # Set font sizes of all elements using fonts to the saved font size
-        standard_font_size = self._preferences.get_standard_font_size()
-        SharedUtils.set_font_sizes(parent=self.ui,
-                                   standard_size=standard_font_size,
-                                   title_prefix=Constants.MAIN_TITLE_LABEL_PREFIX,
-                                   title_increment=Constants.MAIN_TITLE_FONT_SIZE_INCREMENT,
-                                   subtitle_prefix=Constants.SUBTITLE_LABEL_PREFIX,
-                                   subtitle_increment=Constants.SUBTITLE_FONT_SIZE_INCREMENT
-                                   )
 
     def connect_responders(self):
         """Connect UI fields and controls to the methods that respond to them"""
@@ -104,6 +95,13 @@ class PrefsWindow(QDialog):
         self.ui.ditherFlats.clicked.connect(self.dither_flats_clicked)
         self.ui.ditherRadius.editingFinished.connect(self.dither_radius_changed)
         self.ui.ditherMaxRadius.editingFinished.connect(self.dither_max_radius_changed)
+        self.ui.ditherPattern.currentTextChanged.connect(self.dither_pattern_changed)
+
+        # Processing of locally-saved files
+        self.ui.buildMasterFlats.clicked.connect(self.build_master_flats_clicked)
+        self.ui.accumulateStatistics.clicked.connect(self.accumulate_statistics_clicked)
+        self.ui.checkUniformity.clicked.connect(self.check_uniformity_clicked)
+        self.ui.compressSavedFrames.clicked.connect(self.compress_saved_frames_clicked)
 
         # Close button
         self.ui.closeButton.clicked.connect(self.close_button_clicked)
@@ -137,6 +135,21 @@ class PrefsWindow(QDialog):
         self.ui.ditherFlats.setChecked(preferences.get_dither_flats())
         self.ui.ditherRadius.setText(str(preferences.get_dither_radius()))
         self.ui.ditherMaxRadius.setText(str(preferences.get_dither_max_radius()))
+        self.ui.ditherPattern.blockSignals(True)
+        self.ui.ditherPattern.clear()
+        self.ui.ditherPattern.addItems(DitherPlanner.PATTERN_NAMES)
+        self.ui.ditherPattern.setCurrentText(preferences.get_dither_pattern())
+        self.ui.ditherPattern.blockSignals(False)
+
+        # Processing of locally-saved files
+
+        self.ui.buildMasterFlats.setChecked(preferences.get_build_master_flats())
+        self.ui.accumulateStatistics.setChecked(preferences.get_accumulate_statistics())
+        self.ui.checkUniformity.setChecked(preferences.get_check_uniformity())
+        # Compression needs an optional library
+        self.ui.compressSavedFrames.setEnabled(FitsCompressor.available())
+        self.ui.compressSavedFrames.setChecked(preferences.get_compress_saved_frames()
+                                               and FitsCompressor.available())
 
         # Filter specifications
         filter_specs = preferences.get_filter_spec_list()
@@ -307,6 +320,18 @@ class PrefsWindow(QDialog):
     def dither_flats_clicked(self):
         self._preferences.set_dither_flats(self.ui.ditherFlats.isChecked())
 
+    def build_master_flats_clicked(self):
+        self._preferences.set_build_master_flats(self.ui.buildMasterFlats.isChecked())
+
+    def accumulate_statistics_clicked(self):
+        self._preferences.set_accumulate_statistics(self.ui.accumulateStatistics.isChecked())
+
+    def check_uniformity_clicked(self):
+        self._preferences.set_check_uniformity(self.ui.checkUniformity.isChecked())
+
+    def compress_saved_frames_clicked(self):
+        self._preferences.set_compress_saved_frames(self.ui.compressSavedFrames.isChecked())
+
     def dither_radius_changed(self):
         proposed_new_number: str = self.ui.ditherRadius.text()
         new_number = Validators.valid_float_in_range(proposed_new_number, 0, 12*60*60)
@@ -323,6 +348,9 @@ class PrefsWindow(QDialog):
             self._preferences.set_dither_max_radius(new_number)
         SharedUtils.background_validity_color(self.ui.ditherMaxRadius, valid)
 
+    def dither_pattern_changed(self, pattern: str):
+        self._preferences.set_dither_pattern(pattern)
+
     def use_filter_wheel_clicked(self):
         """Store value of just-toggled 'use filter wheel' checkbox"""
         self._preferences.set_use_filter_wheel(self.ui.useFilterWheel.isChecked())
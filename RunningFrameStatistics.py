@@ -0,0 +1,125 @@
+#
+#   Per-pixel running mean and variance of the frames accepted for one (filter, binning) set,
+#   updated as each frame is accepted, using Welford's method:
+#       n += 1;  delta = x - mean;  mean += delta / n;  m2 += delta * (x - mean)
+#   so that when the set is finished a mean master flat and a noise map (the per-pixel
+#   standard deviation, sqrt(m2 / (n - 1))) are ready without another pass over the files.
+#
+#   The accumulators are float32 images, updated a band of rows at a time from the
+#   memory-mapped frame.  They can be checkpointed to a .npz file and reloaded, so an
+#   interrupted set can be resumed.  A checkpoint records the key of the set it belongs to and
+#   the paths of the frames in it, so whoever resumes it can check it is for the same set and
+#   that its frames are still there, rather than merging it into another.
+#
+import os
+from typing import Optional
+
+import numpy
+
+from Constants import Constants
+from FitsFile import FitsFile
+
+
+class RunningFrameStatistics:
+
+    def __init__(self):
+        self._count: int = 0
+        self._mean: Optional[numpy.ndarray] = None
+        self._m2: Optional[numpy.ndarray] = None
+        self._frame_paths: [str] = []
+        self._key: str = ""
+
+    def get_count(self) -> int:
+        return self._count
+
+    def get_frame_paths(self) -> [str]:
+        return self._frame_paths
+
+    def get_key(self) -> str:
+        return self._key
+
+    def get_mean(self) -> Optional[numpy.ndarray]:
+        return self._mean
+
+    def get_variance(self) -> Optional[numpy.ndarray]:
+        """Per-pixel sample variance of the frames so far"""
+        if self._m2 is None or self._count < 2:
+            return None
+        return self._m2 / numpy.float32(self._count - 1)
+
+    def get_noise(self) -> Optional[numpy.ndarray]:
+        """Per-pixel standard deviation of the frames so far"""
+        variance = self.get_variance()
+        return None if variance is None else numpy.sqrt(variance)
+
+    # Add one frame, from its FITS file.  The accumulators are created to match the first frame.
+
+    def add_frame(self, path: str):
+        """Update the running mean and variance with the frame in the given file"""
+        frame = FitsFile(path)
+        if self._mean is None:
+            self._mean = numpy.zeros((frame.get_height(), frame.get_width()), dtype=numpy.float32)
+            self._m2 = numpy.zeros_like(self._mean)
+        elif self._mean.shape != (frame.get_height(), frame.get_width()):
+            raise ValueError(f"{path} is not the same size as the other frames")
+        self._count += 1
+        count = numpy.float32(self._count)
+        for (start_row, band) in frame.row_bands(Constants.LOCAL_ANALYSIS_BAND_ROWS):
+            end_row = start_row + band.shape[0]
+            mean = self._mean[start_row:end_row]
+            delta = band - mean
+            mean += delta / count
+            band -= mean
+            band *= delta
+            self._m2[start_row:end_row] += band
+        self._frame_paths.append(path)
+
+    # Checkpoint to, and restore from, a .npz file
+
+    def save_checkpoint(self, path: str, key: str):
+        """Save the accumulators, for the set with the given key, so they can be resumed later"""
+        if self._mean is not None:
+            temporary_path = path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                numpy.savez(file, count=numpy.array(self._count), mean=self._mean, m2=self._m2,
+                            key=numpy.array(key), frame_paths=numpy.array(self._frame_paths, dtype=str))
+            os.replace(temporary_path, path)
+
+    @classmethod
+    def load_checkpoint(cls, path: str):
+        """Restore accumulators saved by save_checkpoint, or start fresh if there are none"""
+        statistics = RunningFrameStatistics()
+        if os.path.exists(path):
+            try:
+                with numpy.load(path) as checkpoint:
+                    statistics._count = int(checkpoint["count"])
+                    statistics._mean = checkpoint["mean"].astype(numpy.float32)
+                    statistics._m2 = checkpoint["m2"].astype(numpy.float32)
+                    statistics._key = str(checkpoint["key"])
+                    statistics._frame_paths = [str(frame_path) for frame_path in checkpoint["frame_paths"]]
+                if len(statistics._frame_paths) != statistics._count:
+                    raise ValueError("frame count doesn't match the frames listed")
+            except (OSError, ValueError, KeyError) as exception:
+                print(f"Ignoring unreadable statistics checkpoint {path}: {exception}")
+                statistics = RunningFrameStatistics()
+        return statistics
+
+    # Write the mean and noise images as FITS files
+
+    def write_mean(self, path: str, extra_header: {str: object}):
+        """Write the mean of the frames so far as a FITS image"""
+        self.write_image(path, self._mean, extra_header)
+
+    def write_noise(self, path: str, extra_header: {str: object}):
+        """Write the per-pixel standard deviation of the frames so far as a FITS image"""
+        self.write_image(path, self.get_noise(), extra_header)
+
+    def write_image(self, path: str, image: Optional[numpy.ndarray], extra_header: {str: object}):
+        if image is None:
+            raise ValueError("Not enough frames have been accumulated")
+        header = dict(extra_header)
+        header["NCOMBINE"] = self._count
+        output = FitsFile.create(path, image.shape[1], image.shape[0], bitpix=-32, extra_header=header)
+        for start_row in range(0, image.shape[0], Constants.LOCAL_ANALYSIS_BAND_ROWS):
+            output.write_rows(start_row, image[start_row:start_row + Constants.LOCAL_ANALYSIS_BAND_ROWS])
+        output.flush()
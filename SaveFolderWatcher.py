@@ -0,0 +1,174 @@
+#
+#   Watch the folder where frames are being saved, and hand each newly saved FITS file to the
+#   stages that process saved frames (compression, catalog, previews, ...), so none of them has
+#   to scan the folder or work out the file names for itself.
+#
+#   On Linux the kernel tells us, through inotify, when a file written in the folder is closed
+#   or a file is renamed into it.  Elsewhere (or if inotify can't be used) the folder is polled,
+#   and a new file is taken as complete once its size and time stamp have stopped changing.
+#
+#   Files are only of interest if they are FITS files (.fit or .fits); candidate frames still
+#   waiting to be accepted and temporary files are ignored.  Found files go into a bounded queue
+#   and a second thread passes them to the consumers in the order they were saved.
+#
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+from typing import Callable, Optional
+
+from Constants import Constants
+
+
+class SaveFolderWatcher:
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct("iIII")    # Watch descriptor, mask, cookie, name length
+
+    def __init__(self, directory: str):
+        self._directory: str = directory
+        self._consumers: [Callable[[str], None]] = []
+        self._queue: queue.Queue = queue.Queue(maxsize=Constants.SAVE_WATCHER_QUEUE_SIZE)
+        self._stopping = threading.Event()
+        self._watch_thread: Optional[threading.Thread] = None
+        self._dispatch_thread: Optional[threading.Thread] = None
+        self._using_inotify: bool = False
+
+    def get_directory(self) -> str:
+        return self._directory
+
+    def is_using_inotify(self) -> bool:
+        return self._using_inotify
+
+    def add_consumer(self, consumer: Callable[[str], None]):
+        """Add a function to be called with the path of each newly saved frame"""
+        self._consumers.append(consumer)
+
+    def start(self):
+        """Start watching the folder"""
+        self._stopping.clear()
+        self._watch_thread = threading.Thread(target=self.watch, name="SaveFolderWatcher", daemon=True)
+        self._dispatch_thread = threading.Thread(target=self.dispatch, name="SaveFolderDispatch", daemon=True)
+        self._watch_thread.start()
+        self._dispatch_thread.start()
+
+    # Stop watching.  Files saved before this call are still handed to the consumers,
+    # and this waits until they all have been.
+
+    def stop(self):
+        """Stop watching, after passing on all the files already saved"""
+        self._stopping.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join()
+            self._watch_thread = None
+        if self._dispatch_thread is not None:
+            self._queue.put(None)  # Tells the dispatcher there is nothing more
+            self._dispatch_thread.join()
+            self._dispatch_thread = None
+
+    @staticmethod
+    def is_frame_file(name: str) -> bool:
+        """Is this the name of a saved frame we are interested in?"""
+        return name.lower().endswith((".fit", ".fits")) \
+            and not name.startswith(Constants.CANDIDATE_FRAME_PREFIX)
+
+    def frame_found(self, name: str):
+        """Queue a newly-saved frame for the consumers"""
+        if self.is_frame_file(name):
+            self._queue.put(os.path.join(self._directory, name))
+
+    def watch(self):
+        if not self.watch_with_inotify():
+            self.watch_by_polling()
+
+    # Watch using Linux inotify, called through ctypes.  Return False if it isn't available.
+
+    def watch_with_inotify(self) -> bool:
+        """Report files closed after writing, or renamed into the folder, as the kernel tells us"""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            inotify_add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError, TypeError):
+            return False
+        file_descriptor = inotify_init1(self.IN_CLOEXEC)
+        if file_descriptor < 0:
+            return False
+        try:
+            if inotify_add_watch(file_descriptor, os.fsencode(self._directory),
+                                 self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+                return False
+            self._using_inotify = True
+            finished = False
+            while not finished:
+                # Once asked to stop, take what is already waiting and then finish
+                finished = self._stopping.is_set()
+                timeout = 0 if finished else Constants.SAVE_WATCHER_POLL_INTERVAL
+                (readable, _, _) = select.select([file_descriptor], [], [], timeout)
+                if readable:
+                    self.read_inotify_events(os.read(file_descriptor, 64 * 1024))
+                    finished = False
+            return True
+        finally:
+            os.close(file_descriptor)
+
+    def read_inotify_events(self, buffer: bytes):
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(buffer):
+            (_, _, _, name_length) = self.EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self.EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if name:
+                self.frame_found(os.fsdecode(name))
+
+    # Watch by listing the folder periodically.  A new file is complete once its size and
+    # time stamp are the same on two successive looks.  When stopping, new files are complete.
+
+    def watch_by_polling(self):
+        """Report new files that have stopped changing, by listing the folder periodically"""
+        already_seen: {str} = set(self.list_folder().keys())
+        changing: {str: (int, float)} = {}
+        finished = False
+        while not finished:
+            finished = self._stopping.wait(Constants.SAVE_WATCHER_POLL_INTERVAL)
+            for (name, size_and_time) in self.list_folder().items():
+                if name in already_seen:
+                    continue
+                if finished or changing.get(name) == size_and_time:
+                    already_seen.add(name)
+                    changing.pop(name, None)
+                    self.frame_found(name)
+                else:
+                    changing[name] = size_and_time
+
+    def list_folder(self) -> {str: (int, float)}:
+        """Size and modification time of each frame file in the folder"""
+        result: {str: (int, float)} = {}
+        try:
+            with os.scandir(self._directory) as entries:
+                for entry in entries:
+                    if self.is_frame_file(entry.name) and entry.is_file():
+                        status = entry.stat()
+                        result[entry.name] = (status.st_size, status.st_mtime)
+        except OSError:
+            pass
+        return result
+
+    # Pass queued files to the consumers, until told there are no more
+
+    def dispatch(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            for consumer in self._consumers:
+                try:
+                    consumer(path)
+                except Exception as exception:
+                    print(f"Error processing saved frame {path}: {exception}")
+
@@ -0,0 +1,286 @@
+#
+#   Measure the throughput of a flat-frame session, end to end, so changes that make a night's
+#   run slower are noticed.  The real session thread runs against a simulated TheSkyX server
+#   (see SimulatedTheSkyXServer) under a set of scenarios - short and long exposures, slow
+#   downloads, dithering, rejected frames, a slow network, and cancelling part way through.
+#   For each, from the session's own log (see SessionLog), we report:
+#       frames per hour     frames saved per hour of acquisition
+#       overhead per frame  the time per saved frame when the shutter wasn't open on a frame
+#                           we kept, split into waiting for the camera (download and polling),
+#                           exposures of rejected frames, deciding and saving, dithering
+#                           slews, and the rest
+#       time to cancel      from the cancel request to the session having stopped
+#   Results can be saved as a baseline, and later runs compared with it; a run that is slower
+#   than the baseline by more than the tolerance is reported, and the program exits with 1.
+#   Timings depend on the computer, so compare with a baseline made on the same one.
+#
+#   Run from the command line, e.g.
+#       python SessionBenchmark.py --save-baseline
+#       python SessionBenchmark.py --compare
+#       python SessionBenchmark.py --scenario dithered --scenario rejects
+#       python SessionBenchmark.py --scenario slow-network --trace
+#   With --trace, each session's phases and server round trips are also saved as a Chrome
+#   trace file (see SpanTracer), to be opened in a timeline viewer.
+#
+#   The session keeps its files in Qt's test-mode locations, not the user's own, and the
+#   preferences it changes are put back afterwards.
+#
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from time import monotonic
+from typing import Optional
+
+from PyQt5.QtCore import QCoreApplication, QStandardPaths
+
+from Constants import Constants
+from DataModel import DataModel
+from FilterSpec import FilterSpec
+from Preferences import Preferences
+from SessionController import SessionController
+from SessionLog import SessionLog
+from SessionLogReplay import SessionLogReplay
+from SessionThread import SessionThread
+from SharedUtils import SharedUtils
+from SimulatedTheSkyXServer import SimulatedTheSkyXServer
+from SpanTracer import SpanTracer
+from WorkItem import WorkItem
+
+TARGET_ADUS = 25000
+ADU_TOLERANCE = 0.1
+FILTER_SLOT = 1
+BINNING = 1
+BASELINE_FILE = "session-benchmark-baseline.json"
+OVERHEAD_SLACK = 0.05           # Seconds per frame of overhead change ignored as noise
+CANCEL_SLACK = 0.25             # Seconds of time-to-cancel change ignored as noise
+PHASES = ("camera wait", "rejected exposures", "decide and save", "dither slews", "other")
+
+# Each scenario: exposure and download times, dithering and slew time, the fraction of frames
+# spoiled, network latency per command, frames to take, and when to cancel (if it does)
+SCENARIOS: {str: dict} = {
+    "short-exposures": {"exposure": 0.5, "download": 0.5},
+    "long-exposures": {"exposure": 4.0, "download": 0.5},
+    "slow-download": {"exposure": 1.0, "download": 3.0},
+    "dithered": {"exposure": 1.0, "download": 0.5, "dither": True, "slew": 0.5},
+    "rejects": {"exposure": 1.0, "download": 0.5, "reject_rate": 0.25},
+    "slow-network": {"exposure": 1.0, "download": 0.5, "latency": 0.1},
+    "cancel": {"exposure": 5.0, "download": 0.5, "frames": 20, "cancel_after": 8.0},
+}
+
+
+class SessionBenchmark:
+
+    def __init__(self, frames: int, seed: int):
+        self._frames = frames
+        self._seed = seed
+        self._cancel_requested_at: Optional[float] = None
+        self._cancelled_at: Optional[float] = None
+
+    # Run one scenario: a session of one work item against a freshly started simulated server
+
+    def run_scenario(self, scenario: dict) -> dict:
+        """Run a session under the given scenario and measure it"""
+        exposure = scenario["exposure"]
+        preferences = Preferences()
+        preferences.set_defaults()
+        saved_preferences = {key: preferences.value(key) for key in preferences.allKeys()}
+        with tempfile.TemporaryDirectory() as autosave_directory:
+            server = SimulatedTheSkyXServer(adus_per_second=TARGET_ADUS / exposure,
+                                            download_seconds=scenario["download"],
+                                            slew_seconds=scenario.get("slew", 0.0),
+                                            latency=scenario.get("latency", 0.0),
+                                            reject_rate=scenario.get("reject_rate", 0.0),
+                                            autosave_path=autosave_directory,
+                                            seed=self._seed)
+            port = server.start()
+            try:
+                # Start from the right exposure, not whatever earlier runs left behind
+                history_path = os.path.join(SharedUtils.app_data_directory(), Constants.EXPOSURE_HISTORY_FILE)
+                if os.path.exists(history_path):
+                    os.remove(history_path)
+                preferences.update_initial_exposure(FILTER_SLOT, BINNING, exposure)
+                controller = SessionController()
+                session = SessionThread(data_model=self.make_data_model(port, scenario.get("dither", False)),
+                                        preferences=preferences,
+                                        work_items=[self.make_work_item(scenario, preferences)],
+                                        controller=controller,
+                                        server_address="127.0.0.1",
+                                        server_port=port,
+                                        warm_when_done=False)
+                session.consoleLine.connect(self.watch_console)
+                self._cancel_requested_at = None
+                self._cancelled_at = None
+                cancel_timer: Optional[threading.Timer] = None
+                if "cancel_after" in scenario:
+                    cancel_timer = threading.Timer(scenario["cancel_after"], self.cancel, args=(controller,))
+                    cancel_timer.start()
+                session.run_session()
+                if cancel_timer is not None:
+                    cancel_timer.cancel()
+                commands = server.get_command_count()
+            finally:
+                server.stop()
+                preferences.clear()
+                for (key, value) in saved_preferences.items():
+                    preferences.setValue(key, value)
+                preferences.sync()
+        log_path = session.get_session_log_path()
+        (_, totals) = SessionLogReplay(SessionLog.read_events(log_path)).timing_totals()
+        os.remove(log_path)
+        if SpanTracer.is_enabled():
+            print(f"   Trace saved in {session.get_trace_path()}")
+        return self.measurements(totals, commands)
+
+    def make_data_model(self, port: int, dither: bool) -> DataModel:
+        data_model = DataModel()
+        data_model.set_target_adus(TARGET_ADUS)
+        data_model.set_adu_tolerance(ADU_TOLERANCE)
+        data_model.set_server_address("127.0.0.1")
+        data_model.set_port_number(port)
+        data_model.set_use_filter_wheel(True)
+        data_model.set_save_files_locally(False)
+        data_model.set_warm_when_done(False)
+        data_model.set_control_mount(dither)
+        data_model.set_home_mount(False)
+        data_model.set_slew_to_light_source(False)
+        data_model.set_tracking_off(False)
+        data_model.set_park_when_done(False)
+        data_model.set_dither_flats(dither)
+        return data_model
+
+    def make_work_item(self, scenario: dict, preferences: Preferences) -> WorkItem:
+        return WorkItem(scenario.get("frames", self._frames), FilterSpec(FILTER_SLOT, "Luminance", True),
+                        BINNING, TARGET_ADUS, ADU_TOLERANCE, preferences)
+
+    def cancel(self, controller: SessionController):
+        self._cancel_requested_at = monotonic()
+        controller.cancel_thread()
+
+    def watch_console(self, message: str, _level: int):
+        if message == "Session Cancelled":
+            self._cancelled_at = monotonic()
+
+    # Turn the session log's time totals into the measurements we report
+
+    def measurements(self, totals: dict, commands: int) -> dict:
+        saved = totals["saved"]
+        acquiring = 0.0
+        if totals["acquiring_from"] is not None and totals["acquiring_to"] is not None:
+            acquiring = totals["acquiring_to"] - totals["acquiring_from"]
+        accounted = totals["expose"] + totals["decide"] + totals["slew"]
+        phases = {"camera wait": totals["expose"] - totals["shutter"],
+                  "rejected exposures": totals["rejected_shutter"],
+                  "decide and save": totals["decide"],
+                  "dither slews": totals["slew"],
+                  "other": acquiring - accounted}
+        result = {"frames_saved": saved,
+                  "frames_taken": totals["frames"],
+                  "frames_per_hour": saved * 3600.0 / acquiring if acquiring > 0 else 0.0,
+                  "overhead_per_frame": {phase: seconds / saved if saved > 0 else 0.0
+                                         for (phase, seconds) in phases.items()},
+                  "commands_per_frame": commands / totals["frames"] if totals["frames"] > 0 else 0.0,
+                  "cancel_seconds": None}
+        if self._cancel_requested_at is not None and self._cancelled_at is not None:
+            result["cancel_seconds"] = self._cancelled_at - self._cancel_requested_at
+        return result
+
+    # Compare results with a baseline; return a description of each regression
+
+    @staticmethod
+    def regressions(results: {str: dict}, baseline: {str: dict}, tolerance: float) -> [str]:
+        """Find the ways the results are worse than the baseline by more than the tolerance"""
+        found: [str] = []
+        for (name, result) in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result["frames_per_hour"] < base["frames_per_hour"] * (1.0 - tolerance):
+                found.append(f"{name}: {result['frames_per_hour']:.0f} frames per hour, "
+                             f"baseline {base['frames_per_hour']:.0f}")
+            overhead = sum(result["overhead_per_frame"].values())
+            base_overhead = sum(base["overhead_per_frame"].values())
+            if result["frames_saved"] > 0 and overhead > base_overhead * (1.0 + tolerance) + OVERHEAD_SLACK:
+                found.append(f"{name}: {overhead:.2f} s overhead per frame, baseline {base_overhead:.2f} s")
+            if result["cancel_seconds"] is not None and base["cancel_seconds"] is not None \
+                    and result["cancel_seconds"] > base["cancel_seconds"] * (1.0 + tolerance) + CANCEL_SLACK:
+                found.append(f"{name}: {result['cancel_seconds']:.2f} s to cancel, "
+                             f"baseline {base['cancel_seconds']:.2f} s")
+        return found
+
+    @staticmethod
+    def report(name: str, result: dict, baseline: Optional[dict]) -> [str]:
+        cancel = "" if result["cancel_seconds"] is None else f", {result['cancel_seconds']:.2f} s to cancel"
+        lines = [f"{name}: {result['frames_saved']} of {result['frames_taken']} frames saved, "
+                 f"{result['frames_per_hour']:.0f} frames per hour, "
+                 f"{result['commands_per_frame']:.1f} commands per frame{cancel}"]
+        if baseline is not None:
+            lines[0] += f" (baseline {baseline['frames_per_hour']:.0f} frames per hour)"
+        lines.append(f"   Overhead per frame {sum(result['overhead_per_frame'].values()):7.3f} s")
+        for phase in PHASES:
+            lines.append(f"      {phase:<20} {result['overhead_per_frame'][phase]:7.3f} s")
+        return lines
+
+
+def main(arguments: [str]) -> int:
+    parser = argparse.ArgumentParser(description="Measure flat-frame session throughput")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS.keys()),
+                        help="Scenario to run (repeat for several; default all)")
+    parser.add_argument("--frames", type=int, default=6, help="Frames per session")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the simulated server")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_FILE, metavar="FILE",
+                        help="Save the results as the baseline")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_FILE, metavar="FILE",
+                        help="Compare the results with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Fraction by which results may be worse than the baseline")
+    parser.add_argument("--trace", action="store_true", help="Save a trace of each session's phases")
+    options = parser.parse_args(arguments)
+    if options.trace:
+        SpanTracer.enable()
+
+    QStandardPaths.setTestModeEnabled(True)
+    _application = QCoreApplication(sys.argv[:1])
+    baseline: {str: dict} = {}
+    if options.compare is not None:
+        with open(options.compare, "r", encoding="utf-8") as baseline_file:
+            saved_baseline = json.load(baseline_file)
+        baseline = saved_baseline["scenarios"]
+        if saved_baseline.get("frames") != options.frames:
+            print(f"Baseline was run with {saved_baseline.get('frames')} frames per session, not {options.frames}")
+
+    benchmark = SessionBenchmark(options.frames, options.seed)
+    results: {str: dict} = {}
+    for name in options.scenario or SCENARIOS.keys():
+        print(f"Running {name} ...", flush=True)
+        results[name] = benchmark.run_scenario(SCENARIOS[name])
+    print()
+    for (name, result) in results.items():
+        for line in benchmark.report(name, result, baseline.get(name)):
+            print(line)
+
+    if options.save_baseline is not None:
+        with open(options.save_baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"),
+                       "platform": platform.platform(),
+                       "python": platform.python_version(),
+                       "frames": options.frames,
+                       "scenarios": results}, baseline_file, indent=2)
+        print(f"\nBaseline saved in {options.save_baseline}")
+    if options.compare is not None:
+        regressions = SessionBenchmark.regressions(results, baseline, options.tolerance)
+        print()
+        for regression in regressions:
+            print(f"SLOWER  {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {options.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
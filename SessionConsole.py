@@ -1,11 +1,10 @@
-from time import strftime
-
-from PyQt5 import uic
-from PyQt5.QtCore import Qt, QThread, QMutex, QItemSelection, QModelIndex, QItemSelectionModel, QEvent, QObject
-from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import QDialog, QListWidgetItem
+from PyQt5.QtCore import Qt, QThread, QMutex, QItemSelection, QModelIndex, QItemSelectionModel, QEvent, QObject, \
+    QThreadPool
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QDialog
 
 from BinningSpec import BinningSpec
+from ConsoleLogModel import ConsoleLogModel
 from Constants import Constants
 from DataModel import DataModel
 from FilterSpec import FilterSpec
@@ -14,6 +13,7 @@ from Preferences import Preferences
 from SessionController import SessionController
 from SessionPlanTableModel import SessionPlanTableModel
 from SessionThread import SessionThread
+from ThumbnailCache import ThumbnailCache, ThumbnailTask
 from WorkItem import WorkItem
 from WorkItemTableModel import WorkItemTableModel
 
@@ -35,7 +35,7 @@ class SessionConsole(QDialog):
         self._table_model = table_model
         self._preferences = preferences
 
-        self.ui = uic.loadUi(SharedUtils.path_for_file_in_program_directory("SessionConsole.ui"))
+        self.ui = SharedUtils.load_ui("SessionConsole.ui")
 
         self.ui.setWindowFlags(Qt.Window | Qt.WindowTitleHint | Qt.CustomizeWindowHint
                                | Qt.WindowMinMaxButtonsHint)
@@ -60,8 +60,16 @@ class SessionConsole(QDialog):
         self.ui.sessionTable.resizeColumnsToContents()
         self.ui.sessionTable.setVisible(True)
 
-        # Initially we don't want to see the progress bar
+        # Console messages, in a bounded list that keeps the view at the newest line
+        self._console_model = ConsoleLogModel(self._preferences.get_standard_font_size())
+        self.ui.consoleList.setModel(self._console_model)
+        self._console_model.rowsInserted.connect(self.ui.consoleList.scrollToBottom)
+        self.ui.consoleDetail.currentIndexChanged.connect(self.console_detail_changed)
+
+        # Initially we don't want to see the progress bar, or a preview until there is one
         self.ui.progressBar.setVisible(False)
+        self.ui.previewImage.setVisible(False)
+        self._thumbnail_cache = ThumbnailCache(SharedUtils.app_data_directory(Constants.THUMBNAIL_DIRECTORY))
 
         # Button responders
         self.ui.closeButton.clicked.connect(self.close_button_clicked)
@@ -78,15 +86,6 @@ class SessionConsole(QDialog):
         self.ui.showADUs.setChecked(self._session_controller.get_show_adus())
         self.ui.showADUs.clicked.connect(self.show_adus_clicked)
 
-        # Set font sizes of all elements using fonts to the saved font size
-        standard_font_size = self._preferences.get_standard_font_size()
-        SharedUtils.set_font_sizes(parent=self.ui,
-                                   standard_size=standard_font_size,
-                                   title_prefix=Constants.MAIN_TITLE_LABEL_PREFIX,
-                                   title_increment=Constants.MAIN_TITLE_FONT_SIZE_INCREMENT,
-                                   subtitle_prefix=Constants.SUBTITLE_LABEL_PREFIX,
-                                   subtitle_increment=Constants.SUBTITLE_FONT_SIZE_INCREMENT
-                                   )
 
         # Create and start the thread that does the actual frame acquisition
         self._session_thread: SessionThread = SessionThread(data_model=self._data_model,
@@ -114,6 +113,7 @@ class SessionConsole(QDialog):
         self._session_thread.updateProgressBar.connect(self.update_progress_bar)
         self._session_thread.finishProgressBar.connect(self.finish_progress_bar)
         self._session_thread.framesComplete.connect(self.display_frames_complete)
+        self._session_thread.frameSaved.connect(self.frame_saved)
 
         # Run the thread
         self._thread.start()
@@ -192,29 +192,22 @@ class SessionConsole(QDialog):
         """Respond to show-adus checkbox"""
         self._session_controller.set_show_adus(self.ui.showADUs.isChecked())
 
-    # A signal has come from the thread to display a line in the console frame
+    # A signal has come from the thread to display a line in the console frame.
+    # The model adds it to the list with any others arriving at about the same time.
     def console_line(self, message: str, level: int):
         """Receive signal from worker to add a line to the console frame"""
         self._signal_mutex.lock()
-        time_formatted = strftime("%H:%M:%S ")
-        indent_string = ""
-        if level > 1:
-            indentation_block = " " * Constants.SESSION_CONSOLE_INDENTATION_DEPTH
-            indent_string = indentation_block * (level - 1)
-
-        # Create the text line to go in the console
-        list_item: QListWidgetItem = QListWidgetItem(time_formatted + " " + indent_string + message)
-
-        # Set its font size according to the settings
-        item_font: QFont = list_item.font()
-        item_font.setPointSize(self._preferences.get_standard_font_size())
-        list_item.setFont(item_font)
-
-        # Add to bottom of console and scroll to it
-        self.ui.consoleList.addItem(list_item)
-        self.ui.consoleList.scrollToItem(list_item)
+        self._console_model.append(message, level)
         self._signal_mutex.unlock()
 
+    # The console detail selection has changed.  The choices, in order, show all messages,
+    # messages up to level 2 (frames), and level 1 only (work items).
+
+    def console_detail_changed(self, choice_index: int):
+        """Show only the console messages at the chosen level of detail"""
+        self._console_model.set_maximum_level(Constants.CONSOLE_DETAIL_LEVELS[choice_index])
+        self.ui.consoleList.scrollToBottom()
+
     # Signal from worker thread to start a progress bar with given maximum range
 
     def start_progress_bar(self, bar_max: int):
@@ -234,6 +227,24 @@ class SessionConsole(QDialog):
     def display_frames_complete(self, row_index: int, frames_complete: int):
         """Display the number of frames complete for the given row index in the table"""
         self._work_items_table_model.set_frames_complete(row_index, frames_complete)
+
+    # A frame has been saved and its thumbnail made.  Fetch it on the thread pool, so
+    # reading it doesn't hold up the UI, and show it when it arrives.
+
+    def frame_saved(self, path: str):
+        """Start fetching the preview of a newly saved frame"""
+        task = ThumbnailTask(self._thumbnail_cache, path)
+        task.signals.ready.connect(self.show_preview)
+        QThreadPool.globalInstance().start(task)
+
+    def show_preview(self, path: str, image: QImage):
+        """Show the preview thumbnail of a saved frame"""
+        pixmap = QPixmap.fromImage(image).scaled(self.ui.previewImage.width(), self.ui.previewImage.height(),
+                                                 Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.ui.previewImage.setPixmap(pixmap)
+        self.ui.previewImage.setToolTip(path)
+        self.ui.previewImage.setVisible(True)
+
     # Catch window resizing so we can record the changed size
 
     def eventFilter(self, event_object: QObject, event: QEvent) -> bool:
@@ -0,0 +1,108 @@
+#
+#   Structured log of a session, so a slow or troubled night can be examined afterwards.
+#   Each event is one line of JSON: its type, the time in seconds since the session started,
+#   and the event's own fields.  Times come from the monotonic clock, so they are not upset by
+#   the computer's clock being adjusted; the wall-clock start time is in the first event.
+#   Everything shown in the session console is logged too, as "console" events, so the console
+#   view can be rebuilt from the log (see SessionLogReplay).
+#
+#   The session thread must not wait for the disk, so events are put in a queue and a
+#   background thread writes them, as many as are waiting at once, and flushes after each batch.
+#
+import json
+import queue
+import threading
+from datetime import datetime
+from time import monotonic
+from typing import Optional
+
+
+class SessionLog:
+    # Event types
+    SESSION_STARTED = "session_started"
+    SESSION_ENDED = "session_ended"
+    WORK_ITEM_STARTED = "work_item_started"
+    FRAME_STARTED = "frame_started"
+    FRAME_MEASURED = "frame_measured"
+    FRAME_ACCEPTED = "frame_accepted"
+    FRAME_REJECTED = "frame_rejected"
+    FRAME_SAVED = "frame_saved"
+    SLEW = "slew"
+    MASTER_FLAT = "master_flat"
+    TELEMETRY = "telemetry"
+    ERROR = "error"
+    CONSOLE = "console"
+
+    def __init__(self, log_path: str, **session_fields):
+        self._log_path: str = log_path
+        self._start: float = monotonic()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file = open(log_path, "w", encoding="utf-8")
+        self._writer = threading.Thread(target=self.write_events, name="SessionLogWriter", daemon=True)
+        self._writer.start()
+        self.event(self.SESSION_STARTED, wall_time=datetime.now().isoformat(timespec="seconds"), **session_fields)
+
+    def get_log_path(self) -> str:
+        return self._log_path
+
+    # Log an event.  Never waits for the disk.
+
+    def event(self, event_type: str, **fields):
+        """Add an event of the given type, with the given fields, to the log"""
+        record = {"event": event_type, "t": round(monotonic() - self._start, 4)}
+        record.update(fields)
+        self._queue.put(record)
+
+    def console_line(self, message: str, level: int):
+        """Log a line shown in the session console"""
+        self.event(self.CONSOLE, level=level, text=message)
+
+    # Finish writing the events logged, and close the file
+
+    def close(self):
+        """Write out the remaining events and close the log"""
+        if self._writer is not None:
+            self.event(self.SESSION_ENDED)
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+            self._file.close()
+
+    # The background writer: take whatever events are waiting, write them, and flush
+
+    def write_events(self):
+        finished = False
+        while not finished:
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get())
+            lines = []
+            for record in batch:
+                if record is None:
+                    finished = True
+                else:
+                    lines.append(json.dumps(record, default=str) + "\n")
+            try:
+                self._file.writelines(lines)
+                self._file.flush()
+            except OSError as exception:
+                print(f"Unable to write session log {self._log_path}: {exception}")
+
+    # Read back a log, for replay and analysis.  A line cut short by a crash is skipped.
+
+    @staticmethod
+    def read_events(log_path: str) -> [dict]:
+        """Read the events from a session log file"""
+        events: [dict] = []
+        with open(log_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    pass
+        return events
+
+    @staticmethod
+    def find_event(events: [dict], event_type: str) -> Optional[dict]:
+        """The first event of the given type, if there is one"""
+        return next((event for event in events if event["event"] == event_type), None)
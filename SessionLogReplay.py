@@ -0,0 +1,144 @@
+#
+#   Replay a structured session log (see SessionLog): print the console as it was shown during
+#   the session, with the time of each line, then an analysis of where the session's time went.
+#
+#       python SessionLogReplay.py <session log file> [--no-console]
+#
+#   The analysis splits each frame's time into the exposure-and-download (frame started to
+#   frame measured), the decision and save (measured to saved or rejected), and dithering slews,
+#   and shows the frames rejected and why, per work item and for the whole session.
+#
+import sys
+from collections import Counter
+
+from SessionLog import SessionLog
+
+
+class SessionLogReplay:
+
+    def __init__(self, events: [dict]):
+        self._events: [dict] = events
+
+    def get_events(self) -> [dict]:
+        return self._events
+
+    # The console lines, indented by level as the console shows them, with session times
+
+    def console_view(self) -> [str]:
+        """Regenerate the session console from the log"""
+        return [f"{self.format_time(event['t'])}  {'   ' * (event['level'] - 1)}{event['text']}"
+                for event in self._events if event["event"] == SessionLog.CONSOLE]
+
+    # Where the time went.  Each work item, and the session as a whole, gets a summary.
+
+    def timing_analysis(self) -> [str]:
+        """Summarize where the session's time was spent"""
+        lines: [str] = []
+        (work_items, totals) = self.timing_totals()
+        for (work_item, item_totals) in work_items:
+            lines += self.summarize(self.work_item_title(work_item), item_totals)
+        lines += self.summarize("Whole session", totals)
+        return lines
+
+    # The time totals for each work item (with the event that started it) and for the session
+
+    def timing_totals(self) -> ([(dict, dict)], dict):
+        """Add up where the time went, per work item and for the whole session"""
+        work_items: [(dict, dict)] = []
+        totals = self.new_totals()
+        item_totals = self.new_totals()
+        frame_started: float = 0.0
+        frame_measured: float = 0.0
+        exposure: float = 0.0
+        for event in self._events:
+            kind = event["event"]
+            time = event["t"]
+            if kind == SessionLog.WORK_ITEM_STARTED:
+                item_totals = self.new_totals()
+                work_items.append((event, item_totals))
+                if totals["acquiring_from"] is None:
+                    totals["acquiring_from"] = time
+            elif kind == SessionLog.FRAME_STARTED:
+                frame_started = time
+                exposure = event["exposure"]
+                for running in (totals, item_totals):
+                    running["frames"] += 1
+            elif kind == SessionLog.FRAME_MEASURED:
+                frame_measured = time
+                for running in (totals, item_totals):
+                    running["shutter"] += exposure
+                    running["expose"] += time - frame_started
+            elif kind in (SessionLog.FRAME_SAVED, SessionLog.FRAME_REJECTED):
+                totals["acquiring_to"] = time
+                for running in (totals, item_totals):
+                    running["decide"] += time - frame_measured
+                    if kind == SessionLog.FRAME_SAVED:
+                        running["saved"] += 1
+                    else:
+                        running["rejections"][event["reason"]] += 1
+                        running["rejected_shutter"] += exposure
+            elif kind == SessionLog.SLEW:
+                for running in (totals, item_totals):
+                    running["slews"] += 1
+                    running["slew"] += event["seconds"]
+            elif kind == SessionLog.ERROR:
+                for running in (totals, item_totals):
+                    running["errors"] += 1
+        if self._events:
+            totals["elapsed"] = self._events[-1]["t"]
+        return work_items, totals
+
+    # "acquiring_from" and "acquiring_to" are the session times of the start of the first work
+    # item and the end of the last frame, so the session's setup and wind-down aren't counted
+
+    @staticmethod
+    def new_totals() -> dict:
+        return {"frames": 0, "saved": 0, "rejections": Counter(), "errors": 0, "slews": 0,
+                "shutter": 0.0, "rejected_shutter": 0.0, "expose": 0.0, "decide": 0.0, "slew": 0.0,
+                "elapsed": None, "acquiring_from": None, "acquiring_to": None}
+
+    @staticmethod
+    def work_item_title(event: dict) -> str:
+        return f"Work item {event['index'] + 1}: {event['frames']} x {event['filter']} " \
+               f"binned {event['binning']} x {event['binning']}"
+
+    def summarize(self, title: str, totals: dict) -> [str]:
+        lines = [title,
+                 f"   {totals['frames']} frames taken, {totals['saved']} saved, "
+                 f"{sum(totals['rejections'].values())} rejected, {totals['errors']} errors",
+                 f"   Shutter open      {self.format_time(totals['shutter'])}",
+                 f"   Expose+download   {self.format_time(totals['expose'])}",
+                 f"   Decide and save   {self.format_time(totals['decide'])}",
+                 f"   Dither slews      {self.format_time(totals['slew'])} in {totals['slews']} slews"]
+        if totals["elapsed"] is not None:
+            lines.append(f"   Elapsed           {self.format_time(totals['elapsed'])}")
+        for (reason, count) in totals["rejections"].most_common():
+            lines.append(f"   Rejected {count} for {reason}")
+        return lines
+
+    @staticmethod
+    def format_time(seconds: float) -> str:
+        (minutes, seconds) = divmod(seconds, 60.0)
+        (hours, minutes) = divmod(int(minutes), 60)
+        return f"{hours:d}:{minutes:02d}:{seconds:06.3f}"
+
+
+def main(arguments: [str]) -> int:
+    if len(arguments) < 1:
+        print("Usage: SessionLogReplay.py <session log file> [--no-console]")
+        return 1
+    replay = SessionLogReplay(SessionLog.read_events(arguments[0]))
+    started = SessionLog.find_event(replay.get_events(), SessionLog.SESSION_STARTED)
+    if started is not None:
+        print(f"Session started {started.get('wall_time')} at server {started.get('server')}")
+    if "--no-console" not in arguments:
+        for line in replay.console_view():
+            print(line)
+        print()
+    for line in replay.timing_analysis():
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,13 +1,12 @@
-from typing import Callable
+from typing import Callable, Optional
 
 from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QVariant
-from PyQt5.QtGui import QFont, QColor, QBrush
 
 from BinningSpec import BinningSpec
 from DataModel import DataModel
 from FilterSpec import FilterSpec
 from Preferences import Preferences
-from SharedUtils import SharedUtils
+from TableStyleCache import TableStyleCache
 from Validators import Validators
 
 
@@ -23,14 +22,22 @@ class SessionPlanTableModel(QAbstractTableModel):
         self._data_model: DataModel = data_model
         self._preferences: Preferences = preferences
 
+        # Header strings, made when first needed
+        self._horizontal_headers: Optional[[str]] = None
+        self._vertical_headers: Optional[[str]] = None
+
         self._cell_validity = [[True for _row in range(self.columnCount(QModelIndex()))]
                                for _col in range(self.rowCount(QModelIndex()))]
 
         # Check validity of all cells on loading in case bad data were saved
         self.prevalidate_all_cells()
 
+    # Record whether a cell is valid, and have it repainted if that has changed its colour
+
     def set_cell_validity(self, index: QModelIndex, validity: bool):
-        self._cell_validity[index.row()][index.column()] = validity
+        if self._cell_validity[index.row()][index.column()] != validity:
+            self._cell_validity[index.row()][index.column()] = validity
+            self.dataChanged.emit(index, index, [Qt.BackgroundRole])
 
     # We've just loaded data for a table.  In case the data we were handed contained
     # any invalid cells, we'll re-do the validation for all of them.  In order to display
@@ -87,15 +94,11 @@ class SessionPlanTableModel(QAbstractTableModel):
                                                                                       raw_column_index))
         elif role == Qt.FontRole:
             # Font information for the data in this cell
-            standard_font_size = self._preferences.get_standard_font_size()
-            font = QFont()
-            font.setPointSize(standard_font_size)
-            result = font
+            result = TableStyleCache.cell_font(self._preferences)
         elif role == Qt.BackgroundRole:
             # What colour should this cell be?
             # Either red, if we've detected an error, or white
-            cell_colour: QColor = SharedUtils.valid_or_error_field_color(self._cell_validity[row_index][column_index])
-            result = QBrush(cell_colour)
+            result = TableStyleCache.validity_brush(self._cell_validity[row_index][column_index])
         else:
             result = QVariant()
         return result
@@ -104,32 +107,24 @@ class SessionPlanTableModel(QAbstractTableModel):
     def headerData(self, item_number, orientation, role):
         result = QVariant()
         if (role == Qt.DisplayRole) and (orientation == Qt.Horizontal):
-            binnings_in_use: [BinningSpec] = self._data_model.get_enabled_binnings()
-            assert (item_number >= 0) and item_number < len(binnings_in_use)
-            binning: int = binnings_in_use[item_number].get_binning_value()
-            return f" {binning} x {binning} "
+            if self._horizontal_headers is None:
+                binnings_in_use: [BinningSpec] = self._data_model.get_enabled_binnings()
+                self._horizontal_headers = [f" {binning.get_binning_value()} x {binning.get_binning_value()} "
+                                            for binning in binnings_in_use]
+            assert (item_number >= 0) and item_number < len(self._horizontal_headers)
+            return self._horizontal_headers[item_number]
         elif (role == Qt.DisplayRole) and (orientation == Qt.Vertical):
             if self._data_model.get_use_filter_wheel():
-                filters_in_use: [FilterSpec] = self._data_model.get_enabled_filters()
-                assert (item_number >= 0) and item_number < len(filters_in_use)
-                fs: FilterSpec = filters_in_use[item_number]
-                return f" {fs.get_slot_number()}: {fs.get_name()} "
+                if self._vertical_headers is None:
+                    filters_in_use: [FilterSpec] = self._data_model.get_enabled_filters()
+                    self._vertical_headers = [f" {fs.get_slot_number()}: {fs.get_name()} " for fs in filters_in_use]
+                assert (item_number >= 0) and item_number < len(self._vertical_headers)
+                return self._vertical_headers[item_number]
             else:
                 return "No filter wheel"
-        elif (role == Qt.FontRole) and (orientation == Qt.Vertical):
-            # Font information for the headers in the left margin
-            standard_font_size = self._preferences.get_standard_font_size()
-            font = QFont()
-            font.setPointSize(standard_font_size)
-            font.setBold(True)
-            result = font
-        elif (role == Qt.FontRole) and (orientation == Qt.Horizontal):
-            # Font information for the headers above the top row
-            standard_font_size = self._preferences.get_standard_font_size()
-            font = QFont()
-            font.setPointSize(standard_font_size)
-            font.setBold(True)
-            result = font
+        elif role == Qt.FontRole:
+            # Font information for the headers in the left margin and above the top row
+            result = TableStyleCache.header_font(self._preferences)
         return result
 
     # Return an indication that the cell is editable
@@ -176,12 +171,23 @@ class SessionPlanTableModel(QAbstractTableModel):
         self._data_model.get_flat_frame_count_table().set_all_to_default()
         self.redraw_table()
 
-    def redraw_table(self):
+    def redraw_table(self, roles: [int] = (Qt.DisplayRole,)):
         """ Force the table to redraw"""
-        top_left: QModelIndex = self.index(0, 0)
-        bottom_right: QModelIndex = self.index(self._data_model.count_enabled_binnings() - 1,
-                                               self._data_model.count_enabled_filters() - 1)
-        self.dataChanged.emit(top_left, bottom_right)
+        rows = self.rowCount(QModelIndex())
+        columns = self.columnCount(QModelIndex())
+        if rows > 0 and columns > 0:
+            top_left: QModelIndex = self.index(0, 0)
+            bottom_right: QModelIndex = self.index(rows - 1, columns - 1)
+            self.dataChanged.emit(top_left, bottom_right, list(roles))
+
+    # The font size has changed: repaint the cells and headers with the new fonts
+
+    def font_size_changed(self):
+        """Redraw the table in the current font size"""
+        TableStyleCache.invalidate()
+        self.redraw_table(roles=(Qt.FontRole,))
+        self.headerDataChanged.emit(Qt.Horizontal, 0, self.columnCount(QModelIndex()) - 1)
+        self.headerDataChanged.emit(Qt.Vertical, 0, self.rowCount(QModelIndex()) - 1)
 
     def restore_defaults(self):
         self._data_model.get_flat_frame_count_table().reset_to_defaults()
@@ -1,5 +1,8 @@
+import os
+import sqlite3
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from time import sleep
+from time import sleep, monotonic, perf_counter
 from typing import Optional
 
 from PyQt5.QtCore import QObject, pyqtSignal
@@ -7,10 +10,27 @@ from PyQt5.QtCore import QObject, pyqtSignal
 from Constants import Constants
 from DataModel import DataModel
 from Ditherer import Ditherer
+from ExposureHistory import ExposureHistory
 from FilterSpec import FilterSpec
+from FitsCompressor import FitsCompressor
+from FlatUniformityChecker import FlatUniformityChecker
+from FrameCatalog import FrameCatalog
+from FrameStatistics import FrameStatistics
+from LocalFrameAnalyzer import LocalFrameAnalyzer
+from MasterFlatBuilder import MasterFlatBuilder
+from OverheadReport import OverheadReport
 from Preferences import Preferences
+from RunningFrameStatistics import RunningFrameStatistics
+from SaveFolderWatcher import SaveFolderWatcher
 from SessionController import SessionController
+from SessionLog import SessionLog
+from SharedUtils import SharedUtils
+from SlewTimeModel import SlewTimeModel
+from SpanTracer import SpanTracer
+from TelemetrySample import TelemetrySample
+from TelemetrySampler import TelemetrySampler
 from TheSkyX import TheSkyX
+from ThumbnailCache import ThumbnailCache
 from WorkItem import WorkItem
 
 
@@ -27,6 +47,7 @@ class SessionThread(QObject):
     updateProgressBar = pyqtSignal(int)  # Update the bar with this value of progress toward maximum
     finishProgressBar = pyqtSignal()  # Finished with progress bar, hide it
     framesComplete = pyqtSignal(int, int)  # Row index, frames complete
+    frameSaved = pyqtSignal(str)  # Path of a newly saved frame, whose preview thumbnail is ready
 
     # frameAcquired = pyqtSignal(FrameSet, int)  # A frame has been successfully acquired
 
@@ -48,11 +69,57 @@ class SessionThread(QObject):
         self._warm_when_done = warm_when_done
         self._last_filter_slot = -1
         self._server = TheSkyX(self._server_address, self._server_port)
+        # Learn how long the mount takes to slew, from the slews done in this session
+        self._slew_time_model = SlewTimeModel(preferences)
+        self._server.set_slew_time_model(self._slew_time_model)
 
         # We maintain a dict of download times indexed by binning, stored in the
         # preferences so the values from last session are our initial guesses this time
         self._download_times: {int: float} = {}
 
+        # When saving locally, each frame is saved under a candidate name and analyzed here;
+        # this is the (candidate, final) path pair for the frame waiting for a decision
+        self._candidate_frame: Optional[(str, str)] = None
+        # Locally-saved frames accepted in the current work item, with their statistics
+        self._accepted_frames: [(str, FrameStatistics)] = []
+        self._master_flat_builder: Optional[MasterFlatBuilder] = None
+        if preferences.get_build_master_flats() and data_model.get_save_files_locally():
+            self._master_flat_builder = MasterFlatBuilder(f"{data_model.get_local_path()}/"
+                                                          + Constants.MASTER_FLAT_DIRECTORY,
+                                                          finished_callback=self.master_flat_finished)
+        # Running per-pixel mean and variance of the current work item's accepted frames
+        self._accumulate_statistics: bool = preferences.get_accumulate_statistics() \
+            and data_model.get_save_files_locally()
+        self._running_statistics: Optional[RunningFrameStatistics] = None
+        self._running_statistics_work_item: Optional[WorkItem] = None
+        self._running_statistics_key: str = ""
+        # Comparison of each locally-saved frame's illumination pattern with the rest of its set
+        self._uniformity_checker: Optional[FlatUniformityChecker] = None
+        if preferences.get_check_uniformity() and data_model.get_save_files_locally():
+            self._uniformity_checker = FlatUniformityChecker()
+        # Watcher of the folder frames are saved in, passing new files to the stages below
+        self._save_folder_watcher: Optional[SaveFolderWatcher] = None
+        self._thumbnail_cache: Optional[ThumbnailCache] = None
+        # Compression of saved frames.  If master flats are being built or running statistics
+        # kept, the frames are read uncompressed after they are saved (and a file being read
+        # can't be removed on Windows), so they are held back until the end of the session.
+        self._compressor: Optional[FitsCompressor] = None
+        self._frames_to_compress_later: [str] = []
+        # Catalog of every frame saved
+        self._frame_catalog: Optional[FrameCatalog] = None
+        self._session_id: str = FrameCatalog.new_session_id()
+        self._last_saved_path: Optional[str] = None
+        # Camera and mount telemetry, collected along with the exposure-complete polls, and
+        # the time the last frame finished, to find the sample nearest to it
+        self._telemetry = TelemetrySampler()
+        self._frame_completed_at: Optional[float] = None
+        # History of every frame's exposure and ADU level, for choosing starting exposures
+        self._exposure_history: Optional[ExposureHistory] = None
+        # Structured log of the session's events, for examining it afterwards
+        self._session_log: Optional[SessionLog] = None
+        # Where each work item's time went, reported at the end of the session
+        self._overhead = OverheadReport()
+
     # Invoked by the thread-start signal after the thread is comfortably running,
     # this is the method that does the actual work of frame acquisition.
     # We're not doing anything about cooling the camera - we assume
@@ -61,13 +128,19 @@ class SessionThread(QObject):
     def run_session(self):
         """Run the flat-frame acquisition thread main program"""
 
+        self.open_session_log()
+        SpanTracer.clear()
         self.consoleLine.emit(f"Session Started at server {self._server_address}:{self._server_port}", 1)
+        self._preferences.begin_exposure_table_cache()
+        self.open_exposure_history()
 
         if self.pre_session_mount_control():
 
             # Time downloads of the binnings in use so we can estimate completion times
             self._download_times = self.measure_download_times()
             ditherer: Optional[Ditherer] = self.set_up_dithering()
+            self.open_frame_catalog()
+            self.start_watching_save_folder()
             # Run through the work list, one item at a time, watching for early
             # exit if cancellation is requested
             work_item_index: int = 0
@@ -79,14 +152,24 @@ class SessionThread(QObject):
                     break
                 work_item_index += 1
                 self.reset_dithering(ditherer)
+            self.report_overhead()
+            self.finish_master_flats()
+            self.stop_watching_save_folder()
+            self.finish_compression()
+            self.close_frame_catalog()
 
             if self._controller.thread_running():
                 # Normal termination (not cancelled) so we can do the warm-up
                 self.handle_warm_up()
                 self.post_session_mount_control()
+            self._slew_time_model.save()
+        self._preferences.end_exposure_table_cache()
+        self.close_exposure_history()
 
         self.consoleLine.emit("Session Ended" if self._controller.thread_running()
                               else "Session Cancelled", 1)
+        self.close_session_log()
+        self.export_trace()
         sleep(Constants.DELAY_AT_FINISH)
         self.finished.emit()
 
@@ -163,7 +246,9 @@ class SessionThread(QObject):
             if success:
                 ditherer = Ditherer(current_alt, current_az,
                                     self._data_model.get_dither_radius(),
-                                    self._data_model.get_dither_max_radius())
+                                    self._data_model.get_dither_max_radius(),
+                                    self._preferences.get_dither_pattern(),
+                                    self._slew_time_model)
                 self.consoleLine.emit(f"Dithering flats: {ditherer}", 1)
             else:
                 ditherer = None
@@ -185,6 +270,15 @@ class SessionThread(QObject):
             if not success:
                 self.consoleLine.emit(f"Error resetting dither: {message}", 1)
 
+    # Knowing how many frames the work item needs, have the ditherer plan the whole
+    # pattern in advance, ordered to keep the dithering slews short.
+    def plan_dithering(self, work_item: WorkItem, ditherer: Optional[Ditherer]):
+        """Precompute an optimized dither path for the frames in this work item"""
+        if ditherer is not None:
+            ditherer.plan(work_item.get_number_of_frames())
+            self.consoleLine.emit(f"Dither path planned, about {ditherer.planned_slew_seconds():.0f} "
+                                  + "seconds of slewing", 2)
+
     # Process the given work item (a number of frames of one spec).
     # If dithering is in use, move scope slightly for each frame, in
     # a pattern controlled by the given dithering object
@@ -201,6 +295,12 @@ class SessionThread(QObject):
         else:
             # Tell the world we are starting this line so UI can highlight that row
             self.startRowIndex.emit(work_item_index)
+            self._overhead.start_work_item(f"{work_item.get_number_of_frames()} x "
+                                           f"{work_item.get_filter_spec().get_name()} binned "
+                                           f"{work_item.get_binning()} x {work_item.get_binning()}")
+            self.log_event(SessionLog.WORK_ITEM_STARTED, index=work_item_index,
+                           filter=work_item.get_filter_spec().get_name(), binning=work_item.get_binning(),
+                           frames=work_item.get_number_of_frames(), target_adus=work_item.get_target_adu())
 
             # Console message about what we're about to do
             if self._data_model.get_use_filter_wheel():
@@ -212,12 +312,18 @@ class SessionThread(QObject):
                                   + f"{work_item.get_binning()} x {work_item.get_binning()}", 1)
 
             # Set up and do the acquisition of the frames for this work item
+            self.plan_dithering(work_item, ditherer)
             if self.connect_camera():
                 if self.connect_filter_wheel():
-                    if self.select_filter(work_item.get_filter_spec()):
+                    with self.phase("filter change"):
+                        filter_selected = self.select_filter(work_item.get_filter_spec())
+                    if filter_selected:
                         self.start_progress_bar(work_item)
                         if self.acquire_frames(work_item_index, work_item, ditherer):
                             success = True
+                            self.start_master_flat(work_item)
+                            self.finish_running_statistics(work_item)
+            self._overhead.finish_work_item()
 
             # If we failed or were cancelled, clean up
         if self._controller.thread_cancelled():
@@ -321,55 +427,110 @@ class SessionThread(QObject):
         binning = work_item.get_binning()
         filter_name = work_item.get_filter_spec().get_name()
         assert FilterSpec.valid_filter_name(filter_name)
-        frames_accepted = 0
         rejected_in_a_row = 0
-        exposure = work_item.initial_exposure_estimate()
+        self._accepted_frames = []
+        # Frames kept by an earlier, interrupted run of this set count towards it
+        frames_accepted = self.begin_running_statistics(work_item)
+        if frames_accepted > 0:
+            self.updateProgressBar.emit(frames_accepted)
+            self.framesComplete.emit(work_item_index, frames_accepted)
+        if self._uniformity_checker is not None:
+            self._uniformity_checker.reset()
+        self._telemetry.request_sample()
+        exposure = work_item.initial_exposure_estimate(self._exposure_history)
         success = True
         # Loop for the desired number of frames or until cancel or failure
         repeat_try = False
 
         while (frames_accepted < work_item.get_number_of_frames()) and success and self._controller.thread_running():
+            (frame_started, frame_sequence) = (perf_counter(), frames_accepted + 1)
+            self._overhead.start_frame()
             # Set scope location if dithering is in use
             if repeat_try:
                 # We don't do a dither move if we are trying again on a given frame after an ADU failure
                 pass
             else:
                 # This is a new frame, not a retry, so do a dither move
-                success = self.dither_next_frame(ditherer)
+                with self.phase("dither"):
+                    success = self.dither_next_frame(ditherer)
             if success:
                 repeat_try = False
-                # Acquire one frame, saving to disk, and get its average adu value
+                # Acquire one frame, saving to disk, and get its average adu value and other statistics
                 self.consoleLine.emit(f"Exposing frame {frames_accepted + 1} for {exposure:.2f} seconds.", 2)
-                (success, frame_adus, message) = self.take_one_flat_frame(exposure, binning, autosave_file=False)
+                self.log_event(SessionLog.FRAME_STARTED, sequence=frames_accepted + 1, filter=filter_name,
+                               binning=binning, exposure=exposure)
+                (success, frame_statistics, message) = self.take_one_flat_frame(exposure, binning,
+                                                                                autosave_file=False,
+                                                                                filter_name=filter_name,
+                                                                                sequence=frames_accepted + 1)
+                frame_adus = frame_statistics.get_mean()
                 if success:
-                    # Is this frame within acceptable adu range?
-                    if self.adus_within_tolerance(work_item, frame_adus):
+                    self.log_event(SessionLog.FRAME_MEASURED, sequence=frames_accepted + 1, adus=frame_adus,
+                                   median=frame_statistics.get_median(),
+                                   standard_deviation=frame_statistics.get_standard_deviation(),
+                                   saturated_fraction=frame_statistics.get_saturated_fraction())
+                    self.record_exposure_history(work_item, exposure, frame_statistics)
+                    # Is this frame within acceptable adu range, and otherwise a good flat?  Only
+                    # then is its illumination pattern worth checking.
+                    adus_acceptable = self.adus_within_tolerance(work_item, frame_adus, frame_statistics)
+                    illumination_problem = self.illumination_problem() if adus_acceptable else None
+                    if adus_acceptable and illumination_problem is None:
+                        self.log_event(SessionLog.FRAME_ACCEPTED, sequence=frames_accepted + 1)
                         if self._controller.get_show_adus():
                             self.consoleLine.emit(f"{frame_adus:,.0f} ADUs: Close enough, keeping this frame.", 3)
-                        (success, message) = self.save_acquired_frame(filter_name, exposure,
-                                                                      binning, frames_accepted + 1)
+                            self.consoleLine.emit(f"{frame_statistics}", 4)
+                        with self.phase("save"):
+                            (success, message) = self.save_acquired_frame(filter_name, exposure,
+                                                                          binning, frames_accepted + 1,
+                                                                          frame_statistics)
                         if success:
+                            self._overhead.frame_kept(exposure)
+                            telemetry = self.frame_telemetry()
+                            self.log_event(SessionLog.FRAME_SAVED, sequence=frames_accepted + 1,
+                                           path=self._last_saved_path,
+                                           telemetry=None if telemetry is None else telemetry.as_dict())
+                            if self._uniformity_checker is not None:
+                                self._uniformity_checker.accept_last()
+                            self.accumulate_running_statistics()
+                            self.catalog_saved_frame(filter_name, exposure, binning,
+                                                     frame_statistics, ditherer)
                             rejected_in_a_row = 0
                             frames_accepted += 1
                             self.updateProgressBar.emit(frames_accepted)
                             self.framesComplete.emit(work_item_index, frames_accepted)
                         else:
                             self.consoleLine.emit(f"Error saving image file: {message}", 2)
+                            self.log_event(SessionLog.ERROR, operation="save", message=message)
                     else:
+                        self._overhead.frame_rejected()
+                        self.discard_candidate_frame()
                         rejected_in_a_row += 1
-                        self.consoleLine.emit(f"{frame_adus:,.0f} ADUs: Rejected, adjusting exposure.", 3)
+                        problem = self.frame_statistics_problem(frame_statistics)
+                        if problem is None:
+                            problem = illumination_problem
+                        self.log_event(SessionLog.FRAME_REJECTED, sequence=frames_accepted + 1,
+                                       reason=problem if problem is not None else "adus")
+                        if problem is None:
+                            self.consoleLine.emit(f"{frame_adus:,.0f} ADUs: Rejected, adjusting exposure.", 3)
+                        else:
+                            self.consoleLine.emit(f"{frame_adus:,.0f} ADUs: Rejected, {problem}.", 3)
                         repeat_try = True  # Prevent dither on retry
                         if rejected_in_a_row > Constants.MAX_FRAMES_REJECTED_IN_A_ROW:
                             self.consoleLine.emit("Too many rejected frames, stopping session.", 2)
+                            self.log_event(SessionLog.ERROR, operation="acquire", message="too many rejected frames")
                             success = False
                     if success:
-                        exposure = self.refine_exposure(exposure,
-                                                        frame_adus,
-                                                        work_item.get_target_adu(),
-                                                        feedback_messages=False)
-                        work_item.update_initial_exposure_estimate(exposure)
+                        with self.phase("refine"):
+                            exposure = self.refine_exposure(exposure,
+                                                            frame_adus,
+                                                            work_item.get_target_adu(),
+                                                            feedback_messages=False)
+                            work_item.update_initial_exposure_estimate(exposure)
                 else:
                     self.consoleLine.emit(f"Error taking frame: {message}", 2)
+                    self.log_event(SessionLog.ERROR, operation="expose", message=message)
+            SpanTracer.record("frame", "session", frame_started, perf_counter() - frame_started,
+                              {"sequence": frame_sequence})
 
         return success
 
@@ -388,32 +549,475 @@ class SessionThread(QObject):
             (move_scope, to_alt, to_az) = ditherer.next_frame()
             if move_scope:
                 # self.consoleLine.emit(f"  Dithering move to {to_alt:.5f}, {to_az:.5f}", 2)
+                slew_started = monotonic()
                 (success, message) = self._server.start_slew_to(to_alt, to_az, asynchronous=False)
+                self.log_event(SessionLog.SLEW, alt=to_alt, az=to_az, seconds=monotonic() - slew_started,
+                               success=success)
                 if not success:
                     self.consoleLine.emit(f"Error in dithering move: {message}", 2)
+                    self.log_event(SessionLog.ERROR, operation="slew", message=message)
             else:
                 # print("  Scope is on target, don't move")
                 success = True
         return success
 
-    def take_one_flat_frame(self, exposure: float, binning: int, autosave_file: bool) -> (bool, float, str):
+    def take_one_flat_frame(self, exposure: float, binning: int,
+                            autosave_file: bool,
+                            filter_name: str,
+                            sequence: int) -> (bool, FrameStatistics, str):
         """Take a single flat frame with given specs. Start asynchronous then wait for it"""
-        frame_adus = 0
-        (success, message) = self._server.take_flat_frame(exposure, binning,
-                                                          asynchronous=True,
-                                                          autosave_file=autosave_file)
+        frame_statistics = FrameStatistics.from_mean(0)
+        with self.phase("expose"):
+            (success, message) = self._server.take_flat_frame(exposure, binning,
+                                                              asynchronous=True,
+                                                              autosave_file=autosave_file)
         if success:
             wait_time = exposure
             if binning in self._download_times:
                 wait_time += self._download_times[binning]
             else:
                 print(f"Warning: missing binning {binning} in download times {self._download_times}")
-            self.cancellable_wait(wait_time, progress_bar=False)
+            with self.phase("wait"):
+                self.cancellable_wait(wait_time, progress_bar=False)
             success = False
             if self._controller.thread_running():
-                if self.wait_for_camera_to_finish():
-                    (success, frame_adus, message) = self._server.get_adus_from_last_image()
-        return success, frame_adus, message
+                with self.phase("resync"):
+                    camera_finished = self.wait_for_camera_to_finish()
+                if camera_finished:
+                    with self.phase("ADU query"):
+                        (success, frame_statistics, message) = self.measure_acquired_frame(filter_name, exposure,
+                                                                                           binning, sequence)
+        return success, frame_statistics, message
+
+    # Get the statistics of the frame just acquired.  If files are saved on this computer,
+    # save the frame now under a candidate name and analyze the file here - it is the same
+    # single round trip to the server, and we get better statistics.  save_acquired_frame
+    # then just renames the candidate, and a rejected frame's candidate is deleted.
+    # Otherwise (or if the local file can't be analyzed) the server computes the statistics.
+
+    def measure_acquired_frame(self, filter_name: str, exposure: float,
+                               binning: int, sequence: int) -> (bool, FrameStatistics, str):
+        """Get the statistics of the just-acquired frame, locally if possible"""
+        if self._data_model.get_save_files_locally():
+            directory = self._data_model.get_local_path()
+            file_name = self._server.generate_save_file_name(filter_name, exposure, binning, sequence)
+            candidate_path = f"{directory}/{Constants.CANDIDATE_FRAME_PREFIX}{file_name}"
+            (success, message) = self._server.save_acquired_frame_to_path(candidate_path)
+            if not success:
+                return success, FrameStatistics.from_mean(0), message
+            self._candidate_frame = (candidate_path, f"{directory}/{file_name}")
+            try:
+                return True, LocalFrameAnalyzer.analyze(candidate_path), ""
+            except (OSError, ValueError) as exception:
+                self.consoleLine.emit(f"Unable to analyze saved frame locally: {exception}", 3)
+        return self._server.get_statistics_from_last_image()
+
+    # If illumination patterns are being checked, compare the frame just saved as a candidate
+    # with the rest of the set.  Return a description of the problem, or None if it is fine.
+
+    def illumination_problem(self) -> Optional[str]:
+        """Check the just-acquired frame's illumination pattern, if we can"""
+        if self._uniformity_checker is None or self._candidate_frame is None:
+            return None
+        (candidate_path, _) = self._candidate_frame
+        try:
+            return self._uniformity_checker.check(candidate_path)
+        except (OSError, ValueError) as exception:
+            self.consoleLine.emit(f"Unable to check illumination pattern: {exception}", 3)
+            return None
+
+    # Delete the candidate file of a frame we have decided not to keep
+
+    def discard_candidate_frame(self):
+        """Remove the locally-saved candidate file for a rejected frame"""
+        if self._candidate_frame is not None:
+            (candidate_path, _) = self._candidate_frame
+            self._candidate_frame = None
+            try:
+                os.remove(candidate_path)
+            except OSError as exception:
+                print(f"Unable to remove candidate frame {candidate_path}: {exception}")
+
+    # If master flats are being built, start combining the frames just acquired for this
+    # work item.  It runs in the background while we go on to the next work item.
+
+    def start_master_flat(self, work_item: WorkItem):
+        """Start building the master flat for the frames of a completed work item"""
+        if self._master_flat_builder is not None and len(self._accepted_frames) > 0:
+            paths = [path for (path, _) in self._accepted_frames]
+            levels = [statistics.get_median() for (_, statistics) in self._accepted_frames]
+            try:
+                self._master_flat_builder.start_master(work_item.get_filter_spec().get_name(),
+                                                       work_item.get_binning(), paths, levels)
+            except (OSError, ValueError) as exception:
+                self.consoleLine.emit(f"Unable to start master flat: {exception}", 2)
+
+    # If running statistics are being kept, set up the accumulators for a work item.  The
+    # checkpoint left for its filter and binning is resumed if it was made for the same set
+    # (same save folder, filter, binning and target ADUs) and all its frames are still on disk:
+    # those frames are kept, and count towards the work item, so an interrupted set carries on
+    # where it stopped.  Any other checkpoint (e.g. for a different target level) is deleted so
+    # it can't be merged into this set.  Return the number of frames resumed.
+
+    def begin_running_statistics(self, work_item: WorkItem) -> int:
+        """Set up the per-pixel running statistics for a work item, resuming an interrupted set"""
+        self._running_statistics = None
+        if not self._accumulate_statistics:
+            return 0
+        checkpoint_path = self.running_statistics_checkpoint_path(work_item)
+        self._running_statistics_work_item = work_item
+        self._running_statistics_key = self.running_statistics_key(work_item)
+        statistics = RunningFrameStatistics.load_checkpoint(checkpoint_path)
+        resumed_frames = self.resumable_frames(statistics, work_item)
+        if resumed_frames is None:
+            statistics = RunningFrameStatistics()
+            resumed_frames = []
+            self.remove_running_statistics_checkpoint(checkpoint_path)
+        self._running_statistics = statistics
+        self._accepted_frames = resumed_frames
+        if len(resumed_frames) > 0:
+            self.consoleLine.emit(f"Resuming set: {len(resumed_frames)} frames kept earlier", 2)
+        return len(resumed_frames)
+
+    # What a checkpoint must have been made for to be resumed: the same set of flats, described
+    # by what lasts from one run of the program to the next
+
+    def running_statistics_key(self, work_item: WorkItem) -> str:
+        return f"{os.path.normpath(self._data_model.get_local_path())}|{work_item.get_filter_spec().get_name()}|" \
+               f"{work_item.get_binning()}|{work_item.get_target_adu():.0f}"
+
+    # The frames of a checkpoint, with their statistics, if it can be resumed by the given work
+    # item, or None if it can't (wrong set, too many frames, or a frame no longer readable)
+
+    def resumable_frames(self, statistics: RunningFrameStatistics,
+                         work_item: WorkItem) -> Optional[list]:
+        if statistics.get_count() == 0 \
+                or statistics.get_key() != self._running_statistics_key \
+                or statistics.get_count() > work_item.get_number_of_frames():
+            return None
+        try:
+            return [(path, LocalFrameAnalyzer.analyze(path)) for path in statistics.get_frame_paths()]
+        except (OSError, ValueError) as exception:
+            self.consoleLine.emit(f"Not resuming earlier frames: {exception}", 2)
+            return None
+
+    def running_statistics_checkpoint_path(self, work_item: WorkItem) -> str:
+        binning = work_item.get_binning()
+        return f"{self._data_model.get_local_path()}/{Constants.MASTER_FLAT_DIRECTORY}/" \
+               + f"{work_item.get_filter_spec().get_name()}-{binning}x{binning}" \
+               + Constants.RUNNING_STATISTICS_CHECKPOINT_SUFFIX
+
+    # Add the frame just accepted and saved to the running statistics
+
+    def accumulate_running_statistics(self):
+        """Update the running statistics with the frame just accepted"""
+        if self._running_statistics is not None and len(self._accepted_frames) > 0:
+            (path, _) = self._accepted_frames[-1]
+            try:
+                self._running_statistics.add_frame(path)
+                if self._running_statistics.get_count() % Constants.RUNNING_STATISTICS_CHECKPOINT_INTERVAL == 0:
+                    self.checkpoint_running_statistics()
+            except (OSError, ValueError) as exception:
+                self.consoleLine.emit(f"Running statistics stopped: {exception}", 2)
+                self._running_statistics = None
+
+    def checkpoint_running_statistics(self):
+        """Save the running statistics so an interrupted work item can be resumed"""
+        if self._running_statistics is not None:
+            path = self.running_statistics_checkpoint_path(self._running_statistics_work_item)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._running_statistics.save_checkpoint(path, self._running_statistics_key)
+            except OSError as exception:
+                print(f"Unable to save statistics checkpoint {path}: {exception}")
+
+    # The work item is complete: write the mean flat and noise map, and drop the checkpoint
+
+    def finish_running_statistics(self, work_item: WorkItem):
+        """Write the mean flat and noise map for a completed work item"""
+        if self._running_statistics is None or self._running_statistics.get_count() == 0:
+            return
+        filter_name = work_item.get_filter_spec().get_name()
+        binning = work_item.get_binning()
+        directory = f"{self._data_model.get_local_path()}/{Constants.MASTER_FLAT_DIRECTORY}"
+        date_and_time_part = datetime.now().strftime("%Y%m%d-%H%M%S")
+        mean_path = f"{directory}/{date_and_time_part}-Mean-Flat-{filter_name}-{binning}x{binning}.fit"
+        noise_path = f"{directory}/{date_and_time_part}-Noise-Map-{filter_name}-{binning}x{binning}.fit"
+        header = {"FILTER": filter_name, "XBINNING": binning, "YBINNING": binning}
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self._running_statistics.write_mean(mean_path, dict(header, IMAGETYP="Mean Flat"))
+            if self._running_statistics.get_count() > 1:
+                self._running_statistics.write_noise(noise_path, dict(header, IMAGETYP="Flat Noise Map"))
+            self.remove_running_statistics_checkpoint(self.running_statistics_checkpoint_path(work_item))
+            self.consoleLine.emit(f"Mean flat and noise map saved "
+                                  f"({self._running_statistics.get_count()} frames)", 2)
+        except (OSError, ValueError) as exception:
+            self.consoleLine.emit(f"Error saving mean flat: {exception}", 2)
+        self._running_statistics = None
+
+    @staticmethod
+    def remove_running_statistics_checkpoint(path: str):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as exception:
+            print(f"Unable to remove statistics checkpoint {path}: {exception}")
+
+    # The stages that process saved frames are fed by watching the save folder.  That is the
+    # local folder if we're saving locally, otherwise TheSkyX's autosave folder if it is
+    # visible from this computer (i.e. TheSkyX is running here).  If it isn't, those stages
+    # can't be used.
+    #   Two stages stay in the acquisition loop instead.  The catalog records what only the loop
+    #   knows about a frame (its statistics, dither offset, telemetry), and must record frames
+    #   even when TheSkyX's folder isn't visible here and there is no watcher; its path is the
+    #   one we told TheSkyX to save to, not a guess.  The running statistics must take frames in
+    #   the order they were accepted, be complete when the work item ends, and match the frames
+    #   its checkpoint lists; they need local saving, where the loop has the frame's path from
+    #   renaming its candidate.  So in autosave mode there are no running statistics, and the
+    #   catalog holds the autosave-folder path as TheSkyX reports it.
+
+    def start_watching_save_folder(self):
+        """Set up the stages processing saved frames, and watch the save folder for them"""
+        compress = self._preferences.get_compress_saved_frames() and FitsCompressor.available()
+        if self._data_model.get_save_files_locally():
+            directory = self._data_model.get_local_path()
+        else:
+            (success, directory, _) = self._server.get_camera_autosave_path()
+            if not success or not os.path.isdir(directory):
+                if compress:
+                    self.consoleLine.emit("Saved frames can't be compressed: "
+                                          "TheSkyX's save folder is not on this computer", 1)
+                return
+        self._save_folder_watcher = SaveFolderWatcher(directory)
+        # Preview first, since compression replaces the file
+        self._thumbnail_cache = ThumbnailCache(SharedUtils.app_data_directory(Constants.THUMBNAIL_DIRECTORY))
+        self._save_folder_watcher.add_consumer(self.preview_saved_frame)
+        if compress:
+            self._compressor = FitsCompressor(compressed_callback=None if self._frame_catalog is None
+                                              else self._frame_catalog.update_path)
+            self._save_folder_watcher.add_consumer(self.compress_saved_frame)
+        self._save_folder_watcher.start()
+
+    def stop_watching_save_folder(self):
+        """Stop watching, once the frames already saved have been passed on"""
+        if self._save_folder_watcher is not None:
+            self._save_folder_watcher.stop()
+            self._save_folder_watcher = None
+
+    # Make the preview thumbnail of a newly saved frame, and tell the console it's ready.
+    # Called by the save folder watcher, on its own thread.
+
+    def preview_saved_frame(self, path: str):
+        """Make the thumbnail of a saved frame for the console to show"""
+        self._thumbnail_cache.thumbnail(path)
+        self.frameSaved.emit(path)
+
+    # Queue a newly saved frame for compression in the background.
+    # Called by the save folder watcher, on its own thread.
+
+    def compress_saved_frame(self, path: str):
+        """Have a saved frame compressed, now or once master flats and statistics are done"""
+        if self._master_flat_builder is None and not self._accumulate_statistics:
+            self._compressor.submit(path)
+        else:
+            self._frames_to_compress_later.append(path)
+
+    # At the end of the session, finish compressing the saved frames and report the savings
+
+    def finish_compression(self):
+        """Wait for frames being compressed in the background"""
+        if self._compressor is not None:
+            if self._controller.thread_running():
+                # The frames of a set that failed part way are left as they are, so the set
+                # can be resumed from its checkpoint next time
+                unfinished = set() if self._running_statistics is None \
+                    else {os.path.normpath(path) for path in self._running_statistics.get_frame_paths()}
+                for path in self._frames_to_compress_later:
+                    if os.path.normpath(path) not in unfinished:
+                        self._compressor.submit(path)
+                self._compressor.wait_for_all()
+            else:
+                self._compressor.wait_for_all(abandon=True)
+            self._frames_to_compress_later = []
+            self.consoleLine.emit(self._compressor.report(), 1)
+            for failure in self._compressor.get_failures():
+                self.consoleLine.emit(f"Not compressed: {failure}", 2)
+
+    # Start the session's structured log, in the program's data folder.  Console lines go to it
+    # too, directly from the signal, so everything the console shows is in the log.
+
+    def open_session_log(self):
+        """Start logging this session's events"""
+        try:
+            self._session_log = SessionLog(self.get_session_log_path(),
+                                           server=f"{self._server_address}:{self._server_port}")
+            self.consoleLine.connect(self._session_log.console_line)
+        except OSError as exception:
+            print(f"Unable to open session log: {exception}")
+            self._session_log = None
+
+    def get_session_log_path(self) -> str:
+        return os.path.join(SharedUtils.app_data_directory(Constants.SESSION_LOG_DIRECTORY),
+                            f"session-{self._session_id}.jsonl")
+
+    def close_session_log(self):
+        if self._session_log is not None:
+            self.consoleLine.disconnect(self._session_log.console_line)
+            self._session_log.close()
+            self._session_log = None
+
+    def log_event(self, event_type: str, **fields):
+        """Add an event to the session log, if one is being kept"""
+        if self._session_log is not None:
+            self._session_log.event(event_type, **fields)
+
+    # Open the catalog of captured frames, in the program's data folder, and record this
+    # session in it.  A catalog problem never stops the session; it just isn't recorded.
+
+    def open_frame_catalog(self):
+        """Open the frame catalog and record the start of this session"""
+        try:
+            self._frame_catalog = FrameCatalog(os.path.join(SharedUtils.app_data_directory(),
+                                                            Constants.FRAME_CATALOG_FILE))
+            self._frame_catalog.add_session(self._session_id, f"{self._server_address}:{self._server_port}")
+        except (sqlite3.Error, OSError) as exception:
+            print(f"Unable to open frame catalog: {exception}")
+            self._frame_catalog = None
+
+    def close_frame_catalog(self):
+        if self._frame_catalog is not None:
+            self._frame_catalog.close()
+            self._frame_catalog = None
+
+    # Time a phase of the session, for the overhead report and, if tracing is on, as a span
+    # in the trace
+
+    @contextmanager
+    def phase(self, name: str):
+        """Context manager timing one phase of the session"""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            duration = perf_counter() - started
+            SpanTracer.record(name, "session", started, duration)
+            self._overhead.add_phase(name, duration)
+
+    # Show where each work item's time went, and the biggest overhead we could reduce
+
+    def report_overhead(self):
+        """Show the session's time accounting in the console"""
+        lines = self._overhead.report_lines()
+        if lines:
+            self.consoleLine.emit("Where the time went", 1)
+            for (text, level) in lines:
+                self.consoleLine.emit(text, level)
+
+    # If tracing, write this session's spans beside its log, for a timeline viewer
+
+    def get_trace_path(self) -> str:
+        return os.path.join(SharedUtils.app_data_directory(Constants.SESSION_LOG_DIRECTORY),
+                            f"session-{self._session_id}.trace.json")
+
+    def export_trace(self):
+        if SpanTracer.is_enabled():
+            try:
+                SpanTracer.export_chrome_trace(self.get_trace_path())
+            except OSError as exception:
+                print(f"Unable to save session trace: {exception}")
+
+    # Poll the camera for completion of the image, collecting a telemetry sample in the same
+    # command if one is due.  Return success, is-complete, message
+
+    def poll_exposure_complete(self) -> (bool, bool, str):
+        """Ask the camera if the image is complete, sampling telemetry if due"""
+        if not self._telemetry.sample_due():
+            return self._server.get_exposure_is_complete()
+        (success, is_complete, sample, message) = \
+            self._server.get_exposure_is_complete_with_telemetry(include_mount=self._data_model.get_control_mount())
+        if sample is not None:
+            self._telemetry.add_sample(sample)
+            self.log_event(SessionLog.TELEMETRY, **sample.as_dict())
+        return success, is_complete, message
+
+    # The telemetry sample taken nearest to when the last frame finished, and the camera
+    # temperature from it
+
+    def frame_telemetry(self) -> Optional[TelemetrySample]:
+        if self._frame_completed_at is None:
+            return self._telemetry.latest()
+        return self._telemetry.nearest(self._frame_completed_at)
+
+    def frame_camera_temperature(self) -> Optional[float]:
+        sample = self.frame_telemetry()
+        return None if sample is None else sample.get_temperature()
+
+    # Open the history of measured exposures, in the program's data folder.  A history problem
+    # never stops the session; starting exposures just come from the preferences instead.
+
+    def open_exposure_history(self):
+        """Open the exposure history, to choose starting exposures and record this session's"""
+        try:
+            self._exposure_history = ExposureHistory(os.path.join(SharedUtils.app_data_directory(),
+                                                                  Constants.EXPOSURE_HISTORY_FILE))
+        except OSError as exception:
+            print(f"Unable to open exposure history: {exception}")
+            self._exposure_history = None
+
+    def close_exposure_history(self):
+        if self._exposure_history is not None:
+            self._exposure_history.close()
+            self._exposure_history = None
+
+    # Add a measured frame, accepted or not, to the exposure history.  Any frame whose
+    # statistics are sound tells us how bright the panel is.
+
+    def record_exposure_history(self, work_item: WorkItem, exposure: float, frame_statistics: FrameStatistics):
+        """Record the exposure and resulting ADUs of a frame in the exposure history"""
+        if self._exposure_history is not None and self.frame_statistics_problem(frame_statistics) is None:
+            try:
+                self._exposure_history.append(work_item.get_filter_spec().get_slot_number(),
+                                              work_item.get_binning(), exposure,
+                                              frame_statistics.get_mean(), self.frame_camera_temperature())
+            except OSError as exception:
+                print(f"Unable to record exposure history: {exception}")
+
+    # Record a frame that has just been saved in the catalog
+
+    def catalog_saved_frame(self, filter_name: str, exposure: float, binning: int,
+                            frame_statistics: FrameStatistics, ditherer: Optional[Ditherer]):
+        """Add the frame just saved to the frame catalog"""
+        if self._frame_catalog is not None and self._last_saved_path is not None:
+            dither_offset = None if ditherer is None else ditherer.get_current_offset_arcsec()
+            try:
+                self._frame_catalog.add_frame(self._session_id, self._last_saved_path, filter_name,
+                                              binning, exposure, frame_statistics,
+                                              self.frame_camera_temperature(), dither_offset)
+            except sqlite3.Error as exception:
+                print(f"Unable to catalog frame {self._last_saved_path}: {exception}")
+
+    # A master flat has been finished, in the background, and given its real name (or failed).
+    # Called by the master flat builder, on its own thread.
+
+    def master_flat_finished(self, path: str, success: bool, message: str):
+        """Report a master flat that is ready, or that couldn't be built"""
+        if success:
+            self.consoleLine.emit(f"Master flat saved: {os.path.basename(path)}", 1)
+        else:
+            self.consoleLine.emit(f"Error building master flat {os.path.basename(path)}: {message}", 1)
+        self.log_event(SessionLog.MASTER_FLAT, path=path, success=success, message=message)
+
+    # At the end of the session, wait for any master flats still being built, or
+    # abandon them if the session was cancelled
+
+    def finish_master_flats(self):
+        """Wait for master flats being built in the background"""
+        if self._master_flat_builder is not None:
+            if self._controller.thread_running():
+                self._master_flat_builder.wait_for_masters()
+            else:
+                self._master_flat_builder.cancel()
 
     # Wait given time, but do it in little bits, checking for thread cancellation.
     # return an indicator that thread is still up and running (not cancelled)
@@ -443,14 +1047,14 @@ class SessionThread(QObject):
         # print("wait_for_camera_completion")
         success = False
         total_time_waiting = 0.0
-        (complete_check_successful, is_complete, message) = self._server.get_exposure_is_complete()
+        (complete_check_successful, is_complete, message) = self.poll_exposure_complete()
         while self._controller.thread_running() \
                 and complete_check_successful \
                 and not is_complete \
                 and total_time_waiting < Constants.CAMERA_RESYNCH_TIMEOUT:
             sleep(Constants.CAMERA_RESYNCH_CHECK_INTERVAL)
             total_time_waiting += Constants.CAMERA_RESYNCH_CHECK_INTERVAL
-            (complete_check_successful, is_complete, message) = self._server.get_exposure_is_complete()
+            (complete_check_successful, is_complete, message) = self.poll_exposure_complete()
 
         if not self._controller.thread_running():
             pass
@@ -465,11 +1069,14 @@ class SessionThread(QObject):
             self.consoleLine.emit("Timed out waiting for camera to finish", 2)
         else:
             assert is_complete
+            self._frame_completed_at = monotonic()
             success = True
         return success
 
     def clean_up_from_cancel(self):
         """Cancel clicked - do any necessary cleanup"""
+        self.discard_candidate_frame()
+        self.checkpoint_running_statistics()
         (query_success, is_complete, message) = self._server.get_exposure_is_complete()
         if query_success:
             if is_complete:
@@ -486,18 +1093,38 @@ class SessionThread(QObject):
 
     def clean_up_from_failure(self):
         """Session stopped due to some kind of failure - do any necessary cleanup"""
-        pass
+        self.discard_candidate_frame()
+        self.checkpoint_running_statistics()
 
-    # Test if the given ADU value from an exposure is close to the target ADU level
+    # Test if the given ADU value from an exposure is close to the target ADU level.
+    # If the frame's full statistics are given, also check that they look like a good flat.
 
     @staticmethod
-    def adus_within_tolerance(work_item: WorkItem, test_adus: float) -> bool:
+    def adus_within_tolerance(work_item: WorkItem, test_adus: float,
+                              frame_statistics: Optional[FrameStatistics] = None) -> bool:
         """Determine if the given ADU count from a frame is close enough to the target"""
         difference = abs(test_adus - work_item.get_target_adu())
         difference_ratio = difference / work_item.get_target_adu()
         within = difference_ratio <= work_item.get_adu_tolerance()
+        if within and frame_statistics is not None:
+            within = SessionThread.frame_statistics_problem(frame_statistics) is None
         return within
 
+    # A frame can have the right average and still be a bad flat.  Too many saturated pixels
+    # (a saturated corner, hot columns) or a median far from the mean (a strong gradient or
+    # a bright intrusion into part of the frame) mean we don't want it.
+    # Return a description of the problem, or None if the statistics look fine.
+
+    @staticmethod
+    def frame_statistics_problem(frame_statistics: FrameStatistics) -> Optional[str]:
+        """Describe what is wrong with a frame's pixel statistics, if anything"""
+        mean = frame_statistics.get_mean()
+        if frame_statistics.get_saturated_fraction() > Constants.MAX_SATURATED_FRACTION:
+            return f"{frame_statistics.get_saturated_fraction():.2%} of pixels saturated"
+        if mean > 0 and abs(frame_statistics.get_median() - mean) / mean > Constants.MAX_MEDIAN_MEAN_DIFFERENCE:
+            return f"median {frame_statistics.get_median():,.0f} too far from mean"
+        return None
+
     # A trial exposure has produced ADU levels out of range and we'll improve the estimate
     # We know how many ADUs the trial exposure produced, and how many we actually want.
     # Assume the relationship is linear - apply the "miss factor" of the ADUs to the exposure time
@@ -547,9 +1174,21 @@ class SessionThread(QObject):
                             filter_name: str,
                             exposure: float,
                             binning: int,
-                            sequence: int) -> (bool, str):
+                            sequence: int,
+                            frame_statistics: FrameStatistics) -> (bool, str):
         """Have the just-acquired frame saved to an appropriate location"""
-        if self._data_model.get_save_files_locally():
+        if self._candidate_frame is not None:
+            # Already saved as a candidate while measuring it; give it its real name
+            (candidate_path, final_path) = self._candidate_frame
+            self._candidate_frame = None
+            try:
+                os.replace(candidate_path, final_path)
+                self._accepted_frames.append((final_path, frame_statistics))
+                self._last_saved_path = final_path
+                (success, message) = (True, "")
+            except OSError as exception:
+                (success, message) = (False, str(exception))
+        elif self._data_model.get_save_files_locally():
             (success, message) = \
                 self._server.save_acquired_frame_to_local_directory(
                     self._data_model.get_local_path(),
@@ -557,6 +1196,7 @@ class SessionThread(QObject):
                     exposure,
                     binning,
                     sequence)
+            self._last_saved_path = self._server.get_last_saved_path()
         else:
             (success, message) = \
                 self._server.save_acquired_frame_to_autosave(
@@ -564,4 +1204,5 @@ class SessionThread(QObject):
                     exposure,
                     binning,
                     sequence)
+            self._last_saved_path = self._server.get_last_saved_path()
         return success, message
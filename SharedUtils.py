@@ -1,11 +1,16 @@
 # Utilities to help program run on multiple OS - for now, windows and mac
 # Helps locate resource files, end-running around the problems I've been having
 # with the various native bundle packaging utilities that I can't get working
+import importlib
 import os
+import sys
 
-from PyQt5.QtCore import QObject, Qt
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt, QStandardPaths
 from PyQt5.QtGui import QColor
-from PyQt5.QtWidgets import QLabel, QCheckBox, QRadioButton, QLineEdit, QPushButton, QDateEdit, QTimeEdit, QWidget
+from PyQt5.QtWidgets import QApplication, QWidget
+
+from Constants import Constants
 
 
 class SharedUtils:
@@ -33,62 +38,88 @@ class SharedUtils:
         path_to_file = f"{directory_name}/{file_name}"
         return path_to_file
 
-    # Set all the items in the given UI tree with settable font sizes to
-    # the given font size.  Except labels.  Check if their name indicates they
-    # are headings and, if so, set larger by given increment.
+    # Build a window from its Qt Designer file.  If the file has been compiled to a Python
+    # module (see compile_ui.py) that is up to date, use that - it is much faster than parsing
+    # the XML - otherwise read the .ui file.  Either way the result is a new widget with its
+    # child widgets as attributes, as uic.loadUi gives.
+
+    @classmethod
+    def load_ui(cls, ui_file_name: str) -> QWidget:
+        ui_path = cls.path_for_file_in_program_directory(ui_file_name)
+        module = cls.compiled_ui_module(ui_file_name, ui_path)
+        if module is None:
+            from PyQt5 import uic
+            return uic.loadUi(ui_path)
+        widget: QWidget = getattr(QtWidgets, module.BASE_CLASS)()
+        form = module.UI_CLASS()
+        form.setupUi(widget)
+        for (name, child) in vars(form).items():
+            setattr(widget, name, child)
+        return widget
+
+    # The compiled module for a .ui file, or None if there is no usable one.  When running from
+    # source, a module older than its .ui file is out of date.  In a packaged program the module
+    # is inside the bundle's archive, with no file of its own to compare, and was compiled from
+    # the .ui file bundled with it, so it is used as it is.
+
+    @classmethod
+    def compiled_ui_module(cls, ui_file_name: str, ui_path: str):
+        module_name = os.path.splitext(ui_file_name)[0] + "_ui"
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            return None
+        if not hasattr(module, "UI_CLASS") or not hasattr(QtWidgets, getattr(module, "BASE_CLASS", "")):
+            return None
+        module_file = getattr(module, "__file__", None)
+        if not getattr(sys, "frozen", False) and module_file and os.path.exists(module_file) \
+                and os.path.exists(ui_path) and os.path.getmtime(ui_path) > os.path.getmtime(module_file):
+            return None
+        return module
+
+    # Directory, created if necessary, where the program keeps data files of its own
+    # (caches, logs, catalogs), in the standard place for the user's operating system
 
     @classmethod
-    def set_font_sizes(cls, parent: QObject,
-                       standard_size: int,
-                       title_prefix: str,
-                       title_increment: int,
-                       subtitle_prefix: str,
-                       subtitle_increment: int):
-        """Set font sizes of all UI elements"""
-        # print(f"set_font_sizes({parent},{standard_size},{title_prefix},"
-        #       f"{title_increment},{subtitle_prefix},{subtitle_increment})")
-        children = parent.children()
-        for child in children:
-            # print(f"  Checking child {child}")
-            # We'll only change the font size of labels and controls,
-            # not collections
-            desired_font_size = standard_size
-            set_size = False
-            child_name = child.objectName()
-            if isinstance(child, QLabel):
-                # Set label to standard size or an increment depending on name
-                set_size = True
-                if child_name.startswith(title_prefix):
-                    # print(f"Increment title label: {child_name}")
-                    desired_font_size = standard_size + title_increment
-                elif child_name.startswith(subtitle_prefix):
-                    # print(f"Increment subtitle label: {child_name}")
-                    desired_font_size = standard_size + subtitle_increment
-                else:
-                    pass
-                    # print(f"Increment normal label: {child_name}")
-            elif isinstance(child, QCheckBox) \
-                    or isinstance(child, QRadioButton) \
-                    or isinstance(child, QLineEdit) \
-                    or isinstance(child, QPushButton) \
-                    or isinstance(child, QDateEdit) \
-                    or isinstance(child, QTimeEdit):
-                set_size = True
-            if set_size:
-                child_font = child.font()
-                child_font.setPointSize(desired_font_size)
-                child.setFont(child_font)
-            # Recursively handle the children of this item as subtrees of their own
-            cls.set_font_sizes(child, standard_size, title_prefix, title_increment,
-                               subtitle_prefix, subtitle_increment)
+    def app_data_directory(cls, subdirectory: str = "") -> str:
+        base_directory = QStandardPaths.writableLocation(QStandardPaths.GenericDataLocation)
+        directory = os.path.join(base_directory, "EarwigHavenObservatory.com", "FlatCaptureNow1", subdirectory)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    # The program's look is set by one application-wide style sheet, so changing the font size
+    # is one call, no matter how many windows and widgets are open.  Controls are drawn in the
+    # standard size; labels given a "fontRole" property of "title" or "subtitle" (in the .ui
+    # files) are larger.  Fields are coloured by their "valid" property, which is set as their
+    # contents are validated.
+
+    @classmethod
+    def application_style_sheet(cls, standard_size: int) -> str:
+        """Style sheet for the whole program with the given standard font size"""
+        title_size = standard_size + Constants.MAIN_TITLE_FONT_SIZE_INCREMENT
+        subtitle_size = standard_size + Constants.SUBTITLE_FONT_SIZE_INCREMENT
+        return f"QLabel, QCheckBox, QRadioButton, QLineEdit, QPushButton, QDateEdit, QTimeEdit " \
+               f"{{ font-size: {standard_size}pt; }}\n" \
+               f"QLabel[fontRole=\"title\"] {{ font-size: {title_size}pt; }}\n" \
+               f"QLabel[fontRole=\"subtitle\"] {{ font-size: {subtitle_size}pt; }}\n" \
+               f"*[valid=\"true\"] {{ background-color: {cls.VALID_FIELD_BACKGROUND_COLOUR}; }}\n" \
+               f"*[valid=\"false\"] {{ background-color: {cls.ERROR_FIELD_BACKGROUND_COLOUR}; }}\n"
+
+    @classmethod
+    def set_application_font_size(cls, standard_size: int):
+        """Set the font size of all the program's windows"""
+        QApplication.instance().setStyleSheet(cls.application_style_sheet(standard_size))
+
+    # Colour a field to show whether its contents are valid.  Changing a dynamic property
+    # doesn't restyle a widget by itself, so it is re-polished - but only if the validity
+    # has changed, since fields are validated on every keystroke.
 
     @classmethod
     def background_validity_color(cls, field: QWidget, is_valid: bool):
-        field_color = SharedUtils.VALID_FIELD_BACKGROUND_COLOUR \
-            if is_valid else SharedUtils.ERROR_FIELD_BACKGROUND_COLOUR
-        css_color_item = f"background-color:{field_color};"
-        existing_style_sheet = field.styleSheet()
-        field.setStyleSheet(existing_style_sheet + css_color_item)
+        if field.property("valid") != is_valid:
+            field.setProperty("valid", is_valid)
+            field.style().unpolish(field)
+            field.style().polish(field)
 
     # Set enabled flag on all ui buttons to given value
     # Recursively descends through children to get buttons in containers
@@ -0,0 +1,199 @@
+#
+#   A stand-in for TheSkyX's TCP scripting server, for exercising the session end to end
+#   without a camera or mount: TheSkyX (the client class) connects to it exactly as it does to
+#   the real server, and gets back replies in the same form.
+#
+#   It recognizes the scripts the client sends by the camera and mount properties they use,
+#   and keeps just enough state to answer them: when the exposure in progress will finish,
+#   the level of the last frame, and where the mount is pointing.  Its behaviour is set when
+#   it is created:
+#       adus_per_second     brightness of the (simulated) light source
+#       download_seconds    time to read out a frame after the shutter closes
+#       slew_seconds        time taken by each slew
+#       latency             delay before replying to each command, as a slow network adds
+#       reject_rate         fraction of frames spoiled (by saturation) so the session rejects them
+#   Times are real time: a 2-second exposure takes 2 seconds.
+#
+import random
+import re
+import socketserver
+import threading
+from time import monotonic, sleep
+from typing import Optional
+
+NO_ERROR = "|No error. Error = 0."
+END_OF_PACKET = b"/* Socket End Packet */"
+NOISE_FRACTION = 0.01           # Random variation in the level of each frame
+SPOILED_SATURATED_FRACTION = 0.01   # Saturated fraction of a spoiled frame - enough to be rejected
+CAMERA_TEMPERATURE = -10.0
+COOLER_POWER = 40.0
+
+
+class SimulatedTheSkyXServer:
+
+    def __init__(self,
+                 adus_per_second: float,
+                 download_seconds: float = 0.0,
+                 slew_seconds: float = 0.0,
+                 latency: float = 0.0,
+                 reject_rate: float = 0.0,
+                 autosave_path: str = "",
+                 seed: Optional[int] = None):
+        self._adus_per_second = adus_per_second
+        self._download_seconds = download_seconds
+        self._slew_seconds = slew_seconds
+        self._latency = latency
+        self._reject_rate = reject_rate
+        self._autosave_path = autosave_path
+        self._random = random.Random(seed)
+        # Simulated equipment, shared by the threads serving the connections
+        self._lock = threading.Lock()
+        self._exposure_ends_at: float = 0.0
+        self._last_frame_mean: float = 0.0
+        self._last_frame_saturated: float = 0.0
+        self._filter_index: int = 0
+        self._alt: float = 45.0
+        self._az: float = 180.0
+        self._command_count: int = 0
+        self._tcp_server: Optional[socketserver.ThreadingTCPServer] = None
+        self._server_thread: Optional[threading.Thread] = None
+
+    # Start listening on the given port (0 to pick a free one) and return the port in use
+
+    def start(self, port: int = 0) -> int:
+        """Start serving in the background"""
+        simulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                simulator.serve_connection(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._tcp_server = socketserver.ThreadingTCPServer(("127.0.0.1", port), Handler)
+        self._tcp_server.daemon_threads = True
+        self._server_thread = threading.Thread(target=self._tcp_server.serve_forever,
+                                               name="SimulatedTheSkyX", daemon=True)
+        self._server_thread.start()
+        return self.get_port()
+
+    def stop(self):
+        if self._tcp_server is not None:
+            self._tcp_server.shutdown()
+            self._tcp_server.server_close()
+            self._server_thread.join()
+            self._tcp_server = None
+
+    def get_port(self) -> int:
+        return self._tcp_server.server_address[1]
+
+    def get_command_count(self) -> int:
+        with self._lock:
+            return self._command_count
+
+    # One connection carries one command packet; the client waits for the reply then closes
+
+    def serve_connection(self, connection):
+        packet = b""
+        while END_OF_PACKET not in packet:
+            received = connection.recv(4096)
+            if not received:
+                return
+            packet += received
+        reply = self.reply_to(packet.decode("utf-8"))
+        if self._latency > 0:
+            sleep(self._latency)
+        connection.sendall(bytes(reply, "utf-8"))
+
+    # The reply to one script, as TheSkyX would give it: the value put in "Out", then the
+    # error report on the next line
+
+    def reply_to(self, command: str) -> str:
+        """Act on a script and return the server's reply"""
+        with self._lock:
+            self._command_count += 1
+        if "IsExposureComplete" in command:
+            result = self.exposure_complete(command)
+        elif "TakeImage()" in command:
+            result = self.take_image(command)
+        elif "scanLine" in command:
+            result = self.last_frame_statistics()
+        elif "AutoSavePath" in command and "Save()" not in command:
+            result = self._autosave_path
+        elif "Save()" in command:
+            result = "0"
+        elif "FilterIndexZeroBased=" in command:
+            self._filter_index = int(self.number_after("FilterIndexZeroBased=", command))
+            result = "undefined"
+        elif "ccdsoftCamera.Abort()" in command:
+            with self._lock:
+                self._exposure_ends_at = 0.0
+            result = "undefined"
+        elif "SlewToAzAlt" in command:
+            result = self.slew(command)
+        elif "IsSlewComplete" in command:
+            result = "1"
+        elif "GetAzAlt" in command:
+            result = f"{self._alt}/{self._az}"
+        elif "ThermalElectricCoolerPower" in command:
+            result = f"{COOLER_POWER}"
+        elif "ccdsoftCamera.Temperature;" in command:
+            result = f"{CAMERA_TEMPERATURE}"
+        elif "SetTracking" in command or "Park()" in command or "FindHome()" in command \
+                or "sky6RASCOMTele.Abort()" in command:
+            result = "0"
+        else:
+            result = "undefined"
+        return result + "\n" + NO_ERROR
+
+    # Start an exposure, the frame's level set by the exposure time.  A synchronous exposure
+    # (bias frames timing the download) finishes before we reply.
+
+    def take_image(self, command: str) -> str:
+        exposure = float(self.number_after("ExposureTime=", command) or 0)
+        duration = exposure + self._download_seconds
+        spoiled = self._random.random() < self._reject_rate
+        noise = 1.0 + NOISE_FRACTION * (2.0 * self._random.random() - 1.0)
+        with self._lock:
+            self._last_frame_mean = min(65535.0, self._adus_per_second * exposure * noise)
+            self._last_frame_saturated = SPOILED_SATURATED_FRACTION if spoiled else 0.0
+            self._exposure_ends_at = monotonic() + duration
+        if "Asynchronous=false" in command.replace(" ", ""):
+            sleep(duration)
+        return "0"
+
+    # "complete" alone, or followed by telemetry readings, as the script asks
+
+    def exposure_complete(self, command: str) -> str:
+        with self._lock:
+            complete = "1" if monotonic() >= self._exposure_ends_at else "0"
+        output = re.search(r"var Out=(.*?)\+\"\\n\";", command)
+        if output is None:
+            return complete
+        readings = {"complete": complete,
+                    "temp": f"{CAMERA_TEMPERATURE}",
+                    "power": f"{COOLER_POWER}",
+                    "filter": f"{self._filter_index}",
+                    "alt": f"{self._alt}",
+                    "az": f"{self._az}"}
+        return "/".join(readings.get(name, "") for name in output.group(1).split("+\"/\"+"))
+
+    def last_frame_statistics(self) -> str:
+        with self._lock:
+            (mean, saturated) = (self._last_frame_mean, self._last_frame_saturated)
+        spread = mean * NOISE_FRACTION
+        return f"{mean}|{mean}|{spread}|{mean - 5 * spread}|{mean + 5 * spread}|{saturated}"
+
+    def slew(self, command: str) -> str:
+        arguments = re.search(r"SlewToAzAlt\(([-\d.eE+]+),([-\d.eE+]+)", command)
+        if arguments is not None:
+            (self._az, self._alt) = (float(arguments.group(1)), float(arguments.group(2)))
+        if self._slew_seconds > 0:
+            sleep(self._slew_seconds)
+        return "0"
+
+    # The number assigned to a property in a script, e.g. "ExposureTime=2.5;" gives "2.5"
+
+    @staticmethod
+    def number_after(prefix: str, command: str) -> Optional[str]:
+        match = re.search(re.escape(prefix) + r"([-\d.eE+]+)", command.replace(" ", ""))
+        return None if match is None else match.group(1)
@@ -0,0 +1,43 @@
+#
+#   Spherical geometry for alt-az positions.
+#
+#   Dither offsets are small on-sky displacements: x toward the zenith (altitude) and y along
+#   the horizon direction (azimuth), both in radians.  Adding such an offset directly to the
+#   azimuth angle is wrong away from the horizon: a degree of azimuth at altitude "alt" is only
+#   cos(alt) degrees on the sky, so near the zenith the mount would be sent much further than
+#   intended.  Instead we treat the offset as a great-circle move of distance hypot(x, y) in
+#   direction atan2(y, x), and compute where on the sphere that lands, with altitude playing
+#   the part of latitude and azimuth the part of longitude.
+#
+#   The functions accept plain floats or numpy arrays (for whole planned paths at once).
+#
+import numpy
+
+
+class SkyGeometry:
+
+    @staticmethod
+    def offset_alt_az(alt_deg, az_deg, x_rad, y_rad) -> (float, float):
+        """Apply an on-sky offset (radians toward zenith, radians along azimuth) to an alt-az position"""
+        alt = numpy.radians(alt_deg)
+        az = numpy.radians(az_deg)
+        distance = numpy.hypot(x_rad, y_rad)
+        bearing = numpy.arctan2(y_rad, x_rad)
+        sin_new_alt = numpy.sin(alt) * numpy.cos(distance) \
+            + numpy.cos(alt) * numpy.sin(distance) * numpy.cos(bearing)
+        new_alt = numpy.arcsin(numpy.clip(sin_new_alt, -1.0, 1.0))
+        new_az = az + numpy.arctan2(numpy.sin(bearing) * numpy.sin(distance) * numpy.cos(alt),
+                                    numpy.cos(distance) - numpy.sin(alt) * sin_new_alt)
+        return numpy.degrees(new_alt), numpy.degrees(new_az) % 360.0
+
+    @staticmethod
+    def angular_separation(alt1_deg, az1_deg, alt2_deg, az2_deg):
+        """Great-circle angle, in radians, between two alt-az positions"""
+        alt1 = numpy.radians(alt1_deg)
+        alt2 = numpy.radians(alt2_deg)
+        delta_alt = alt2 - alt1
+        delta_az = numpy.radians(az2_deg) - numpy.radians(az1_deg)
+        # Haversine formula, well-conditioned for the very small angles used in dithering
+        haversine = numpy.sin(delta_alt / 2.0) ** 2 \
+            + numpy.cos(alt1) * numpy.cos(alt2) * numpy.sin(delta_az / 2.0) ** 2
+        return 2.0 * numpy.arcsin(numpy.sqrt(numpy.clip(haversine, 0.0, 1.0)))
@@ -0,0 +1,66 @@
+#
+#   Model of how long the mount takes to slew a given angular distance, learned from
+#   observed slews.  Every timed slew is recorded as (distance in degrees, seconds taken),
+#   and a straight line  seconds = settle + distance / rate  is fitted to the recent samples
+#   by least squares.  The settle term captures the fixed cost of any move (acceleration,
+#   settling, command overhead) that dominates the small moves used in dithering.
+#
+#   The samples are kept in the preferences so the model improves from session to session.
+#   Until enough samples exist, the default estimates from Constants are used.
+#
+import numpy
+
+from Constants import Constants
+from Preferences import Preferences
+
+
+class SlewTimeModel:
+
+    def __init__(self, preferences: Preferences):
+        self._preferences = preferences
+        self._samples: [[float]] = preferences.get_slew_time_samples()
+        self._settle_seconds: float = Constants.DITHER_SLEW_SETTLE_SECONDS
+        self._seconds_per_degree: float = 1.0 / Constants.DITHER_SLEW_DEGREES_PER_SECOND
+        self.fit()
+
+    def get_settle_seconds(self) -> float:
+        return self._settle_seconds
+
+    def get_seconds_per_degree(self) -> float:
+        return self._seconds_per_degree
+
+    def get_sample_count(self) -> int:
+        return len(self._samples)
+
+    def record(self, distance_deg: float, elapsed_seconds: float):
+        """Record an observed slew and refit the model"""
+        self._samples.append([float(distance_deg), float(elapsed_seconds)])
+        self._samples = self._samples[-Constants.SLEW_MODEL_MAX_SAMPLES:]
+        self.fit()
+
+    # Fit the straight line to the samples.  If there aren't enough, or they don't
+    # determine a sensible line (e.g. all the same distance), keep the defaults or
+    # fall back to just the average time with the default rate.
+
+    def fit(self):
+        """Fit settle time and rate to the recorded slew samples"""
+        if len(self._samples) < Constants.SLEW_MODEL_MIN_SAMPLES:
+            return
+        samples = numpy.array(self._samples, dtype=float)
+        distances = samples[:, 0]
+        seconds = samples[:, 1]
+        if numpy.ptp(distances) > 0:
+            (slope, intercept) = numpy.polyfit(distances, seconds, 1)
+            if slope > 0 and intercept >= 0:
+                self._seconds_per_degree = float(slope)
+                self._settle_seconds = float(intercept)
+                return
+        self._settle_seconds = max(0.0, float(numpy.mean(seconds - distances * self._seconds_per_degree)))
+
+    def predict_seconds(self, distance_deg):
+        """Predicted time for a slew of the given distance (degrees; a float or numpy array)"""
+        return self._settle_seconds + numpy.abs(distance_deg) * self._seconds_per_degree
+
+    def save(self):
+        """Store the recorded samples in the preferences for next time"""
+        self._preferences.set_slew_time_samples(self._samples)
@@ -0,0 +1,166 @@
+#
+#   Timing of the phases of a session, as spans: a name, a category, when it started and how
+#   long it took, on which thread.  Spans are recorded in a ring buffer allocated once, when
+#   tracing is turned on, so recording one is a few stores with no allocation to speak of; once
+#   the buffer is full the oldest spans are overwritten.  With tracing off, "span" hands back a
+#   shared do-nothing context manager, so instrumented code costs next to nothing.
+#
+#   The spans can be written as a Chrome trace-event file, which timeline viewers such as
+#   chrome://tracing or ui.perfetto.dev open directly.
+#
+#       with SpanTracer.span("expose", "session"):
+#           ...
+#
+import itertools
+import json
+import os
+import threading
+from array import array
+from time import perf_counter
+from typing import Optional
+
+from Constants import Constants
+
+MAX_ARGUMENT_LENGTH = 200   # Longer argument values are cut short in the exported trace
+
+
+class _NullSpan:
+    """Context manager that does nothing, for when tracing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        return False
+
+
+class _Span:
+    """A span being timed; recorded in the tracer's buffer when it ends"""
+    __slots__ = ("_name", "_category", "_arguments", "_start")
+
+    def __init__(self, name: str, category: str, arguments: Optional[dict]):
+        self._name = name
+        self._category = category
+        self._arguments = arguments
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        SpanTracer.record(self._name, self._category, self._start, perf_counter() - self._start,
+                          self._arguments)
+        return False
+
+
+class SpanTracer:
+    _NULL_SPAN = _NullSpan()
+    _enabled: bool = False
+    _capacity: int = 0
+    _names: [Optional[str]] = []
+    _categories: [Optional[str]] = []
+    _arguments: [Optional[dict]] = []
+    _starts: array = array("d")
+    _durations: array = array("d")
+    _threads: array = array("q")
+    _sequence: array = array("q")      # Number of the span in each slot, -1 if empty
+    _counter = itertools.count()
+    _origin: float = 0.0
+
+    # Turn tracing on, with a buffer for the given number of spans, or off
+
+    @classmethod
+    def enable(cls, capacity: int = Constants.SPAN_TRACE_BUFFER_SIZE):
+        """Start recording spans, in a new buffer"""
+        cls._capacity = capacity
+        cls._names = [None] * capacity
+        cls._categories = [None] * capacity
+        cls._arguments = [None] * capacity
+        cls._starts = array("d", bytes(8 * capacity))
+        cls._durations = array("d", bytes(8 * capacity))
+        cls._threads = array("q", bytes(8 * capacity))
+        cls._sequence = array("q", [-1]) * capacity
+        cls.clear()
+        cls._enabled = True
+
+    @classmethod
+    def disable(cls):
+        cls._enabled = False
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls._enabled
+
+    @classmethod
+    def clear(cls):
+        """Forget the spans recorded so far"""
+        cls._sequence = array("q", [-1]) * cls._capacity
+        cls._counter = itertools.count()
+        cls._origin = perf_counter()
+
+    # A context manager timing the code it encloses.  Arguments are kept as given, and only
+    # converted to text when the trace is exported.
+
+    @classmethod
+    def span(cls, name: str, category: str, **arguments):
+        """Time the enclosed code as a span with the given name and category"""
+        if not cls._enabled:
+            return cls._NULL_SPAN
+        return _Span(name, category, arguments or None)
+
+    @classmethod
+    def record(cls, name: str, category: str, start: float, duration: float, arguments: Optional[dict] = None):
+        """Record a span that has been timed some other way (perf_counter times)"""
+        if not cls._enabled:
+            return
+        # Taking a number from the counter is atomic, so threads never share a slot
+        sequence = next(cls._counter)
+        slot = sequence % cls._capacity
+        cls._names[slot] = name
+        cls._categories[slot] = category
+        cls._arguments[slot] = arguments
+        cls._starts[slot] = start
+        cls._durations[slot] = duration
+        cls._threads[slot] = threading.get_native_id()
+        cls._sequence[slot] = sequence
+
+    # The recorded spans, oldest first, as (name, category, start, duration, thread, arguments)
+
+    @classmethod
+    def spans(cls) -> [(str, str, float, float, int, Optional[dict])]:
+        """The spans in the buffer, oldest first"""
+        slots = sorted((slot for slot in range(cls._capacity) if cls._sequence[slot] >= 0),
+                       key=lambda slot: cls._sequence[slot])
+        return [(cls._names[slot], cls._categories[slot], cls._starts[slot],
+                 cls._durations[slot], cls._threads[slot], cls._arguments[slot]) for slot in slots]
+
+    # Write the spans as a Chrome trace-event file: a complete ("X") event for each span, with
+    # times in microseconds from when the buffer was cleared, and the threads named
+
+    @classmethod
+    def export_chrome_trace(cls, path: str):
+        """Write the recorded spans to a file in Chrome trace-event format"""
+        process_id = os.getpid()
+        thread_names = {thread.native_id: thread.name for thread in threading.enumerate()}
+        events = []
+        threads_seen = set()
+        for (name, category, start, duration, thread, arguments) in cls.spans():
+            event = {"name": name, "cat": category, "ph": "X", "pid": process_id, "tid": thread,
+                     "ts": round((start - cls._origin) * 1e6, 1), "dur": round(duration * 1e6, 1)}
+            if arguments:
+                event["args"] = {key: cls.argument_text(value) for (key, value) in arguments.items()}
+            events.append(event)
+            threads_seen.add(thread)
+        for thread in threads_seen:
+            events.append({"name": "thread_name", "ph": "M", "pid": process_id, "tid": thread,
+                           "args": {"name": thread_names.get(thread, f"Thread {thread}")}})
+        with open(path, "w", encoding="utf-8") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+    @staticmethod
+    def argument_text(value) -> object:
+        if isinstance(value, (int, float, bool)) or value is None:
+            return value
+        text = str(value)
+        return text if len(text) <= MAX_ARGUMENT_LENGTH else text[:MAX_ARGUMENT_LENGTH] + "..."
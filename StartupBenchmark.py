@@ -0,0 +1,125 @@
+#
+#   Measure how long the program takes to start, broken down into its phases, so changes
+#   that slow down a cold start on the observatory computers are noticed.
+#       Imports         importing the modules FlatCaptureNow1 imports (and what they import)
+#       Application     creating the QApplication
+#       Preferences     loading the preferences and making the data model from them
+#       Main window     building the main window from its UI definition and filling it in
+#   Each run is a fresh Python process, so imports are not already cached in memory (though
+#   the operating system's file cache will be warm after the first run).  The median of the
+#   runs is reported, along with the time spent building each window from its .ui file as
+#   compiled Python (see compile_ui.py) and by parsing the XML.
+#
+#   Run from the command line, e.g.
+#       python StartupBenchmark.py --runs 5 --offscreen
+#
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+PHASES = ("Imports", "Application", "Preferences", "Main window")
+UI_FILES = ("MainWindow.ui", "PrefsWindow.ui", "SessionConsole.ui")
+
+
+class StartupBenchmark:
+
+    def __init__(self, runs: int, offscreen: bool):
+        self._runs = runs
+        self._environment = dict(os.environ)
+        if offscreen:
+            self._environment["QT_QPA_PLATFORM"] = "offscreen"
+
+    # Time one start-up, in this process.  Returns seconds for each phase.
+
+    @staticmethod
+    def time_one_startup() -> {str: float}:
+        """Start the program's main window as FlatCaptureNow1 does, timing each phase"""
+        times: {str: float} = {}
+        start = perf_counter()
+        from PyQt5 import QtWidgets
+        from DataModel import DataModel
+        from MainWindow import MainWindow
+        from Preferences import Preferences
+        times["Imports"] = perf_counter() - start
+
+        start = perf_counter()
+        app = QtWidgets.QApplication(sys.argv[:1])
+        times["Application"] = perf_counter() - start
+
+        start = perf_counter()
+        preferences = Preferences()
+        preferences.set_defaults()
+        data_model = DataModel.make_from_preferences(preferences)
+        times["Preferences"] = perf_counter() - start
+
+        start = perf_counter()
+        window = MainWindow(data_model, preferences)
+        window.set_up_ui()
+        app.processEvents()
+        times["Main window"] = perf_counter() - start
+        return times
+
+    # Time building each window's widgets, from the compiled module and from the XML
+
+    @staticmethod
+    def time_ui_loading() -> {str: float}:
+        from PyQt5 import uic, QtWidgets
+        from SharedUtils import SharedUtils
+        app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+        times: {str: float} = {}
+        # Qt does some setup when the first window is made; get that out of the way
+        QtWidgets.QMainWindow().setCentralWidget(QtWidgets.QTableView())
+        for ui_file in UI_FILES:
+            start = perf_counter()
+            SharedUtils.load_ui(ui_file)
+            times[f"{ui_file} (load_ui)"] = perf_counter() - start
+            start = perf_counter()
+            uic.loadUi(SharedUtils.path_for_file_in_program_directory(ui_file))
+            times[f"{ui_file} (XML)"] = perf_counter() - start
+        app.processEvents()
+        return times
+
+    # Run the measurements, each in a new process, and report the medians
+
+    def run(self):
+        startups = [self.run_child("--child-startup") for _ in range(self._runs)]
+        ui_loads = [self.run_child("--child-ui") for _ in range(self._runs)]
+        print(f"Median of {self._runs} runs, milliseconds")
+        total = 0.0
+        for phase in PHASES:
+            median = statistics.median(run[phase] for run in startups)
+            total += median
+            print(f"   {phase:<36} {median * 1000.0:8.1f}")
+        print(f"   {'Total':<36} {total * 1000.0:8.1f}")
+        print("Building windows")
+        for name in ui_loads[0].keys():
+            median = statistics.median(run[name] for run in ui_loads)
+            print(f"   {name:<36} {median * 1000.0:8.1f}")
+
+    def run_child(self, mode: str) -> {str: float}:
+        completed = subprocess.run([sys.executable, os.path.realpath(__file__), mode],
+                                   env=self._environment, capture_output=True, text=True, check=True)
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure program start-up time")
+    parser.add_argument("--runs", type=int, default=5, help="Number of start-ups to time")
+    parser.add_argument("--offscreen", action="store_true", help="Don't display windows (e.g. no display)")
+    parser.add_argument("--child-startup", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--child-ui", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.child_startup:
+        print(json.dumps(StartupBenchmark.time_one_startup()))
+    elif arguments.child_ui:
+        print(json.dumps(StartupBenchmark.time_ui_loading()))
+    else:
+        StartupBenchmark(arguments.runs, arguments.offscreen).run()
+
+
+if __name__ == "__main__":
+    main()
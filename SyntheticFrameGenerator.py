@@ -0,0 +1,92 @@
+#
+#   Realistic simulated flat frames, so everything downstream of the camera (statistics,
+#   stacking, compression, previews, the catalog) can be exercised at real data sizes with no
+#   camera attached.
+#
+#   A frame is built the way a camera makes one:
+#       illumination    the light panel, dimmed toward the corners by vignetting (cos^4-like
+#                       fall-off) and by the ring-shaped shadows ("donuts") of dust on the filter
+#                       and sensor window.  This pattern is fixed for the optical setup, so it is
+#                       computed once per binning and reused.
+#       photon noise    shot noise, with variance equal to the signal in electrons (the normal
+#                       approximation to Poisson noise, which is very close at flat-frame levels)
+#       bias and read noise     a constant offset with a faint column pattern, plus Gaussian noise
+#       16-bit clipping         as an unsigned 16-bit A/D converter would
+#   The result is scaled so the frame's average comes out at the requested level.
+#
+import numpy
+
+from Constants import Constants
+from FitsFile import FitsFile
+
+
+class SyntheticFrameGenerator:
+
+    def __init__(self, width: int, height: int, seed: int = Constants.SIMULATED_FRAME_SEED):
+        self._width: int = width
+        self._height: int = height
+        self._rng = numpy.random.default_rng(seed)
+        self._illumination: numpy.ndarray = self.illumination_pattern(width, height, seed)
+        self._bias: numpy.ndarray = self.bias_pattern(width, height, seed)
+
+    def get_width(self) -> int:
+        return self._width
+
+    def get_height(self) -> int:
+        return self._height
+
+    # Vignetting and dust shadows, normalized to an average of 1.  The dust positions come from
+    # the seed, and are in fractions of the frame size, so every binning sees the same dust.
+
+    @staticmethod
+    def illumination_pattern(width: int, height: int, seed: int) -> numpy.ndarray:
+        """Relative illumination of each pixel, averaging 1"""
+        rng = numpy.random.default_rng(seed)
+        y = numpy.linspace(-1.0, 1.0, height, dtype=numpy.float32)[:, numpy.newaxis]
+        x = numpy.linspace(-1.0, 1.0, width, dtype=numpy.float32)[numpy.newaxis, :] * (width / height)
+        radius_squared = x * x + y * y
+        pattern = 1.0 / numpy.square(1.0 + Constants.SIMULATED_VIGNETTING * radius_squared)
+        for _ in range(Constants.SIMULATED_DUST_MOTES):
+            centre_x = rng.uniform(-0.9, 0.9) * (width / height)
+            centre_y = rng.uniform(-0.9, 0.9)
+            outer = rng.uniform(0.03, 0.12)
+            depth = rng.uniform(0.01, 0.06)
+            # A donut: the shadow of a speck in the converging light cone, hollow in the middle
+            # where the central obstruction is
+            distance = numpy.sqrt(numpy.square(x - centre_x) + numpy.square(y - centre_y)) / outer
+            ring = numpy.clip(1.0 - numpy.abs(distance - 0.7) / 0.3, 0.0, 1.0)
+            pattern *= 1.0 - depth * ring
+        return (pattern / pattern.mean()).astype(numpy.float32)
+
+    @staticmethod
+    def bias_pattern(width: int, height: int, seed: int) -> numpy.ndarray:
+        """Bias level of each column: the offset plus a faint fixed column pattern"""
+        rng = numpy.random.default_rng(seed + 1)
+        columns = Constants.SIMULATED_BIAS_LEVEL + rng.normal(0.0, Constants.SIMULATED_COLUMN_NOISE, width)
+        return columns.astype(numpy.float32)[numpy.newaxis, :]
+
+    # Make a frame whose average is (close to) the given level
+
+    def frame(self, average_adus: float) -> numpy.ndarray:
+        """Generate a simulated flat frame with the given average level, as 16-bit values"""
+        gain = Constants.SIMULATED_GAIN
+        signal_adus = max(0.0, average_adus - Constants.SIMULATED_BIAS_LEVEL)
+        frame = self._illumination * numpy.float32(signal_adus)
+        # Shot noise: in electrons the variance equals the signal, so in ADUs it is signal / gain
+        noise = self._rng.standard_normal(frame.shape, dtype=numpy.float32)
+        noise *= numpy.sqrt(frame / numpy.float32(gain))
+        frame += noise
+        read_noise = self._rng.standard_normal(frame.shape, dtype=numpy.float32)
+        read_noise *= numpy.float32(Constants.SIMULATED_READ_NOISE / gain)
+        frame += read_noise
+        frame += self._bias
+        return numpy.clip(numpy.rint(frame), 0, 65535).astype(numpy.uint16)
+
+    @staticmethod
+    def write_frame(path: str, frame: numpy.ndarray, extra_header: {str: object}):
+        """Save a simulated frame as a 16-bit FITS file"""
+        (height, width) = frame.shape
+        output = FitsFile.create(path, width, height, bitpix=16, extra_header=extra_header)
+        for start_row in range(0, height, Constants.LOCAL_ANALYSIS_BAND_ROWS):
+            output.write_rows(start_row, frame[start_row:start_row + Constants.LOCAL_ANALYSIS_BAND_ROWS])
+        output.flush()
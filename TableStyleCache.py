@@ -0,0 +1,58 @@
+from typing import Optional
+
+from PyQt5.QtGui import QFont, QBrush
+
+from Preferences import Preferences
+from SharedUtils import SharedUtils
+
+
+#
+#   Fonts and brushes used to draw the cells and headers of the program's tables.  Table
+#   models are asked for these for every cell each time a table is painted, so they are made
+#   once and shared instead of being rebuilt (and the font size read from the settings) for
+#   every cell.  The fonts depend on the standard font size, so whoever changes that size
+#   must call "invalidate"; the brushes depend only on cell validity, of which there are two.
+#
+
+class TableStyleCache:
+    _cell_font: Optional[QFont] = None
+    _header_font: Optional[QFont] = None
+    _valid_brush: Optional[QBrush] = None
+    _error_brush: Optional[QBrush] = None
+
+    @classmethod
+    def cell_font(cls, preferences: Preferences) -> QFont:
+        """Font for the data cells of a table"""
+        if cls._cell_font is None:
+            cls.make_fonts(preferences)
+        return cls._cell_font
+
+    @classmethod
+    def header_font(cls, preferences: Preferences) -> QFont:
+        """Font for the row and column headers of a table"""
+        if cls._header_font is None:
+            cls.make_fonts(preferences)
+        return cls._header_font
+
+    @classmethod
+    def make_fonts(cls, preferences: Preferences):
+        cls._cell_font = QFont()
+        cls._cell_font.setPointSize(preferences.get_standard_font_size())
+        cls._header_font = QFont(cls._cell_font)
+        cls._header_font.setBold(True)
+
+    @classmethod
+    def validity_brush(cls, validity: bool) -> QBrush:
+        """Background brush for a cell with valid or invalid contents"""
+        if cls._valid_brush is None:
+            cls._valid_brush = QBrush(SharedUtils.valid_or_error_field_color(True))
+            cls._error_brush = QBrush(SharedUtils.valid_or_error_field_color(False))
+        return cls._valid_brush if validity else cls._error_brush
+
+    # The standard font size has changed; fonts will be remade when next needed
+
+    @classmethod
+    def invalidate(cls):
+        """Discard the cached fonts, e.g. because the font size has changed"""
+        cls._cell_font = None
+        cls._header_font = None
@@ -0,0 +1,50 @@
+# One reading of the camera's and mount's state during a session: sensor temperature, cooler
+# power, filter wheel position, and mount altitude and azimuth.  Any of these can be missing
+# (None) if the server couldn't report it, e.g. when there is no filter wheel or mount.
+# The time is on the monotonic clock, for matching samples with frames.
+
+from typing import Optional
+
+
+class TelemetrySample:
+    def __init__(self, time: float,
+                 temperature: Optional[float],
+                 cooler_power: Optional[float],
+                 filter_index: Optional[int],
+                 alt: Optional[float],
+                 az: Optional[float]):
+        self._time: float = time
+        self._temperature: Optional[float] = temperature
+        self._cooler_power: Optional[float] = cooler_power  # Percent
+        self._filter_index: Optional[int] = filter_index  # Zero-based, as TheSkyX reports it
+        self._alt: Optional[float] = alt
+        self._az: Optional[float] = az
+
+    # Getters
+
+    def get_time(self) -> float:
+        return self._time
+
+    def get_temperature(self) -> Optional[float]:
+        return self._temperature
+
+    def get_cooler_power(self) -> Optional[float]:
+        return self._cooler_power
+
+    def get_filter_index(self) -> Optional[int]:
+        return self._filter_index
+
+    def get_alt(self) -> Optional[float]:
+        return self._alt
+
+    def get_az(self) -> Optional[float]:
+        return self._az
+
+    def as_dict(self) -> {str: object}:
+        """The sample's readings, e.g. for logging"""
+        return {"temperature": self._temperature, "cooler_power": self._cooler_power,
+                "filter_index": self._filter_index, "alt": self._alt, "az": self._az}
+
+    def __str__(self) -> str:
+        readings = ", ".join(f"{name} {value}" for (name, value) in self.as_dict().items() if value is not None)
+        return f"Telemetry at {self._time:.1f}: {readings}"
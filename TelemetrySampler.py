@@ -0,0 +1,62 @@
+#
+#   Low-rate record of camera and mount telemetry through a session, kept in a fixed-size ring
+#   buffer so a long session never grows it.
+#
+#   The sampler doesn't talk to the server itself.  The session already polls the camera while
+#   each exposure finishes; when a sample is due, that poll also asks for the telemetry, in the
+#   same command to the server, so sampling costs no extra round trips.  Samples are taken at
+#   most once per interval, and "request_sample" makes the next poll take one regardless (e.g.
+#   at the start of a work item, so its first frame has a fresh sample).
+#
+#   Each frame can then be tagged with the sample taken closest to it in time.
+#
+from collections import deque
+from time import monotonic
+from typing import Optional
+
+from Constants import Constants
+from TelemetrySample import TelemetrySample
+
+
+class TelemetrySampler:
+
+    def __init__(self, interval: float = Constants.TELEMETRY_SAMPLE_INTERVAL,
+                 capacity: int = Constants.TELEMETRY_BUFFER_SIZE):
+        self._interval: float = interval
+        self._samples: deque = deque(maxlen=capacity)
+        self._last_sample_time: Optional[float] = None
+        self._sample_requested: bool = True
+
+    def sample_due(self) -> bool:
+        """Should the next camera poll also collect telemetry?"""
+        return self._sample_requested \
+            or self._last_sample_time is None \
+            or monotonic() - self._last_sample_time >= self._interval
+
+    def request_sample(self):
+        """Have the next camera poll collect telemetry whether or not one is due"""
+        self._sample_requested = True
+
+    def add_sample(self, sample: TelemetrySample):
+        """Record a sample; the oldest is dropped if the buffer is full"""
+        self._samples.append(sample)
+        self._last_sample_time = sample.get_time()
+        self._sample_requested = False
+
+    def get_samples(self) -> [TelemetrySample]:
+        return list(self._samples)
+
+    def latest(self) -> Optional[TelemetrySample]:
+        return self._samples[-1] if self._samples else None
+
+    # The sample closest in time to the given (monotonic) time.  Samples are in time order,
+    # so searching back from the newest can stop as soon as the distance starts growing.
+
+    def nearest(self, time: float) -> Optional[TelemetrySample]:
+        """Find the sample taken closest to the given time"""
+        best: Optional[TelemetrySample] = None
+        for sample in reversed(self._samples):
+            if best is not None and abs(sample.get_time() - time) > abs(best.get_time() - time):
+                break
+            best = sample
+        return best
@@ -1,12 +1,24 @@
 # Class to send and receive commands (Javascript commands and text responses) to the
 # server running TheSkyX
+import math
+import os
 import socket
 from datetime import datetime
 from random import random
-from time import sleep
+from time import sleep, monotonic
+from typing import Optional
 
+import numpy
 from PyQt5.QtCore import QMutex
 
+from Constants import Constants
+from FrameStatistics import FrameStatistics
+from SharedUtils import SharedUtils
+from SkyGeometry import SkyGeometry
+from SlewTimeModel import SlewTimeModel
+from SpanTracer import SpanTracer
+from SyntheticFrameGenerator import SyntheticFrameGenerator
+from TelemetrySample import TelemetrySample
 from Validators import Validators
 
 
@@ -19,15 +31,37 @@ class TheSkyX:
         self._server_address = server_address
         self._port_number = int(port_number)
         self._selected_filter_index = -1
+        # Optional slew-time model, to which we report the distance and duration of every slew.
+        # To know a slew's distance we track the last known position of the mount.
+        self._slew_time_model: Optional[SlewTimeModel] = None
+        self._last_alt_az: Optional[(float, float)] = None
+        self._slew_started_at: Optional[float] = None
+        self._slew_distance_deg: Optional[float] = None
+        # When simulating the camera: a frame generator for each binning, and the last frame made
+        self._synthetic_frame_generators: {int: SyntheticFrameGenerator} = {}
+        self._last_synthetic_frame: Optional[numpy.ndarray] = None
+        self._last_synthetic_frame_header: {str: object} = {}
+        # Where the last frame was saved.  For autosave, this is only a full path if we've
+        # asked for the autosave path; otherwise it is just the file name.
+        self._autosave_path: Optional[str] = None
+        self._last_saved_path: Optional[str] = None
+
+    def set_slew_time_model(self, model: SlewTimeModel):
+        """Record the distance and duration of slews in the given model"""
+        self._slew_time_model = model
 
     # Get the autosave-path string from the camera.
     # Return a success flag and the path string, and an error message if needed
     def get_camera_autosave_path(self) -> (bool, str, str):
         """Get file autosave path on server from TheSkyX"""
+        if self.flat_frame_calculate_simulation:
+            return True, SharedUtils.app_data_directory(Constants.SIMULATED_FRAMES_DIRECTORY), ""
         command_with_return = "var path=ccdsoftCamera.AutoSavePath;" \
                               + "var Out;" \
                               + "Out=path+\"\\n\";"
         (success, path_result, message) = self.send_command_with_return(command_with_return)
+        if success:
+            self._autosave_path = path_result.strip()
         return success, path_result, message
 
     # Tell TheSkyX to connect to the camera
@@ -186,6 +220,59 @@ class TheSkyX:
 
         return command_success, is_complete, message
 
+    # Ask if the image is complete and, in the same command, read the camera's (and optionally
+    # the mount's) telemetry, so a telemetry sample costs no extra round trip to the server.
+    # Each reading is guarded, so one the server can't supply (no filter wheel, say) comes
+    # back empty instead of failing the poll.
+    # Return success, is-complete, the telemetry sample (None if it couldn't be read), message
+
+    def get_exposure_is_complete_with_telemetry(self, include_mount: bool) \
+            -> (bool, bool, Optional[TelemetrySample], str):
+        """Ask camera if image acquisition is complete, and collect telemetry at the same time"""
+        readings = [("temp", "ccdsoftCamera.Temperature"),
+                    ("power", "ccdsoftCamera.ThermalElectricCoolerPower"),
+                    ("filter", "ccdsoftCamera.FilterIndexZeroBased")]
+        command = "var complete = ccdsoftCamera.IsExposureComplete;"
+        if include_mount:
+            command += "var alt=\"\";var az=\"\";" \
+                       + "try {sky6RASCOMTele.GetAzAlt();alt=sky6RASCOMTele.dAlt;az=sky6RASCOMTele.dAz;} catch (e) {}"
+            readings += [("alt", None), ("az", None)]
+        for (name, expression) in readings:
+            if expression is not None:
+                command += f"var {name}=\"\";try {{{name}={expression};}} catch (e) {{}}"
+        command += "var Out=complete+\"/\"+" + "+\"/\"+".join(name for (name, _) in readings) + "+\"\\n\";"
+        sample_time = monotonic()
+        (command_success, result, message) = self.send_command_with_return(command)
+        sample: Optional[TelemetrySample] = None
+        is_complete = False
+        if command_success:
+            parts = result.split("/")
+            if parts[0] == "0" or parts[0] == "1":
+                is_complete = parts[0] == "1"
+                values = dict(zip((name for (name, _) in readings), parts[1:]))
+                filter_index = self.parse_telemetry_value(values.get("filter"))
+                sample = TelemetrySample(sample_time,
+                                         temperature=self.parse_telemetry_value(values.get("temp")),
+                                         cooler_power=self.parse_telemetry_value(values.get("power")),
+                                         filter_index=None if filter_index is None else int(filter_index),
+                                         alt=self.parse_telemetry_value(values.get("alt")),
+                                         az=self.parse_telemetry_value(values.get("az")))
+            else:
+                # As above: something has gone wrong, the result is an explanation
+                command_success = False
+                message = result.split("|")[0]
+                is_complete = True
+        return command_success, is_complete, sample, message
+
+    @staticmethod
+    def parse_telemetry_value(value: Optional[str]) -> Optional[float]:
+        """Convert a telemetry reading to a number; None if it is missing or not a number"""
+        try:
+            number = float(value)
+            return None if math.isnan(number) else number
+        except (TypeError, ValueError):
+            return None
+
     # Send Abort to camera to stop the image in progress
     def abort_image(self) -> (bool, str):
         """Tell camera to abort image acquisition in progress"""
@@ -224,7 +311,8 @@ class TheSkyX:
         message = ""
         address_tuple = (self._server_address, self._port_number)
         TheSkyX._server_mutex.lock()
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as the_socket:
+        with SpanTracer.span("TheSkyX round trip", "server", command=command_packet), \
+                socket.socket(socket.AF_INET, socket.SOCK_STREAM) as the_socket:
             try:
                 the_socket.connect(address_tuple)
                 bytes_to_send = bytes(command_packet, 'utf-8')
@@ -285,6 +373,7 @@ class TheSkyX:
         if self.flat_frame_calculate_simulation:
             success = True
             self.remember_average_adus = self.calc_simulated_adus(exposure=exposure_length, binning=binning)
+            self.make_synthetic_frame(exposure_length, binning)
             sleep(self.flat_frame_simulation_delay)
         else:
             # Have camera start to acquire an image
@@ -303,32 +392,61 @@ class TheSkyX:
 
         return success, message
 
-    def get_adus_from_last_image(self) -> (bool, float, str):
-        """ Get the ADU average of the just-acquired image"""
+    # Get a set of statistics for the just-acquired image, all in one round trip to the server.
+    # The mean is TheSkyX's own average of every pixel.  The others come from a single scan
+    # over a sample of the image (every n'th pixel of every n'th row): a histogram for the median,
+    # running sums for the standard deviation, extremes, and the count of saturated pixels.
+    # Returned from the server as "mean|median|sd|min|max|saturated-fraction".
+    # Return success, statistics, error message
+
+    def get_statistics_from_last_image(self) -> (bool, FrameStatistics, str):
+        """Get the mean, median, spread, extremes and saturation of the just-acquired image"""
         message: str = ""
-        average_adus = 100
+        statistics = FrameStatistics.from_mean(100)
         if self.flat_frame_calculate_simulation:
             success = True
-            average_adus = self.remember_average_adus
+            statistics = self.synthetic_frame_statistics()
         else:
-            # Get active image and ask for its average pixel value
             command = "ccdsoftCameraImage.AttachToActive();" \
-                      + "var averageAdu = ccdsoftCameraImage.averagePixelValue();" \
-                      + "var Out;" \
-                      + "Out=averageAdu+\"\\n\";"
+                      + "var img=ccdsoftCameraImage;" \
+                      + "var mean=img.averagePixelValue();" \
+                      + "var width=img.WidthInPixels;" \
+                      + "var height=img.HeightInPixels;" \
+                      + f"var stride={Constants.FRAME_STATISTICS_SAMPLE_STRIDE};" \
+                      + f"var saturated={Constants.SATURATED_ADU_LEVEL};" \
+                      + "var histogram=new Array(65536);" \
+                      + "for(var i=0;i<65536;i++){histogram[i]=0;}" \
+                      + "var count=0;var sum=0;var sumSquares=0;" \
+                      + "var minimum=65535;var maximum=0;var saturatedCount=0;" \
+                      + "for(var y=0;y<height;y+=stride){" \
+                      + "var row=img.scanLine(y);" \
+                      + "for(var x=0;x<width;x+=stride){" \
+                      + "var value=row[x];" \
+                      + "count++;sum+=value;sumSquares+=value*value;" \
+                      + "if(value<minimum){minimum=value;}" \
+                      + "if(value>maximum){maximum=value;}" \
+                      + "if(value>=saturated){saturatedCount++;}" \
+                      + "histogram[Math.max(0,Math.min(65535,Math.floor(value)))]++;}}" \
+                      + "var half=count/2;var median=0;var cumulative=0;" \
+                      + "while(median<65535&&cumulative+histogram[median]<half)" \
+                      + "{cumulative+=histogram[median];median++;}" \
+                      + "var sampleMean=sum/count;" \
+                      + "var sd=Math.sqrt(Math.max(0,sumSquares/count-sampleMean*sampleMean));" \
+                      + "var Out=mean+'|'+median+'|'+sd+'|'+minimum+'|'+maximum+'|'+(saturatedCount/count);" \
+                      + "Out+=\"\\n\";"
             (success, command_returned_value, message) = self.send_command_with_return(command)
-            # print(f"ADU query returned: {command_returned_value}, {command_returned_value}, {message}")
             if success:
                 (success, message) = self.check_for_error_in_return_value(command_returned_value)
                 if success:
-                    # Returned value should be the number we want.  Convert it carefully
+                    parts = command_returned_value.split("|")
                     try:
-                        average_adus = float(command_returned_value)
+                        if len(parts) != 6:
+                            raise ValueError
+                        statistics = FrameStatistics(*[float(part) for part in parts])
                     except ValueError:
                         success = False
-                        average_adus = 0
-                        message = f"Invalid ADU value \"{command_returned_value}\" from camera"
-        return success, average_adus, message
+                        message = f"Invalid image statistics \"{command_returned_value}\" from camera"
+        return success, statistics, message
 
     # Save the just-acquired frame to the folder set up in TheSkyX's AutoSave path
 
@@ -339,6 +457,9 @@ class TheSkyX:
                                         sequence: int) -> (bool, str):
         """Ask TheSkyX to save the last acquired image to the defined file location"""
         file_name = self.generate_save_file_name(filter_name, exposure, binning, sequence)
+        if self.flat_frame_calculate_simulation:
+            directory = SharedUtils.app_data_directory(Constants.SIMULATED_FRAMES_DIRECTORY)
+            return self.save_acquired_frame_to_path(os.path.join(directory, file_name))
         command = "cam = ccdsoftCamera;" \
                   + "img = ccdsoftCameraImage;" \
                   + "img.AttachToActiveImager();" \
@@ -349,10 +470,17 @@ class TheSkyX:
         (success, returned_value, message) = self.send_command_with_return(command)
         if success:
             (success, message) = self.check_for_error_in_return_value(returned_value)
-        if not success:
+        if success:
+            self._last_saved_path = file_name if self._autosave_path is None \
+                else f"{self._autosave_path}/{file_name}"
+        else:
             print(f"Unable to save file {file_name}: {returned_value}")
         return success, message
 
+    def get_last_saved_path(self) -> Optional[str]:
+        """Where the last frame saved went"""
+        return self._last_saved_path
+
     # Since TheSkyX is running on this computer, we can give it a path name that
     # we have acquired here. Save the just-acquired frame there.
 
@@ -363,7 +491,15 @@ class TheSkyX:
                                                binning: int,
                                                sequence: int) -> (bool, str):
         file_name = self.generate_save_file_name(filter_name, exposure, binning, sequence)
-        full_path = f"{directory_path}/{file_name}"
+        return self.save_acquired_frame_to_path(f"{directory_path}/{file_name}")
+
+    # Save the just-acquired frame to the given full path name, on the TheSkyX computer
+
+    def save_acquired_frame_to_path(self, full_path: str) -> (bool, str):
+        """Ask TheSkyX to save the last acquired image to the given file"""
+        self._last_saved_path = full_path
+        if self.flat_frame_calculate_simulation:
+            return self.save_synthetic_frame(full_path)
         command = "cam = ccdsoftCamera;" \
                   + "img = ccdsoftCameraImage;" \
                   + "img.AttachToActiveImager();" \
@@ -374,7 +510,7 @@ class TheSkyX:
         if success:
             (success, message) = self.check_for_error_in_return_value(returned_value)
         if not success:
-            print(f"Unable to save file {file_name}: {returned_value}")
+            print(f"Unable to save file {full_path}: {returned_value}")
         return success, message
 
     #
@@ -472,6 +608,43 @@ class TheSkyX:
         clipped_at_16_bits = min(noisy_result, 65535)
         return clipped_at_16_bits
 
+    # When simulating, in addition to the average level we make a whole synthetic frame with
+    # that average, so frames can be saved and processed just as real ones would be.
+
+    def make_synthetic_frame(self, exposure: float, binning: int):
+        """Generate the simulated frame for the simulated exposure just taken"""
+        if binning not in self._synthetic_frame_generators:
+            self._synthetic_frame_generators[binning] = \
+                SyntheticFrameGenerator(Constants.SIMULATED_SENSOR_WIDTH // binning,
+                                        Constants.SIMULATED_SENSOR_HEIGHT // binning)
+        self._last_synthetic_frame = self._synthetic_frame_generators[binning].frame(self.remember_average_adus)
+        self._last_synthetic_frame_header = {"IMAGETYP": "Flat Field",
+                                             "EXPTIME": float(exposure),
+                                             "XBINNING": binning,
+                                             "YBINNING": binning,
+                                             "DATE-OBS": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+                                             "INSTRUME": "Simulated camera"}
+
+    def synthetic_frame_statistics(self) -> FrameStatistics:
+        """Statistics of the last simulated frame, as the server would report them"""
+        frame = self._last_synthetic_frame
+        if frame is None:
+            return FrameStatistics.from_mean(self.remember_average_adus)
+        return FrameStatistics(float(frame.mean()), float(numpy.median(frame)), float(frame.std()),
+                               float(frame.min()), float(frame.max()),
+                               float(numpy.count_nonzero(frame >= Constants.SATURATED_ADU_LEVEL)) / frame.size)
+
+    def save_synthetic_frame(self, full_path: str) -> (bool, str):
+        """Write the last simulated frame as a FITS file"""
+        if self._last_synthetic_frame is None:
+            return False, "No simulated frame to save"
+        try:
+            SyntheticFrameGenerator.write_frame(full_path, self._last_synthetic_frame,
+                                                self._last_synthetic_frame_header)
+            return True, ""
+        except OSError as exception:
+            return False, f"Unable to save simulated frame {full_path}: {exception}"
+
     # Get the current position, in alt-az coordinates, of the telescope.
     # This will require connecting the scope, then asking for the position.
     # Both might fail, check for that.
@@ -496,6 +669,7 @@ class TheSkyX:
                     try:
                         return_alt = float(parts[0])
                         return_az = float(parts[1])
+                        self._last_alt_az = (return_alt, return_az)
                     except ValueError:
                         message = "Bad response"
                         success = False
@@ -517,9 +691,12 @@ class TheSkyX:
     # at a fixed location in the observatory and doesn't move with the sky
     # Slewing is asynchronous. This just starts the slew - must poll for completion
     # doing a slew turns tracking on.  We'll restore it to previous state in case it was off
+    # If a slew-time model is attached, the slew is timed: synchronous slews here, asynchronous
+    # ones when slew_is_complete sees them finish.
 
     def start_slew_to(self, alt: float, az: float, asynchronous: bool) -> (bool, str):
         # print(f"start_slew_to({alt},{az})")
+        self._slew_distance_deg = self.distance_to_slew(alt, az)
         command_line = "sky6RASCOMTele.Connect();" \
                        + f"sky6RASCOMTele.Asynchronous={self.js_bool(asynchronous)};" \
                        + "var wasTracking=sky6RASCOMTele.IsTracking;" \
@@ -528,12 +705,49 @@ class TheSkyX:
                        + f"Out=sky6RASCOMTele.SlewToAzAlt({az},{alt},'');" \
                        + f"sky6RASCOMTele.SetTracking(wasTracking,1,oldRaRate,oldDecRate);" \
                        + "Out += \"\\n\";"
+        self._slew_started_at = monotonic()
         (success, returned_value, message) = self.send_command_with_return(command_line)
         if success:
             (success, message) = self.check_for_error_in_return_value(returned_value)
             self.fake_slew_timer = 0
+        if success:
+            self._last_alt_az = (alt, az)
+            if not asynchronous:
+                self.record_slew_finished()
+        else:
+            self._last_alt_az = None
+            self._slew_started_at = None
         return success, message
 
+    # Angular distance, in degrees, from where the mount is to the given position, if we know
+    # where the mount is.  If we're timing slews and don't know, ask the mount (once).
+
+    def distance_to_slew(self, alt: float, az: float) -> Optional[float]:
+        """Angular distance in degrees from the mount's last known position to the given one"""
+        if self._slew_time_model is None:
+            return None
+        if self._last_alt_az is None:
+            self.get_scope_alt_az()
+        if self._last_alt_az is None:
+            return None
+        (from_alt, from_az) = self._last_alt_az
+        return math.degrees(SkyGeometry.angular_separation(from_alt, from_az, alt, az))
+
+    # The slew we timed has finished.  Report it to the slew-time model.
+
+    def record_slew_finished(self):
+        """Record the just-completed slew in the slew-time model"""
+        if self._slew_time_model is not None and self._slew_started_at is not None \
+                and self._slew_distance_deg is not None:
+            self._slew_time_model.record(self._slew_distance_deg, monotonic() - self._slew_started_at)
+        self._slew_started_at = None
+
+    def predicted_slew_seconds(self) -> Optional[float]:
+        """Time the slew-time model expects the slew in progress to take, if known"""
+        if self._slew_time_model is None or self._slew_distance_deg is None:
+            return None
+        return float(self._slew_time_model.predict_seconds(self._slew_distance_deg))
+
     simulate_slew = False
     fake_slew_timer = 0
     fake_slew_time_taken = 10
@@ -562,11 +776,15 @@ class TheSkyX:
                 if success:
                     result_as_int = int(returned_value)
                     is_complete = result_as_int != 0
+        if success and is_complete and not self.simulate_slew:
+            self.record_slew_finished()
         return success, is_complete
 
     # Abort the slew that is in progress
     def abort_slew(self) -> (bool, str):
         """Abort the slew that is asynchronously underway"""
+        self._slew_started_at = None
+        self._last_alt_az = None
         command_line = f"Out=sky6RASCOMTele.Abort();" \
                        + "Out += \"\\n\";"
         (success, returned_value, message) = self.send_command_with_return(command_line)
@@ -589,6 +807,7 @@ class TheSkyX:
     # Park the mount (wait for it synchronously) and disconnect
     def park_and_disconnect_mount(self) -> (bool, str):
         """Park and disconnect the mount"""
+        self._last_alt_az = None
         command_line = "sky6RASCOMTele.Connect();"\
                        + "sky6RASCOMTele.Asynchronous=false;" \
                        + "Out=sky6RASCOMTele.Park();" \
@@ -601,6 +820,7 @@ class TheSkyX:
     # Send mount to home position
     def home_mount(self, asynchronous: bool) -> (bool, str):
         """Send mount to home position"""
+        self._last_alt_az = None
         command_line = "sky6RASCOMTele.Connect();"\
                        + f"sky6RASCOMTele.Asynchronous={self.js_bool(asynchronous)};" \
                        + "Out=sky6RASCOMTele.FindHome();" \
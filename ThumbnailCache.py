@@ -0,0 +1,145 @@
+#
+#   Small preview images of saved frames, for a quick visual check for dust donuts and gradients
+#   while the session runs.
+#
+#   A thumbnail is made by averaging square blocks of pixels.  The frame is memory-mapped and
+#   viewed, with numpy stride tricks, as a grid of blocks without copying it; the blocks are
+#   averaged a band at a time, so the frame is read once and never converted as a whole.
+#   The result is stretched to 8 bits around the frame's own range, since a flat has very
+#   little contrast.
+#
+#   Thumbnails are cached on disk, keyed by the frame's path, and the least recently used are
+#   removed when the cache gets too big.  The frame's modification time and size are stored
+#   with its thumbnail, so a changed frame gets a new one; a cached thumbnail stays usable
+#   after its frame has been moved away or compressed.  The session makes each thumbnail as
+#   the frame is saved; the console fetches it with ThumbnailTask, on Qt's thread pool, which
+#   hands the image back through a signal so the UI thread does no file work.
+#
+import hashlib
+import os
+from typing import Optional
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from Constants import Constants
+from FitsFile import FitsFile
+
+
+class ThumbnailCache:
+
+    def __init__(self, cache_directory: str):
+        self._cache_directory: str = cache_directory
+
+    # Get the thumbnail of a frame, from the cache or by making it.  Returns 8-bit grey levels.
+
+    def thumbnail(self, path: str) -> numpy.ndarray:
+        """Get an 8-bit thumbnail image of the FITS frame in the given file"""
+        cache_path = self.cache_path(path)
+        version = self.file_version(path)
+        if os.path.exists(cache_path):
+            try:
+                with numpy.load(cache_path) as cached:
+                    if version is None or tuple(cached["version"]) == version:
+                        image = cached["image"]
+                        os.utime(cache_path)  # Mark as recently used
+                        return image
+            except (OSError, ValueError, KeyError):
+                pass
+        image = self.make_thumbnail(FitsFile(path))
+        try:
+            temporary_path = cache_path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                numpy.savez(file, image=image, version=numpy.array(version, dtype=numpy.int64))
+            os.replace(temporary_path, cache_path)
+            self.prune()
+        except OSError as exception:
+            print(f"Unable to cache thumbnail for {path}: {exception}")
+        return image
+
+    def cache_path(self, path: str) -> str:
+        """Name of the cache file for the given frame file"""
+        key = os.path.abspath(path).encode("utf-8")
+        return os.path.join(self._cache_directory, hashlib.sha1(key).hexdigest() + ".npz")
+
+    @staticmethod
+    def file_version(path: str) -> Optional[tuple]:
+        """Modification time and size of a frame file, or None if it isn't there"""
+        try:
+            status = os.stat(path)
+            return status.st_mtime_ns, status.st_size
+        except OSError:
+            return None
+
+    # Remove the least recently used thumbnails beyond the cache size limit
+
+    def prune(self):
+        entries = [entry for entry in os.scandir(self._cache_directory) if entry.name.endswith(".npz")]
+        if len(entries) > Constants.THUMBNAIL_CACHE_ENTRIES:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - Constants.THUMBNAIL_CACHE_ENTRIES]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    # Block-average the frame down to thumbnail size, and stretch it to 8 bits
+
+    @staticmethod
+    def make_thumbnail(fits_file: FitsFile) -> numpy.ndarray:
+        """Make an 8-bit thumbnail by averaging blocks of the frame's pixels"""
+        raw = fits_file.get_raw_data()
+        (height, width) = raw.shape
+        block = max(1, -(-max(height, width) // Constants.THUMBNAIL_SIZE))
+        rows = height // block
+        columns = width // block
+        # View of the frame as (thumbnail row, thumbnail column, row in block, column in block)
+        (row_stride, column_stride) = raw.strides
+        blocks = as_strided(raw, shape=(rows, columns, block, block),
+                            strides=(row_stride * block, column_stride * block, row_stride, column_stride),
+                            writeable=False)
+        averages = numpy.empty((rows, columns), dtype=numpy.float32)
+        band = max(1, Constants.LOCAL_ANALYSIS_BAND_ROWS // block)
+        for start in range(0, rows, band):
+            averages[start:start + band] = blocks[start:start + band].mean(axis=(2, 3), dtype=numpy.float64)
+        header = fits_file.get_header()
+        averages = averages * float(header.get("BSCALE", 1.0)) + float(header.get("BZERO", 0.0))
+
+        (low, high) = numpy.percentile(averages, [Constants.THUMBNAIL_STRETCH_PERCENTILE,
+                                                  100.0 - Constants.THUMBNAIL_STRETCH_PERCENTILE])
+        scale = 255.0 / (high - low) if high > low else 0.0
+        return numpy.clip((averages - low) * scale, 0, 255).astype(numpy.uint8)
+
+    @staticmethod
+    def to_qimage(image: numpy.ndarray) -> QImage:
+        """Convert an 8-bit thumbnail to a QImage"""
+        contiguous = numpy.ascontiguousarray(image)
+        (height, width) = contiguous.shape
+        return QImage(contiguous.data, width, height, width, QImage.Format_Grayscale8).copy()
+
+
+# Signals can only come from a QObject, which QRunnable isn't, so the task carries one of these
+
+class ThumbnailSignals(QObject):
+    ready = pyqtSignal(str, QImage)  # Frame path, its thumbnail
+
+
+class ThumbnailTask(QRunnable):
+
+    def __init__(self, cache: ThumbnailCache, path: str):
+        QRunnable.__init__(self)
+        self._cache = cache
+        self._path = path
+        self.signals = ThumbnailSignals()
+
+    def run(self):
+        """Make (or fetch) the thumbnail and send it to whoever is waiting"""
+        image: Optional[QImage] = None
+        try:
+            image = ThumbnailCache.to_qimage(self._cache.thumbnail(self._path))
+        except (OSError, ValueError) as exception:
+            print(f"Unable to make thumbnail for {self._path}: {exception}")
+        if image is not None:
+            self.signals.ready.emit(self._path, image)
@@ -1,5 +1,8 @@
 # A work item is one set of flat frames with identical characteristics
 # e.g. "16 flat frames with filter number 2, binned 1x1, target adu 25000 within 10%"
+from typing import Optional
+
+from ExposureHistory import ExposureHistory
 from FilterSpec import FilterSpec
 from Preferences import Preferences
 
@@ -40,9 +43,18 @@ class WorkItem:
         fs: FilterSpec = self._filter_spec
         return f"{fs.get_slot_number()}: {fs.get_name()}"
 
-    def initial_exposure_estimate(self) -> float:
-        exposure = self._preferences.get_initial_exposure(filter_slot=self.get_filter_spec().get_slot_number(),
-                                                          binning=self.get_binning())
+    # Starting exposure: from the history of measured frames if there is one, otherwise the
+    # last exposure remembered in the preferences
+
+    def initial_exposure_estimate(self, exposure_history: Optional[ExposureHistory] = None) -> float:
+        exposure = None
+        if exposure_history is not None:
+            exposure = exposure_history.best_starting_exposure(filter_slot=self.get_filter_spec().get_slot_number(),
+                                                               binning=self.get_binning(),
+                                                               target_adus=self.get_target_adu())
+        if exposure is None:
+            exposure = self._preferences.get_initial_exposure(filter_slot=self.get_filter_spec().get_slot_number(),
+                                                              binning=self.get_binning())
         return exposure
 
     def update_initial_exposure_estimate(self, new_exposure: float):
@@ -0,0 +1,77 @@
+#
+#   The time accounting of one work item, for the session's overhead report (see OverheadReport):
+#   the wall time it took, the shutter time of the frames kept, and the seconds spent in each
+#   category of overhead.
+#
+from time import perf_counter
+from typing import Optional
+
+DOWNLOAD = "download"
+ADU_QUERY = "ADU query"
+SAVE = "save"
+DITHER = "dither slew"
+FILTER_CHANGE = "filter change"
+REJECTED = "rejected frames"
+OTHER = "other"
+CATEGORIES = (DOWNLOAD, ADU_QUERY, SAVE, DITHER, FILTER_CHANGE, REJECTED, OTHER)
+# Download time is set by the camera and its connection, and "other" is a catch-all nothing in
+# particular can be done about; the rest can be reduced
+AVOIDABLE = (ADU_QUERY, SAVE, DITHER, FILTER_CHANGE, REJECTED)
+
+
+class WorkItemOverhead:
+    """The time accounting of one work item"""
+
+    def __init__(self, title: str):
+        self._title: str = title
+        self._started: float = perf_counter()
+        self._wall_time: Optional[float] = None
+        self._shutter: float = 0.0
+        self._frames_kept: int = 0
+        self._frames_rejected: int = 0
+        self._seconds: {str: float} = {category: 0.0 for category in CATEGORIES}
+
+    def get_title(self) -> str:
+        return self._title
+
+    def get_shutter(self) -> float:
+        return self._shutter
+
+    def get_frames_kept(self) -> int:
+        return self._frames_kept
+
+    def get_frames_rejected(self) -> int:
+        return self._frames_rejected
+
+    def get_wall_time(self) -> float:
+        return self._wall_time if self._wall_time is not None else perf_counter() - self._started
+
+    def add(self, category: str, seconds: float):
+        self._seconds[category] += seconds
+
+    # A frame was kept.  Its download is all the time from the end of the exposure to the camera
+    # reporting the frame complete: the wait for the estimated download, then the polling.  The
+    # camera is only asked every CAMERA_RESYNCH_CHECK_INTERVAL, so the polling can't tell the end
+    # of the download from the moment we noticed it, and it all counts as download.
+
+    def frame_kept(self, exposure: float, frame_phases: {str: float}):
+        self._frames_kept += 1
+        self._shutter += exposure
+        self._seconds[DOWNLOAD] += max(0.0, frame_phases.get("wait", 0.0) + frame_phases.get("resync", 0.0)
+                                       - exposure)
+        self._seconds[ADU_QUERY] += frame_phases.get("ADU query", 0.0)
+
+    def frame_rejected(self, frame_phases: {str: float}):
+        self._frames_rejected += 1
+        self._seconds[REJECTED] += sum(frame_phases.values())
+
+    def finish(self):
+        self._wall_time = perf_counter() - self._started
+
+    # Seconds in each category, "other" being the wall time not otherwise accounted for
+
+    def get_seconds(self) -> {str: float}:
+        seconds = dict(self._seconds)
+        accounted = self._shutter + sum(value for (category, value) in seconds.items() if category != OTHER)
+        seconds[OTHER] += max(0.0, self.get_wall_time() - accounted)
+        return seconds
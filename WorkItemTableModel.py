@@ -1,8 +1,8 @@
 from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QVariant
-from PyQt5.QtGui import QFont
 
 from DataModel import DataModel
 from Preferences import Preferences
+from TableStyleCache import TableStyleCache
 from WorkItem import WorkItem
 
 
@@ -48,11 +48,8 @@ class WorkItemTableModel(QAbstractTableModel):
                 assert column_index == WorkItemTableModel.COMPLETED_ITEM_INDEX
                 return str(work_item.get_num_completed())
         elif role == Qt.FontRole:
-            # Font information for the headers above the top row
-            standard_font_size = self._preferences.get_standard_font_size()
-            font = QFont()
-            font.setPointSize(standard_font_size)
-            result = font
+            # Font information for the data in this cell
+            result = TableStyleCache.cell_font(self._preferences)
         else:
             result = QVariant()
         return result
@@ -65,11 +62,7 @@ class WorkItemTableModel(QAbstractTableModel):
             result = WorkItemTableModel.HEADINGS[item_number]
         elif (role == Qt.FontRole) and (orientation == Qt.Horizontal):
             # Font information for the headers above the top row
-            standard_font_size = self._preferences.get_standard_font_size()
-            font = QFont()
-            font.setPointSize(standard_font_size)
-            font.setBold(True)
-            result = font
+            result = TableStyleCache.header_font(self._preferences)
         return result
 
         # self._work_items_table_model.set_frames_complete(row_index, frames_complete)
@@ -0,0 +1,40 @@
+#
+#   Compile the program's Qt Designer (.ui) files to Python modules, so the windows can be
+#   built at startup without parsing the XML.  Run this as part of a build, before packaging:
+#       python compile_ui.py
+#   Each X.ui becomes X_ui.py, holding the generated form class plus the names of the form
+#   class and of the Qt widget class the form is built on, for SharedUtils.load_ui.
+#   The generated modules are not kept in the repository; without them, or if a .ui file is
+#   newer than its module, load_ui falls back to reading the .ui file.
+#
+import os
+import sys
+import xml.etree.ElementTree as ElementTree
+
+from PyQt5 import uic
+
+UI_FILES = ("MainWindow.ui", "PrefsWindow.ui", "SessionConsole.ui")
+
+
+def compile_ui_file(ui_path: str) -> str:
+    """Compile one .ui file to a Python module beside it; return the module's path"""
+    module_path = os.path.splitext(ui_path)[0] + "_ui.py"
+    top_widget = ElementTree.parse(ui_path).getroot().find("widget")
+    base_class = top_widget.get("class")
+    form_class = "Ui_" + top_widget.get("name")
+    with open(module_path, "w", encoding="utf-8") as module_file:
+        uic.compileUi(ui_path, module_file)
+        module_file.write(f"\n\nUI_CLASS = {form_class}\nBASE_CLASS = \"{base_class}\"\n")
+    return module_path
+
+
+def main(arguments: [str]) -> int:
+    directory = os.path.dirname(os.path.realpath(__file__))
+    for ui_file in arguments or UI_FILES:
+        module_path = compile_ui_file(os.path.join(directory, ui_file))
+        print(f"{ui_file} -> {os.path.basename(module_path)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
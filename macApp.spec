@@ -4,12 +4,19 @@
 
 block_cipher = None
 
+# Compile the .ui files to Python modules first (see compile_ui.py), so the packaged program
+# builds its windows without parsing the XML.  They are bundled through hiddenimports below.
+import os
+import subprocess
+import sys
+subprocess.check_call([sys.executable, os.path.join(SPECPATH, 'compile_ui.py')])
+
 
 a = Analysis(['FlatCaptureNow1.py'],
              pathex=['/Users/richard/DropBox/dropbox/EWHO/Application Development/FlatCaptureNow1'],
              binaries=[],
              datas=[('MainWindow.ui', '.'), ('PrefsWindow.ui', '.'), ('SessionConsole.ui', './')],
-             hiddenimports=[],
+             hiddenimports=['MainWindow_ui', 'PrefsWindow_ui', 'SessionConsole_ui'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],